@@ -1,12 +1,29 @@
-from fastapi import FastAPI, File, Form, UploadFile
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import whisper
-from gtts import gTTS
-import uuid
-import os
+from contextlib import asynccontextmanager
+import json
 
-app = FastAPI()
+from transcriber import AudioDecodeError, TranscriptionEngine
+from streaming_stt import StreamingTranscription
+from synthesis import ENGINES, audio_cache, synthesize_stream
+
+# Whisper runs in its own worker processes (see transcriber.py)
+engine = TranscriptionEngine.from_env()
+
+# Highest PCM sample rate /transcribe/stream accepts
+MAX_SAMPLE_RATE = 192000
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start loading Whisper as WHISPER_WARMUP says (see transcriber.py), stop the workers on shutdown."""
+    await engine.start()
+    yield
+    await engine.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -17,43 +34,105 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Loading Whisper model once during startup
-model = whisper.load_model("small")
-
-# directory to store files
-if not os.path.exists("tmp"):
-    os.makedirs("tmp")
-
 @app.post("/transcribe")
 async def transcribe_file(file: UploadFile = File(...)):
     """Transcribes an uploaded audio file to text."""
-    file_location = f"tmp/{uuid.uuid4()}.wav"
+    try:
+        text = await engine.transcribe(await file.read())
+    except AudioDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    with open(file_location, "wb") as f:
-        f.write(await file.read())
+    return {"transcribed_text": text}
 
-    result = model.transcribe(file_location)
-    text = result["text"]
+@app.websocket("/transcribe/stream")
+async def transcribe_stream(websocket: WebSocket, sample_rate: int = 16000, forward: bool = False):
+    """Streams partial and final transcripts for raw 16-bit mono PCM sent in binary frames.
 
-    os.remove(file_location)
+    Send {"type": "end"} as a text frame to close the current utterance. With
+    ?forward=true final text is also sent to the chatbot's /chat websocket and
+    its replies come back as {"type": "chat"} frames.
+    """
+    await websocket.accept()
+    if not 0 < sample_rate <= MAX_SAMPLE_RATE:
+        await websocket.send_json(
+            {"type": "error", "text": f"sample_rate must be between 1 and {MAX_SAMPLE_RATE} Hz"}
+        )
+        await websocket.close(code=1003)
+        return
+    stream = StreamingTranscription(engine, websocket.send_json, sample_rate, forward)
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                await stream.feed(message["bytes"])
+            elif message.get("text"):
+                try:
+                    control = json.loads(message["text"])
+                except ValueError:
+                    control = None
+                if not isinstance(control, dict):
+                    await websocket.send_json(
+                        {"type": "error", "text": 'Text frames must be JSON objects such as {"type": "end"}'}
+                    )
+                elif control.get("type") == "end":
+                    await stream.finish()
+                    await websocket.send_json({"type": "end"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await stream.close()
 
-    return {"transcribed_text": text}
+@app.get("/transcribe/stats")
+async def transcribe_stats():
+    """Queue depth, batching and latency of the transcription workers."""
+    return engine.stats()
 
 @app.post("/tts")
-async def text_to_speech(text: str = Form(...)):
-    """Converts text to speech using Google TTS."""
-    file_location = f"tmp/{uuid.uuid4()}.mp3"
-    
-    tts = gTTS(text=text, lang='en')
-    tts.save(file_location)
-    
-    response = FileResponse(
-        file_location,
+async def text_to_speech(text: str = Form(...), lang: str = Form("en"),
+                         voice_engine: str = Form(None, alias="engine")):
+    """Converts text to speech sentence by sentence, streaming cached or fresh audio.
+
+    The ``engine`` form field picks the synthesis engine; it is bound to
+    ``voice_engine`` so it doesn't shadow the Whisper ``engine`` above.
+    """
+    chunks = synthesize_stream(text, lang, voice_engine)
+
+    # Synthesize the first sentence before responding so engine errors become
+    # an HTTP error instead of a truncated stream
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = b""
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Speech synthesis failed: {e}")
+
+    async def audio():
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+    return StreamingResponse(
+        audio(),
         media_type="audio/mpeg",
-        filename="speech.mp3"
+        headers={"Content-Disposition": 'attachment; filename="speech.mp3"'},
     )
-    
-    # Clean up the file after sending
-    response.background = lambda: os.remove(file_location)
-    
-    return response
+
+@app.get("/tts/stats")
+async def tts_stats():
+    """Hit rate and size of the TTS audio cache."""
+    return audio_cache.stats()
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 503 while the Whisper model is still loading (unless it loads lazily)."""
+    engines = {
+        "whisper": engine.readiness(),
+        # Synthesis engines import their libraries on first use
+        "tts": {"state": "ready", "ready": True, "engines": sorted(ENGINES)},
+    }
+    ok = all(status["ready"] for status in engines.values())
+    return JSONResponse({"ready": ok, "engines": engines}, status_code=200 if ok else 503)
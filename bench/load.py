@@ -0,0 +1,158 @@
+"""Load drivers: concurrent /chat websocket clients and HTTP upload clients.
+
+Every request becomes a sample dict ``{"kind", "latency", "first", "error"}``
+with times in seconds; ``first`` is the time to the first answer token
+(streamed chat) or first response byte (HTTP), when there is one.
+"""
+
+import asyncio
+import io
+import json
+import math
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+import wave
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _sample(kind, start, first=None, error=None):
+    return {
+        "kind": kind,
+        "latency": time.perf_counter() - start,
+        "first": first,
+        "error": error,
+    }
+
+
+async def _chat_turn(ws, question, stream, timeout):
+    start = time.perf_counter()
+    first = None
+    await ws.send(json.dumps({"message": question, "stream": stream}))
+    deadline = start + timeout
+    while True:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return _sample("chat", start, first, "timeout")
+        try:
+            frame = json.loads(await asyncio.wait_for(ws.recv(), remaining))
+        except asyncio.TimeoutError:
+            return _sample("chat", start, first, "timeout")
+        if not stream:
+            # One AgentResponse per message; its status is "busy" or "error" if unanswered
+            status = frame.get("status", "ok")
+            return _sample("chat", start, error=None if status == "ok" else status)
+        if frame.get("type") == "token" and first is None:
+            first = time.perf_counter() - start
+        elif frame.get("type") in ("busy", "error"):
+            return _sample("chat", start, first, frame["type"])
+        elif frame.get("type") == "final":
+            return _sample("chat", start, first)
+
+
+async def chat_client(url, questions, turns, stream=True, offset=0, timeout=120):
+    """One websocket session sending ``turns`` questions, each after the last answer."""
+    import websockets
+
+    samples = []
+    try:
+        async with websockets.connect(url, max_size=None) as ws:
+            for turn in range(turns):
+                question = questions[(offset + turn) % len(questions)]
+                samples.append(await _chat_turn(ws, question, stream, timeout))
+    except Exception as e:
+        start = time.perf_counter()
+        error = f"{type(e).__name__}: {e}"
+        samples += [
+            _sample("chat", start, error=error) for _ in range(turns - len(samples))
+        ]
+    return samples
+
+
+async def run_chat_load(url, questions, clients, turns, stream=True, timeout=120):
+    """``clients`` concurrent chat sessions; returns all samples."""
+    results = await asyncio.gather(
+        *(
+            chat_client(url, questions, turns, stream, offset=i, timeout=timeout)
+            for i in range(clients)
+        )
+    )
+    return [sample for samples in results for sample in samples]
+
+
+def _post(url, body, content_type, timeout):
+    request = urllib.request.Request(
+        url, data=body, headers={"Content-Type": content_type}, method="POST"
+    )
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read(1)
+            first = time.perf_counter() - start
+            response.read()
+        return _sample(None, start, first)
+    except urllib.error.HTTPError as e:
+        return _sample(None, start, error=f"HTTP {e.code}")
+    except Exception as e:
+        return _sample(None, start, error=f"{type(e).__name__}: {e}")
+
+
+async def run_http_load(kind, url, make_body, clients, requests, timeout=120):
+    """``requests`` POSTs to ``url`` from ``clients`` concurrent workers.
+
+    ``make_body(i)`` returns ``(body bytes, content type)`` for request ``i``.
+    """
+    loop = asyncio.get_running_loop()
+    pending = iter(range(requests))
+    samples = []
+
+    with ThreadPoolExecutor(max_workers=max(clients, 1)) as pool:
+
+        async def worker():
+            for i in pending:
+                body, content_type = make_body(i)
+                sample = await loop.run_in_executor(
+                    pool, _post, url, body, content_type, timeout
+                )
+                sample["kind"] = kind
+                samples.append(sample)
+
+        await asyncio.gather(*(worker() for _ in range(clients)))
+    return samples
+
+
+def multipart(field, filename, data, content_type="application/octet-stream"):
+    """A multipart/form-data body holding one file; returns (body, content type)."""
+    boundary = uuid.uuid4().hex
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode()
+    return head + data + f"\r\n--{boundary}--\r\n".encode(), (
+        f"multipart/form-data; boundary={boundary}"
+    )
+
+
+def form(**fields):
+    return urllib.parse.urlencode(fields).encode(), "application/x-www-form-urlencoded"
+
+
+def speech_like_wav(seconds=3.0, sample_rate=16000):
+    """16-bit mono WAV of syllable-like tone bursts, generated without numpy."""
+    samples = array("h")
+    for i in range(int(seconds * sample_rate)):
+        t = i / sample_rate
+        envelope = max(math.sin(2 * math.pi * 3 * t), 0)  # ~3 syllables a second
+        tone = math.sin(2 * math.pi * 180 * t) + 0.5 * math.sin(2 * math.pi * 720 * t)
+        samples.append(int(9000 * envelope * tone))
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.tobytes())
+    return buffer.getvalue()
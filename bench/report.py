@@ -0,0 +1,56 @@
+"""Throughput and latency percentiles from load-driver samples."""
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    rank = max(int(round(p / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def summarize(samples, elapsed):
+    """One row per sample kind: counts, requests/s and latency percentiles in ms."""
+    rows = {}
+    for kind in sorted({sample["kind"] for sample in samples}):
+        mine = [sample for sample in samples if sample["kind"] == kind]
+        ok = sorted(s["latency"] for s in mine if s["error"] is None)
+        first = sorted(s["first"] for s in mine if s["error"] is None and s["first"])
+        errors = {}
+        for sample in mine:
+            if sample["error"] is not None:
+                errors[sample["error"]] = errors.get(sample["error"], 0) + 1
+        rows[kind] = {
+            "requests": len(mine),
+            "errors": sum(errors.values()),
+            "error_kinds": errors,
+            "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else None,
+            **{f"p{p}_ms": _ms(percentile(ok, p)) for p in PERCENTILES},
+            "max_ms": _ms(ok[-1]) if ok else None,
+            "first_p50_ms": _ms(percentile(first, 50)),
+            "first_p95_ms": _ms(percentile(first, 95)),
+        }
+    return rows
+
+
+def format_table(rows, columns):
+    """Plain-text table of ``{name: {column: value}}``."""
+    header = ["", *columns]
+    lines = [header] + [
+        [name, *("-" if row.get(c) is None else str(row.get(c)) for c in columns)]
+        for name, row in rows.items()
+    ]
+    widths = [max(len(line[i]) for line in lines) for i in range(len(header))]
+    return "\n".join(
+        "  ".join(
+            cell.rjust(width) if i else cell.ljust(width)
+            for i, (cell, width) in enumerate(zip(line, widths))
+        )
+        for line in lines
+    )
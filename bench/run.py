@@ -0,0 +1,288 @@
+"""Offline benchmark: seeded data, stub models, concurrent clients, percentiles.
+
+By default everything runs in this process with no network access: the chat
+app (chatbot.main) is served on a local port with ``LLM_BACKEND=stub`` and an
+in-memory mongomock database seeded by bench.seed, then ``--chat-clients``
+websocket sessions each ask ``--turns`` questions. ``--mongo-url`` seeds and
+uses a real local mongod instead (generated code then runs in the executor
+worker pool as in production). ``--stt-clients``/``--tts-clients`` add upload
+load against the TTS.py app; /transcribe needs Whisper weights cached locally
+and /tts uses a stub "bench" engine unless ``--tts-engine`` picks another.
+
+    python -m bench.run --chat-clients 16 --turns 5 --llm-latency-ms 400
+    python -m bench.run --mongo-url mongodb://localhost:27017 --customers 5000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import tempfile
+import time
+import urllib.request
+
+from . import load, report
+from .seed import DATABASE_NAME, seed_database
+
+# Mix of fast-path lookups and full planner/builder/answerer questions
+QUESTIONS = [
+    "How many customers are there?",
+    "List the names and emails of customers",
+    "How many transactions were buys?",
+    "What is the average account limit for each product?",
+    "Compare buy and sell totals by symbol",
+    "Which products do accounts have?",
+    "Show the trend of transactions over time",
+    "How many accounts have a limit of 10000?",
+]
+TTS_TEXTS = [
+    "Your request is being processed.",
+    "There are five hundred customers in the database. Most of them hold two accounts.",
+    "Sorry, I could not find any matching records. Please try rephrasing your question.",
+]
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _serve(app, port):
+    """Run an ASGI app on a local port until the returned server is told to exit."""
+    import uvicorn
+
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+            raise RuntimeError("server exited during startup")
+        await asyncio.sleep(0.05)
+    return server, task
+
+
+def _configure_chat(args, cache_dir):
+    """Environment for an in-process chat app; must run before chatbot.main is imported."""
+    os.environ["LLM_BACKEND"] = "stub"
+    os.environ["STUB_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ.setdefault("SESSION_BACKEND", "memory")
+    # Snapshot files go with the run's other scratch files, not into the cwd
+    os.environ.setdefault("ANALYTICS_DIR", os.path.join(cache_dir, "analytics"))
+    if not args.caches:
+        os.environ["ANSWER_CACHE_SIZE"] = "0"
+        os.environ["PLAN_CACHE_SIZE"] = "0"
+    if args.mongo_url:
+        os.environ["MONGODB_URL"] = args.mongo_url
+        return
+    # mongomock lives in this process only: run generated code inline, and
+    # skip views, which need $merge and change streams
+    os.environ["MONGODB_URL"] = "mongodb://mongomock"
+    os.environ["EXECUTOR_WORKERS"] = "0"
+    os.environ["VIEWS_ENABLED"] = "0"
+
+
+def _seed(args):
+    scale = {
+        "customers": args.customers,
+        "accounts_per_customer": args.accounts_per_customer,
+        "transactions_per_account": args.transactions_per_account,
+        "seed": args.seed,
+    }
+    if args.mongo_url:
+        from pymongo import MongoClient
+
+        client = MongoClient(args.mongo_url)
+    else:
+        import mongomock
+
+        from chatbot import mongo
+
+        client = mongomock.MongoClient()
+        mongo.use_client(client)
+    if args.mongo_url and args.no_seed:
+        return
+    counts = seed_database(client[DATABASE_NAME], **scale)
+    print(f"✅ Seeded {DATABASE_NAME}: {counts}")
+
+
+def _register_bench_engine(latency_ms):
+    from synthesis import register_engine
+
+    @register_engine("bench")
+    def bench_engine(text, lang):
+        time.sleep(latency_ms / 1000)
+        # A silent MPEG frame header per 8 characters stands in for audio
+        return b"\xff\xfb\x90\x00" * (len(text) // 8 + 1)
+
+
+def _stage_latency(base_url):
+    try:
+        with urllib.request.urlopen(f"{base_url}/metrics/latency", timeout=10) as r:
+            return json.loads(r.read())
+    except Exception as e:
+        print(f"⚠️ Could not read server stage latency: {e}")
+        return {}
+
+
+async def run(args):
+    servers = []
+    chat_url, tts_url = args.chat_url, args.tts_url
+    cache_dir = tempfile.mkdtemp(prefix="sylvr-bench-")
+    try:
+        if args.chat_clients and not chat_url:
+            _configure_chat(args, cache_dir)
+            # After the environment is set: it imports the scheduler
+            from . import stub_llm  # noqa: F401  registers LLM_BACKEND=stub
+
+            _seed(args)
+            from chatbot.main import app as chat_app
+
+            port = _free_port()
+            servers.append(await _serve(chat_app, port))
+            chat_url = f"ws://127.0.0.1:{port}/chat"
+        if (args.stt_clients or args.tts_clients) and not tts_url:
+            os.environ.setdefault("TTS_CACHE_DIR", os.path.join(cache_dir, "tts"))
+            os.environ.setdefault("WHISPER_MODEL", "tiny")
+            _register_bench_engine(args.tts_latency_ms)
+            from TTS import app as tts_app
+
+            port = _free_port()
+            servers.append(await _serve(tts_app, port))
+            tts_url = f"http://127.0.0.1:{port}"
+
+        audio = load.speech_like_wav(args.audio_seconds)
+        jobs = []
+        if args.chat_clients:
+            jobs.append(
+                load.run_chat_load(
+                    chat_url,
+                    QUESTIONS,
+                    args.chat_clients,
+                    args.turns,
+                    stream=not args.no_stream,
+                    timeout=args.timeout,
+                )
+            )
+        if args.stt_clients:
+            jobs.append(
+                load.run_http_load(
+                    "transcribe",
+                    f"{tts_url}/transcribe",
+                    lambda i: load.multipart("file", "bench.wav", audio, "audio/wav"),
+                    args.stt_clients,
+                    args.stt_requests,
+                    args.timeout,
+                )
+            )
+        if args.tts_clients:
+            jobs.append(
+                load.run_http_load(
+                    "tts",
+                    f"{tts_url}/tts",
+                    lambda i: load.form(
+                        text=TTS_TEXTS[i % len(TTS_TEXTS)], engine=args.tts_engine
+                    ),
+                    args.tts_clients,
+                    args.tts_requests,
+                    args.timeout,
+                )
+            )
+
+        start = time.perf_counter()
+        samples = [s for batch in await asyncio.gather(*jobs) for s in batch]
+        elapsed = time.perf_counter() - start
+
+        rows = report.summarize(samples, elapsed)
+        columns = ["requests", "errors", "throughput_rps"]
+        columns += [f"p{p}_ms" for p in report.PERCENTILES]
+        columns += ["max_ms", "first_p50_ms", "first_p95_ms"]
+        print(f"\n📊 {len(samples)} requests in {elapsed:.1f}s\n")
+        print(report.format_table(rows, columns))
+        for kind, row in rows.items():
+            if row["error_kinds"]:
+                print(f"⚠️ {kind} errors: {row['error_kinds']}")
+
+        stages = {}
+        if chat_url:
+            base = chat_url.replace("ws", "http", 1).rsplit("/chat", 1)[0]
+            stages = await asyncio.to_thread(_stage_latency, base)
+            if stages:
+                print("\n⏱️ Server-side stage latency (recent window)\n")
+                print(
+                    report.format_table(stages, ["count", "p50_ms", "p95_ms", "p99_ms"])
+                )
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(
+                    {
+                        "config": vars(args),
+                        "elapsed_s": elapsed,
+                        "results": rows,
+                        "stages": stages,
+                    },
+                    f,
+                    indent=2,
+                )
+        return rows
+    finally:
+        for server, task in servers:
+            server.should_exit = True
+            await task
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    data = parser.add_argument_group("data")
+    data.add_argument(
+        "--mongo-url", help="local mongod to seed and use instead of mongomock"
+    )
+    data.add_argument(
+        "--no-seed", action="store_true", help="use the data already in --mongo-url"
+    )
+    data.add_argument("--customers", type=int, default=200)
+    data.add_argument("--accounts-per-customer", type=int, default=3)
+    data.add_argument("--transactions-per-account", type=int, default=40)
+    data.add_argument("--seed", type=int, default=42)
+
+    chat = parser.add_argument_group("chat")
+    chat.add_argument(
+        "--chat-url", help="benchmark a running server instead of an in-process one"
+    )
+    chat.add_argument("--chat-clients", type=int, default=8)
+    chat.add_argument("--turns", type=int, default=5, help="questions per client")
+    chat.add_argument("--no-stream", action="store_true", help="use one-response mode")
+    chat.add_argument("--llm-latency-ms", type=float, default=300)
+    chat.add_argument(
+        "--caches", action="store_true", help="keep answer and plan caches on"
+    )
+
+    speech = parser.add_argument_group("speech")
+    speech.add_argument(
+        "--tts-url", help="running TTS.py server, e.g. http://localhost:8001"
+    )
+    speech.add_argument("--stt-clients", type=int, default=0)
+    speech.add_argument("--stt-requests", type=int, default=20)
+    speech.add_argument("--audio-seconds", type=float, default=3)
+    speech.add_argument("--tts-clients", type=int, default=0)
+    speech.add_argument("--tts-requests", type=int, default=50)
+    speech.add_argument("--tts-engine", default="bench")
+    speech.add_argument("--tts-latency-ms", type=float, default=150)
+
+    parser.add_argument(
+        "--timeout", type=float, default=120, help="seconds per request"
+    )
+    parser.add_argument("--json", help="also write the results to this file")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Synthetic sample_analytics data for offline benchmarks.
+
+Generates accounts, customers and transactions with the same shape as
+MongoDB's sample_analytics dataset (nested products, tier_and_details keyed by
+hex ids, bucketed transaction arrays) at any scale, deterministically for a
+given seed. Seeds a local mongod or an in-memory mongomock client:
+
+    python -m bench.seed --url mongodb://localhost:27017 --customers 2000
+"""
+
+import argparse
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient
+
+DATABASE_NAME = "sample_analytics"
+
+PRODUCTS = [
+    "Derivatives",
+    "InvestmentStock",
+    "CurrencyService",
+    "Commodity",
+    "Brokerage",
+    "InvestmentFund",
+]
+TIERS = {
+    "Bronze": ["sports tickets", "24 hour dedicated line"],
+    "Silver": ["airline lounge access", "dedicated account representative"],
+    "Gold": ["concierge services", "car rental insurance", "shopping discounts"],
+    "Platinum": [
+        "financial planning assistance",
+        "concert tickets",
+        "travel insurance",
+    ],
+}
+SYMBOLS = ["aapl", "amzn", "msft", "goog", "nflx", "nvda", "ibm", "csco", "sap", "team"]
+FIRST_NAMES = [
+    "Elizabeth",
+    "James",
+    "Maria",
+    "David",
+    "Linda",
+    "Robert",
+    "Sarah",
+    "Kevin",
+]
+LAST_NAMES = ["Ray", "Smith", "Garcia", "Johnson", "Lee", "Brown", "Martinez", "Clark"]
+STREETS = ["Main Street", "Oak Avenue", "Pine Road", "Lake View", "Hill Drive"]
+
+
+def _account(rng, account_id):
+    return {
+        "account_id": account_id,
+        "limit": rng.choice([3000, 5000, 9000, 10000]),
+        "products": rng.sample(PRODUCTS, rng.randint(1, 4)),
+    }
+
+
+def _customer(rng, index, account_ids):
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    username = f"{first.lower()}{last.lower()}{index}"
+    customer = {
+        "username": username,
+        "name": f"{first} {last}",
+        "address": f"{rng.randint(1, 9999)} {rng.choice(STREETS)}",
+        "birthdate": datetime(1950, 1, 1) + timedelta(days=rng.randint(0, 18000)),
+        "email": f"{username}@example.com",
+        "accounts": account_ids,
+        "tier_and_details": {},
+    }
+    for _ in range(rng.randint(0, 2)):
+        key = uuid.UUID(int=rng.getrandbits(128)).hex
+        tier = rng.choice(list(TIERS))
+        customer["tier_and_details"][key] = {
+            "tier": tier,
+            "benefits": rng.sample(TIERS[tier], rng.randint(1, len(TIERS[tier]))),
+            "active": rng.random() < 0.8,
+            "id": key,
+        }
+    if rng.random() < 0.3:
+        customer["active"] = True
+    return customer
+
+
+def _transactions(rng, account_id, count):
+    start = datetime(1969, 2, 4) + timedelta(days=rng.randint(0, 16000))
+    trades = []
+    for _ in range(count):
+        amount = rng.randint(1, 10000)
+        price = round(rng.uniform(5, 150), 2)
+        trades.append(
+            {
+                "date": start + timedelta(days=rng.randint(0, 3650)),
+                "amount": amount,
+                "transaction_code": rng.choice(["buy", "sell"]),
+                "symbol": rng.choice(SYMBOLS),
+                # Strings, as in the real dataset
+                "price": str(price),
+                "total": str(round(price * amount, 2)),
+            }
+        )
+    trades.sort(key=lambda trade: trade["date"])
+    return {
+        "account_id": account_id,
+        "transaction_count": count,
+        "bucket_start_date": trades[0]["date"] if trades else start,
+        "bucket_end_date": trades[-1]["date"] if trades else start,
+        "transactions": trades,
+    }
+
+
+def generate(
+    customers=500, accounts_per_customer=3, transactions_per_account=40, seed=42
+):
+    """(collection, documents) pairs for a dataset of ``customers`` customers."""
+    rng = random.Random(seed)
+    accounts, people, buckets = [], [], []
+    next_id = 100000
+    for index in range(customers):
+        ids = []
+        for _ in range(rng.randint(1, accounts_per_customer * 2 - 1)):
+            next_id += rng.randint(1, 50)
+            ids.append(next_id)
+            accounts.append(_account(rng, next_id))
+            count = rng.randint(1, transactions_per_account * 2)
+            buckets.append(_transactions(rng, next_id, count))
+        people.append(_customer(rng, index, ids))
+    return [("accounts", accounts), ("customers", people), ("transactions", buckets)]
+
+
+def seed_database(db, batch_size=1000, **scale):
+    """Replace the three collections in ``db`` with generated data; returns counts."""
+    counts = {}
+    for name, documents in generate(**scale):
+        db[name].drop()
+        for start in range(0, len(documents), batch_size):
+            db[name].insert_many(documents[start : start + batch_size])
+        counts[name] = len(documents)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="mongodb://localhost:27017")
+    parser.add_argument("--customers", type=int, default=500)
+    parser.add_argument("--accounts-per-customer", type=int, default=3)
+    parser.add_argument("--transactions-per-account", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    client = MongoClient(args.url)
+    counts = seed_database(
+        client[DATABASE_NAME],
+        customers=args.customers,
+        accounts_per_customer=args.accounts_per_customer,
+        transactions_per_account=args.transactions_per_account,
+        seed=args.seed,
+    )
+    print(f"✅ Seeded {DATABASE_NAME} at {args.url}: {counts}")
+
+
+if __name__ == "__main__":
+    main()
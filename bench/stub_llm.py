@@ -0,0 +1,179 @@
+"""Deterministic stand-in for Gemini, registered as ``LLM_BACKEND=stub``.
+
+Each agent gets a canned reply of the right kind: the planner a short plan,
+the builder and fast agent a real PyMongo program (picked by keywords in the
+question) that the executor runs against the seeded data, and the answerer a
+sentence built from the query output. Every call waits ``STUB_LLM_LATENCY_MS``
+(spread over the chunks when streaming) inside the scheduler's "llm" stage,
+like the real model, so queueing and pipeline overhead show up in benchmarks
+without network access or API quota.
+"""
+
+import asyncio
+import os
+import re
+from typing import AsyncGenerator
+
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.genai import types
+
+from chatbot.llm import register_backend
+from chatbot.scheduler import scheduler
+
+_AGENT_NAME = re.compile(r'Your internal name is "([^"]+)"')
+_OUTPUT_MARKERS = ("Code execution result:", "```tool_output")
+
+# (question pattern, program) in priority order; the last one always matches
+PROGRAMS = [
+    (
+        r"\b(buys?|sells?|bought|sold|trades?|transactions?|symbols?)\b",
+        """
+pipeline = [
+    {"$unwind": "$transactions"},
+    {"$group": {"_id": "$transactions.transaction_code", "trades": {"$sum": 1}, "amount": {"$sum": "$transactions.amount"}}},
+    {"$sort": {"_id": 1}},
+]
+database_results = [{"code": row["_id"], "trades": row["trades"], "amount": row["amount"]} for row in db.transactions.aggregate(pipeline)]
+print(json.dumps(database_results, default=str))
+""",
+    ),
+    (
+        r"\b(limits?|products?|accounts?)\b",
+        """
+pipeline = [
+    {"$unwind": "$products"},
+    {"$group": {"_id": "$products", "accounts": {"$sum": 1}, "average_limit": {"$avg": "$limit"}}},
+    {"$sort": {"accounts": -1}},
+]
+database_results = [{"product": row["_id"], "accounts": row["accounts"], "average_limit": round(row["average_limit"], 2)} for row in db.accounts.aggregate(pipeline)]
+print(json.dumps(database_results, default=str))
+""",
+    ),
+    (
+        r"\b(list|show|names?|emails?)\b",
+        """
+database_results = list(db.customers.find({}, {"_id": 0, "name": 1, "email": 1}).sort("username", 1).limit(10))
+print(json.dumps(database_results, default=str))
+""",
+    ),
+    (
+        r"",
+        """
+database_results = db.customers.count_documents({})
+print(json.dumps(database_results, default=str))
+""",
+    ),
+]
+
+
+def stub_settings():
+    return {
+        "latency_ms": float(os.getenv("STUB_LLM_LATENCY_MS", "300")),
+        "chunks": int(os.getenv("STUB_LLM_STREAM_CHUNKS", "8")),
+    }
+
+
+def _texts(content):
+    return [part.text for part in content.parts or [] if part.text]
+
+
+def _question(llm_request: LlmRequest) -> str:
+    """The most recent message the user typed."""
+    for content in reversed(llm_request.contents):
+        texts = _texts(content)
+        if (
+            content.role == "user"
+            and texts
+            and not texts[0].startswith(("For context:",) + _OUTPUT_MARKERS)
+        ):
+            return texts[0]
+    return ""
+
+
+def _last_output(llm_request: LlmRequest) -> str:
+    """Query output the agent has seen most recently, or ""."""
+    for content in reversed(llm_request.contents):
+        for part in reversed(content.parts or []):
+            if part.code_execution_result and part.code_execution_result.output:
+                return part.code_execution_result.output
+            text = part.text or ""
+            for marker in _OUTPUT_MARKERS:
+                if marker in text:
+                    return text.split(marker, 1)[1]
+    return ""
+
+
+def _clean_output(output: str) -> str:
+    output = output.replace("Code execution result:", "").strip().strip("`").strip()
+    return output[:300]
+
+
+def reply(llm_request: LlmRequest) -> str:
+    """The stub's deterministic answer to a request."""
+    instruction = str(llm_request.config.system_instruction or "")
+    match = _AGENT_NAME.search(instruction)
+    agent = match.group(1) if match else ""
+    question = _question(llm_request)
+    last = llm_request.contents[-1] if llm_request.contents else None
+    ran_code = last is not None and any(
+        text.startswith(_OUTPUT_MARKERS) for text in _texts(last)
+    )
+
+    if agent == "query_planner_agent":
+        return (
+            f"Plan for: {question}\n"
+            "1. Pick the collection the question is about.\n"
+            "2. Filter or unwind nested arrays as needed and aggregate in MongoDB.\n"
+            "3. Store a small result in database_results and print it as JSON."
+        )
+    if agent in ("query_builder_agent", "query_fast_agent"):
+        if ran_code:
+            return _clean_output(_last_output(llm_request))
+        for pattern, program in PROGRAMS:
+            if re.search(pattern, question, re.IGNORECASE):
+                return f"```python\n{program.strip()}\n```"
+    output = _clean_output(_last_output(llm_request)) or "no rows"
+    return f"Here is what the data shows for '{question}': {output}"
+
+
+class StubLlm(BaseLlm):
+    """Offline model with canned replies and a fixed latency."""
+
+    @staticmethod
+    def supported_models() -> list[str]:
+        return [r"stub-.*"]
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        settings = stub_settings()
+        text = reply(llm_request)
+        async with scheduler.stage("llm"):
+            # Code has to arrive in one piece for ADK to run it
+            if not stream or text.startswith("```"):
+                await asyncio.sleep(settings["latency_ms"] / 1000)
+            else:
+                words = text.split(" ")
+                chunks = max(min(settings["chunks"], len(words)), 1)
+                size = -(-len(words) // chunks)
+                for start in range(0, len(words), size):
+                    await asyncio.sleep(settings["latency_ms"] / 1000 / chunks)
+                    yield LlmResponse(
+                        content=types.Content(
+                            role="model",
+                            parts=[
+                                types.Part(
+                                    text=" ".join(words[start : start + size]) + " "
+                                )
+                            ],
+                        ),
+                        partial=True,
+                    )
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[types.Part(text=text)])
+        )
+
+
+@register_backend("stub")
+def stub_model(name: str) -> StubLlm:
+    return StubLlm(model=name)
@@ -1,3 +1,8 @@
-from .main import query_builder_agent
-from .main import query_answerer_agent
-from .main import ROOT_AGENT
\ No newline at end of file
+def __getattr__(name):
+    # Loaded lazily so executor worker processes importing chatbot.* modules
+    # don't build the agents and FastAPI app.
+    if name in ("query_builder_agent", "query_answerer_agent", "ROOT_AGENT"):
+        from . import main
+
+        return getattr(main, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
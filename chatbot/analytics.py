@@ -0,0 +1,567 @@
+"""Columnar snapshot of sample_analytics for scans and aggregations, queried with DuckDB.
+
+``AnalyticsSnapshot.refresh`` exports the collections to Parquet under
+``ANALYTICS_DIR``:
+
+``trades``
+    One row per entry of the ``transactions`` arrays (account_id, date,
+    transaction_code, symbol, amount, price, total), partitioned into
+    ``year=YYYY/month=M`` directories by trade date.
+``accounts``
+    account_id, limit and products.
+``customers``
+    username, name, email, birthdate, active, accounts and tiers.
+
+Trades are exported incrementally: only the accounts whose transactions
+documents were added, removed or changed ``transaction_count`` or
+``bucket_end_date`` are re-read, and only the partitions holding their trades
+are rewritten. The whole snapshot is rebuilt every ``ANALYTICS_FULL_REFRESH``
+seconds, which also picks up edits that keep those fields. ``manifest.json``
+lists the current files and is replaced atomically; replaced files are
+deleted one refresh later, so readers in other processes always see a
+complete snapshot. Every uvicorn worker runs the refresh loop, but only the
+process holding the directory's ``writer.lock`` (the first to take it, until
+it exits) writes; the others follow the manifest it publishes.
+
+``query`` runs DuckDB SQL over the snapshot, with one view per table.
+duckdb and pyarrow are imported on first use; without them no snapshot is
+built and ``query`` raises ``AnalyticsUnavailable``.
+"""
+
+import asyncio
+import importlib.util
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from . import mongo
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process is assumed to write
+    fcntl = None
+
+MANIFEST = "manifest.json"
+STATE = "state.json"
+WRITER_LOCK = "writer.lock"
+TABLES = ("trades", "accounts", "customers")
+
+# DuckDB connection over the manifest last read by this process
+_reader: Dict[str, Any] = {"connection": None, "mtime": None}
+_reader_lock = threading.Lock()
+
+
+class AnalyticsUnavailable(Exception):
+    """Raised when duckdb/pyarrow are missing or no snapshot has been built."""
+
+
+def analytics_settings() -> Dict[str, Any]:
+    return {
+        "enabled": os.getenv("ANALYTICS_ENABLED", "1").lower() in ("1", "true", "yes"),
+        "directory": os.path.abspath(os.getenv("ANALYTICS_DIR", ".analytics")),
+        "refresh_interval": float(os.getenv("ANALYTICS_REFRESH_INTERVAL", "600")),
+        "full_refresh": float(os.getenv("ANALYTICS_FULL_REFRESH", "86400")),
+        # transactions documents per batch of Parquet files in a full export
+        "batch_size": int(os.getenv("ANALYTICS_EXPORT_BATCH", "5000")),
+        "threads": int(os.getenv("ANALYTICS_THREADS", "2")),
+        "memory_mb": int(os.getenv("ANALYTICS_MEMORY_MB", "512")),
+        "timeout": float(os.getenv("ANALYTICS_QUERY_TIMEOUT", "20")),
+    }
+
+
+def available() -> bool:
+    """Whether duckdb and pyarrow are installed (without importing them)."""
+    return all(importlib.util.find_spec(name) for name in ("duckdb", "pyarrow"))
+
+
+def _arrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.parquet
+    except ImportError as e:
+        raise AnalyticsUnavailable(f"pyarrow is not installed: {e}")
+    return pyarrow
+
+
+def _schemas(pa) -> Dict[str, Any]:
+    return {
+        "trades": pa.schema(
+            [
+                ("account_id", pa.int64()),
+                ("date", pa.timestamp("ms")),
+                ("transaction_code", pa.string()),
+                ("symbol", pa.string()),
+                ("amount", pa.int64()),
+                ("price", pa.float64()),
+                ("total", pa.float64()),
+            ]
+        ),
+        "accounts": pa.schema(
+            [
+                ("account_id", pa.int64()),
+                ("limit", pa.int64()),
+                ("products", pa.list_(pa.string())),
+            ]
+        ),
+        "customers": pa.schema(
+            [
+                ("username", pa.string()),
+                ("name", pa.string()),
+                ("email", pa.string()),
+                ("birthdate", pa.timestamp("ms")),
+                ("active", pa.bool_()),
+                ("accounts", pa.list_(pa.int64())),
+                ("tiers", pa.list_(pa.string())),
+            ]
+        ),
+    }
+
+
+def _number(value: Any) -> Optional[float]:
+    """Float of a number or numeric string (price and total are strings)."""
+    try:
+        return float(str(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _integer(value: Any) -> Optional[int]:
+    number = _number(value)
+    return int(number) if number is not None else None
+
+
+def _fingerprint(document: Dict[str, Any]) -> List[Any]:
+    return [document.get("transaction_count"), str(document.get("bucket_end_date"))]
+
+
+def _partition(date: datetime) -> str:
+    return f"{date.year}/{date.month}"
+
+
+def _trades(document: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+    for trade in document.get("transactions") or []:
+        date = trade.get("date")
+        if not isinstance(date, datetime):
+            continue
+        yield {
+            "account_id": _integer(document.get("account_id")),
+            "date": date,
+            "transaction_code": trade.get("transaction_code"),
+            "symbol": trade.get("symbol"),
+            "amount": _integer(trade.get("amount")),
+            "price": _number(trade.get("price")),
+            "total": _number(trade.get("total")),
+        }
+
+
+def _account_row(document: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "account_id": _integer(document.get("account_id")),
+        "limit": _integer(document.get("limit")),
+        "products": [str(p) for p in document.get("products") or []],
+    }
+
+
+def _customer_row(document: Dict[str, Any]) -> Dict[str, Any]:
+    details = document.get("tier_and_details") or {}
+    birthdate = document.get("birthdate")
+    return {
+        "username": document.get("username"),
+        "name": document.get("name"),
+        "email": document.get("email"),
+        "birthdate": birthdate if isinstance(birthdate, datetime) else None,
+        "active": document.get("active"),
+        "accounts": [_integer(a) for a in document.get("accounts") or []],
+        "tiers": sorted(
+            {str(d.get("tier")) for d in details.values() if isinstance(d, dict)}
+        ),
+    }
+
+
+def _table(pa, table: str, rows: List[Dict[str, Any]]):
+    return pa.Table.from_pylist(rows, schema=_schemas(pa)[table])
+
+
+def _trades_file(partition: str, version: str, part: int) -> str:
+    year, month = partition.split("/")
+    return f"trades/year={year}/month={month}/{version}-{part}.parquet"
+
+
+def _read_json(path: str) -> Dict[str, Any]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _write_json(path: str, value: Dict[str, Any]) -> None:
+    with open(path + ".tmp", "w") as f:
+        json.dump(value, f)
+    os.replace(path + ".tmp", path)
+
+
+class AnalyticsSnapshot:
+    """Parquet export of sample_analytics, refreshed incrementally."""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory
+        self.built_at: Optional[float] = None
+        self.last_refresh: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        # Open while this process is the snapshot's writer
+        self._writer_lock = None
+
+    def _directory(self) -> str:
+        return self.directory or analytics_settings()["directory"]
+
+    def _is_writer(self, directory: str) -> bool:
+        """Whether this process writes the snapshot, taking the writer lock if it's free."""
+        if self._writer_lock is not None or fcntl is None:
+            return True
+        handle = open(os.path.join(directory, WRITER_LOCK), "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        self._writer_lock = handle
+        return True
+
+    def _write(self, pa, data, name: str) -> str:
+        """Write the Arrow table ``data`` to ``name`` under the snapshot directory."""
+        path = os.path.join(self._directory(), name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pa.parquet.write_table(data, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        return name
+
+    def _write_trades(self, pa, rows: List[Dict], version: str, part: int) -> Dict:
+        """Write trades one file per partition; returns {partition: (file, rows)}."""
+        by_partition: Dict[str, List[Dict]] = {}
+        for row in rows:
+            by_partition.setdefault(_partition(row["date"]), []).append(row)
+        written = {}
+        for key, partition_rows in by_partition.items():
+            name = self._write(
+                pa,
+                _table(pa, "trades", partition_rows),
+                _trades_file(key, version, part),
+            )
+            written[key] = (name, len(partition_rows))
+        return written
+
+    def refresh(self, db=None, full: bool = False) -> Dict[str, Any]:
+        """Bring the snapshot up to date with ``db``; returns what was done."""
+        pa = _arrow()
+        settings = analytics_settings()
+        db = db if db is not None else mongo.get_database()
+        directory = self._directory()
+        with self._lock:
+            start = time.perf_counter()
+            os.makedirs(directory, exist_ok=True)
+            manifest = _read_json(os.path.join(directory, MANIFEST))
+            if not self._is_writer(directory):
+                # Another process writes; it also deletes the files it retires
+                self.built_at = manifest.get("built_at")
+                self.last_refresh = {"writer": False}
+                return self.last_refresh
+            state = _read_json(os.path.join(directory, STATE))
+            # Readers have had a whole interval to finish with these
+            self._delete(manifest.get("retired", []))
+            full = (
+                full
+                or not manifest
+                or state.get("version") != manifest.get("version")
+                or time.time() - manifest.get("full_built_at", 0)
+                >= settings["full_refresh"]
+            )
+            version = str(time.time_ns())
+            if full:
+                partitions, documents = self._export_trades(
+                    pa, db, version, settings["batch_size"]
+                )
+                changed = len(documents)
+                retired = [
+                    name
+                    for partition in manifest.get("partitions", {}).values()
+                    for name in partition["files"]
+                ]
+            else:
+                partitions, documents, changed, retired = self._update_trades(
+                    pa, db, version, manifest, state
+                )
+            # Small enough to export whole every time
+            accounts = [_account_row(d) for d in db.accounts.find({}, {"_id": 0})]
+            customers = [_customer_row(d) for d in db.customers.find({}, {"_id": 0})]
+            tables = {
+                "accounts": [
+                    self._write(
+                        pa,
+                        _table(pa, "accounts", accounts),
+                        f"accounts/{version}.parquet",
+                    )
+                ],
+                "customers": [
+                    self._write(
+                        pa,
+                        _table(pa, "customers", customers),
+                        f"customers/{version}.parquet",
+                    )
+                ],
+            }
+            for table in tables:
+                retired += manifest.get("tables", {}).get(table, [])
+            now = time.time()
+            _write_json(
+                os.path.join(directory, MANIFEST),
+                {
+                    "version": version,
+                    "built_at": now,
+                    "full_built_at": now if full else manifest["full_built_at"],
+                    "partitions": partitions,
+                    "tables": tables,
+                    "retired": retired,
+                },
+            )
+            _write_json(
+                os.path.join(directory, STATE),
+                {"version": version, "documents": documents},
+            )
+            self.built_at = now
+            self.last_refresh = {
+                "writer": True,
+                "full": full,
+                "changed_documents": changed,
+                "partitions": len(partitions),
+                "trades": sum(p["rows"] for p in partitions.values()),
+                "seconds": round(time.perf_counter() - start, 2),
+            }
+        kind = "rebuilt" if full else "refreshed"
+        print(
+            f"✅ Analytics snapshot {kind} in {self.last_refresh['seconds']}s "
+            f"({changed} transactions documents exported)"
+        )
+        return self.last_refresh
+
+    def _export_trades(self, pa, db, version: str, batch_size: int):
+        """Export every transactions document, ``batch_size`` documents per file."""
+        partitions: Dict[str, Dict[str, Any]] = {}
+        documents: Dict[str, List[Any]] = {}
+        rows: List[Dict] = []
+        batch = part = 0
+        cursor = db.transactions.find({}, batch_size=min(batch_size, 1000))
+        for document in cursor:
+            trades = list(_trades(document))
+            rows += trades
+            documents[str(document["_id"])] = [
+                _integer(document.get("account_id")),
+                _fingerprint(document),
+                sorted({_partition(t["date"]) for t in trades}),
+            ]
+            batch += 1
+            if batch >= batch_size:
+                self._add_files(partitions, self._write_trades(pa, rows, version, part))
+                rows, batch, part = [], 0, part + 1
+        if rows:
+            self._add_files(partitions, self._write_trades(pa, rows, version, part))
+        return partitions, documents
+
+    @staticmethod
+    def _add_files(partitions: Dict, written: Dict) -> None:
+        for key, (name, count) in written.items():
+            partition = partitions.setdefault(key, {"files": [], "rows": 0})
+            partition["files"].append(name)
+            partition["rows"] += count
+
+    def _update_trades(self, pa, db, version: str, manifest: Dict, state: Dict):
+        """Rewrite the partitions holding trades of changed accounts."""
+        known = state.get("documents", {})
+        current = {
+            str(d["_id"]): d
+            for d in db.transactions.find(
+                {}, {"account_id": 1, "transaction_count": 1, "bucket_end_date": 1}
+            )
+        }
+        changed = [
+            key
+            for key, document in current.items()
+            if key not in known or known[key][1] != _fingerprint(document)
+        ] + [key for key in known if key not in current]
+        accounts = {
+            _integer(current[key]["account_id"]) if key in current else known[key][0]
+            for key in changed
+        }
+        partitions = {
+            key: dict(value) for key, value in manifest.get("partitions", {}).items()
+        }
+        documents = {
+            key: value
+            for key, value in known.items()
+            if key in current and value[0] not in accounts
+        }
+        if not accounts:
+            return partitions, documents, 0, []
+
+        # Partitions that held the accounts' old trades, plus those of the new ones
+        affected = {
+            key for value in known.values() if value[0] in accounts for key in value[2]
+        }
+        new_rows: Dict[str, List[Dict]] = {}
+        reread = 0
+        for document in db.transactions.find({"account_id": {"$in": list(accounts)}}):
+            trades = list(_trades(document))
+            for trade in trades:
+                new_rows.setdefault(_partition(trade["date"]), []).append(trade)
+            documents[str(document["_id"])] = [
+                _integer(document.get("account_id")),
+                _fingerprint(document),
+                sorted({_partition(t["date"]) for t in trades}),
+            ]
+            reread += 1
+        affected |= set(new_rows)
+
+        retired: List[str] = []
+        removed = pa.array(sorted(accounts), pa.int64())
+        for key in affected:
+            old = partitions.pop(key, {"files": []})["files"]
+            retired += old
+            tables = []
+            for name in old:
+                table = pa.parquet.ParquetFile(
+                    os.path.join(self._directory(), name)
+                ).read()
+                keep = pa.compute.invert(
+                    pa.compute.is_in(table["account_id"], value_set=removed)
+                )
+                tables.append(table.filter(keep))
+            tables.append(_table(pa, "trades", new_rows.get(key, [])))
+            merged = pa.concat_tables(tables)
+            if merged.num_rows:
+                name = self._write(pa, merged, _trades_file(key, version, 0))
+                partitions[key] = {"files": [name], "rows": merged.num_rows}
+        return partitions, documents, reread, retired
+
+    def _delete(self, names: List[str]) -> None:
+        for name in names:
+            try:
+                os.remove(os.path.join(self._directory(), name))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        manifest = _read_json(os.path.join(self._directory(), MANIFEST))
+        partitions = manifest.get("partitions", {})
+        return {
+            "built_at": manifest.get("built_at"),
+            "full_built_at": manifest.get("full_built_at"),
+            "partitions": len(partitions),
+            "trades": sum(p["rows"] for p in partitions.values()),
+            "last_refresh": self.last_refresh,
+        }
+
+
+snapshot = AnalyticsSnapshot()
+
+
+async def refresh_loop(interval: float) -> None:
+    """Export the snapshot now and bring it up to date every ``interval`` seconds."""
+    while True:
+        try:
+            await mongo.run_blocking(snapshot.refresh)
+        except AnalyticsUnavailable as e:
+            print(f"⚠️ Analytics snapshot disabled: {e}")
+            return
+        except Exception as e:
+            print(f"⚠️ Analytics snapshot refresh failed: {e}")
+        await asyncio.sleep(interval)
+
+
+def _sql_string(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _connection():
+    """This process's DuckDB connection, with views over the current manifest."""
+    try:
+        import duckdb
+    except ImportError as e:
+        raise AnalyticsUnavailable(f"duckdb is not installed: {e}")
+    settings = analytics_settings()
+    path = os.path.join(settings["directory"], MANIFEST)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        raise AnalyticsUnavailable(
+            "The analytics snapshot has not been built yet; query MongoDB instead"
+        )
+    with _reader_lock:
+        if _reader["mtime"] != mtime:
+            manifest = _read_json(path)
+            files = {
+                "trades": [
+                    name
+                    for partition in manifest.get("partitions", {}).values()
+                    for name in partition["files"]
+                ],
+                **manifest.get("tables", {}),
+            }
+            connection = duckdb.connect(
+                config={
+                    "threads": settings["threads"],
+                    "memory_limit": f"{settings['memory_mb']}MB",
+                }
+            )
+            for table in TABLES:
+                if not files.get(table):
+                    continue
+                paths = ", ".join(
+                    _sql_string(os.path.join(settings["directory"], name))
+                    for name in files[table]
+                )
+                hive = "true" if table == "trades" else "false"
+                connection.execute(
+                    f"CREATE VIEW {table} AS SELECT * FROM "
+                    f"read_parquet([{paths}], hive_partitioning = {hive})"
+                )
+            _reader.update(connection=connection, mtime=mtime)
+        return _reader["connection"]
+
+
+def query(sql: str, params: Optional[List[Any]] = None) -> List[Dict[str, Any]]:
+    """Rows of a DuckDB SQL query over the snapshot, as dicts.
+
+    The query is interrupted after ``ANALYTICS_QUERY_TIMEOUT`` seconds.
+    """
+    cursor = _connection().cursor()
+    timeout = analytics_settings()["timeout"]
+    timer = threading.Timer(timeout, cursor.interrupt) if timeout > 0 else None
+    if timer is not None:
+        timer.start()
+    try:
+        cursor.execute(sql, params or [])
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    finally:
+        if timer is not None:
+            timer.cancel()
+        cursor.close()
+
+
+def prompt_section() -> str:
+    """Description of the snapshot for agent instructions ("" when it is off)."""
+    settings = analytics_settings()
+    if not settings["enabled"] or settings["refresh_interval"] <= 0 or not available():
+        return ""
+    return """
+        Columnar analytics snapshot (a copy refreshed every few minutes): use it for trends, comparisons and aggregations over many trades or customers, and MongoDB for lookups of particular customers or accounts.
+
+        trades: one row per trade with account_id, date (timestamp), transaction_code ("buy"/"sell"), symbol, amount, price and total (numbers), and year and month (integers; filtering on them skips the other months).
+        accounts: account_id, limit and products (list).
+        customers: username, name, email, birthdate, active, accounts (list of account_id) and tiers (list).
+        Query it with analytics_query(sql, params), which runs DuckDB SQL and returns a list of dicts, e.g. database_results = analytics_query("SELECT year, month, transaction_code, count(*) AS trades, sum(amount) AS shares FROM trades WHERE symbol = ? GROUP BY ALL ORDER BY ALL", ["amzn"]). Use unnest() or list_contains() for the list columns. If it raises an error saying the snapshot is unavailable, use MongoDB instead.
+    """
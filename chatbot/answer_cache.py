@@ -0,0 +1,258 @@
+"""Answer cache that lets repeated questions skip the ROOT_AGENT pipeline."""
+
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Set
+
+COLLECTIONS = ("accounts", "customers", "transactions")
+
+_COLLECTION_PATTERNS = {
+    name: re.compile(rf"\b{name[:-1]}s?\b", re.IGNORECASE) for name in COLLECTIONS
+}
+# Views (see views.py) and snapshot tables (analytics.py) -> their source collection
+_DERIVED = {
+    "mv_account_rollups": "transactions",
+    "mv_tier_distribution": "customers",
+    "mv_account_products": "accounts",
+    "trades": "transactions",
+}
+_DERIVED_PATTERNS = {name: re.compile(rf"\b{name}\b") for name in _DERIVED}
+_LITERAL_PATTERN = re.compile(r"\"[^\"]*\"|'[^']*'|\d+(?:\.\d+)?")
+
+# Categorical values that behave like literals in sample_analytics questions
+# (plan_cache.py templates these in generated code).
+VOCABULARY = {
+    "code": ("buy", "sell"),
+    "tier": ("bronze", "silver", "gold", "platinum"),
+}
+# Account products; stored as "InvestmentStock" but often asked as two words
+_PRODUCTS = (
+    "brokerage",
+    "commodity",
+    "currency ?service",
+    "derivatives",
+    "investment ?fund",
+    "investment ?stock",
+)
+_TERM_PATTERN = re.compile(
+    r"\b(?:"
+    + "|".join(
+        [word for words in VOCABULARY.values() for word in words] + list(_PRODUCTS)
+    )
+    + r")\b",
+    re.IGNORECASE,
+)
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase the question and collapse punctuation and whitespace."""
+    text = question.lower().strip()
+    text = re.sub(r"[^\w\s\.\"']", " ", text)
+    text = re.sub(r"(?<!\d)\.|\.(?!\d)", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def question_literals(question: str) -> List[str]:
+    """Literals a cached answer must share with the question.
+
+    Numbers, quoted strings, and the categorical terms (tiers, transaction
+    codes, products) that change an answer without changing the wording much.
+    """
+    terms = [term.lower().replace(" ", "") for term in _TERM_PATTERN.findall(question)]
+    return _LITERAL_PATTERN.findall(question) + terms
+
+
+def collections_in_code(code: Optional[str]) -> Set[str]:
+    """Collections a generated program reads; all of them if it names none.
+
+    Views and analytics snapshot tables count as the collection they are
+    computed from.
+    """
+    found = set()
+    if code:
+        for name, pattern in _COLLECTION_PATTERNS.items():
+            if pattern.search(code):
+                found.add(name)
+        for name, pattern in _DERIVED_PATTERNS.items():
+            if pattern.search(code):
+                found.add(_DERIVED[name])
+    return found or set(COLLECTIONS)
+
+
+def conversation_key(turns: Optional[List[Dict]]) -> str:
+    """Hash of the recent conversation turns ("" for a new conversation).
+
+    Follow-ups ("what about Gold tier?") depend on the turns before them, so
+    answers are only shared between conversations that led up to them alike.
+    """
+    if not turns:
+        return ""
+    text = json.dumps(turns, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def gemini_embedding(text: str) -> List[float]:
+    """Embed text with the Gemini embedding model configured for the cache."""
+    import google.generativeai as genai
+
+    result = genai.embed_content(
+        model=os.getenv("ANSWER_CACHE_EMBED_MODEL", "models/embedding-001"),
+        content=text,
+    )
+    return result["embedding"]
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class AnswerCache:
+    """TTL/LRU cache of final answers keyed on the normalized question and its context.
+
+    ``context`` is a ``conversation_key``. When an embedding function is
+    given, a miss on the exact key falls back to the most similar cached
+    question above ``similarity_threshold`` with the same context and the same
+    literals (account ids, amounts, quoted names, tiers, products).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl_seconds: float = 900,
+        embed_fn: Optional[Callable[[str], List[float]]] = None,
+        similarity_threshold: float = 0.92,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _expired(self, entry: Dict, now: float) -> bool:
+        return now - entry["created"] > self.ttl_seconds
+
+    def _embed(self, key: str) -> Optional[List[float]]:
+        if self.embed_fn is None:
+            return None
+        try:
+            return self.embed_fn(key)
+        except Exception as e:
+            print(f"⚠️ Answer cache embedding failed: {e}")
+            return None
+
+    @staticmethod
+    def _key(normalized: str, context: str) -> str:
+        return f"{context}|{normalized}" if context else normalized
+
+    def get(self, question: str, context: str = "") -> Optional[str]:
+        """Return the cached answer for the question asked after ``context``, if any."""
+        question = normalize_question(question)
+        key = self._key(question, context)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["answer"]
+            if self.embed_fn is None:
+                self.misses += 1
+                return None
+
+        embedding = self._embed(question)
+        if embedding is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        literals = sorted(question_literals(question))
+        best_key, best_score = None, self.similarity_threshold
+        with self._lock:
+            for other_key, other in list(self._entries.items()):
+                if self._expired(other, now):
+                    del self._entries[other_key]
+                    continue
+                if (
+                    other["embedding"] is None
+                    or other["literals"] != literals
+                    or other["context"] != context
+                ):
+                    continue
+                score = _cosine(embedding, other["embedding"])
+                if score >= best_score:
+                    best_key, best_score = other_key, score
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return self._entries[best_key]["answer"]
+
+    def put(
+        self, question: str, answer: str, collections: Set[str], context: str = ""
+    ) -> None:
+        """Cache an answer, tagged with the collections it was computed from."""
+        question = normalize_question(question)
+        key = self._key(question, context)
+        embedding = self._embed(question)
+        with self._lock:
+            self._entries[key] = {
+                "answer": answer,
+                "collections": set(collections),
+                "context": context,
+                "literals": sorted(question_literals(question)),
+                "embedding": embedding,
+                "created": time.time(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, collection: Optional[str] = None) -> int:
+        """Drop answers that depend on a collection (or everything); returns the count."""
+        with self._lock:
+            if collection is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+                return dropped
+            stale = [
+                key
+                for key, entry in self._entries.items()
+                if collection in entry["collections"]
+            ]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def answer_cache_from_env() -> AnswerCache:
+    """Build the process-wide answer cache from ANSWER_CACHE_* environment variables."""
+    semantic = os.getenv("ANSWER_CACHE_SEMANTIC", "0").lower() in ("1", "true", "yes")
+    return AnswerCache(
+        max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "512")),
+        ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "900")),
+        embed_fn=gemini_embedding if semantic else None,
+        similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.92")),
+    )
@@ -0,0 +1,163 @@
+"""Awaitable Mongo access on Motor, for server helpers and generated code.
+
+Motor clients belong to one event loop, so there is one per loop: the
+server's, and a background loop per process that runs generated programs
+using top-level ``await`` (see ``run_sync``). They share the pool settings
+and command listener of the PyMongo client in ``mongo``.
+
+``find`` and ``aggregate`` read cursors ``batch_size`` documents at a time.
+When the awaiting task is cancelled, e.g. because the websocket client
+disconnected and its turn was dropped, the server-side cursor is killed
+instead of being left to time out.
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+from typing import Any, Coroutine, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from . import mongo
+
+_clients: Dict[asyncio.AbstractEventLoop, AsyncIOMotorClient] = {}
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def async_mongo_settings() -> Dict[str, Any]:
+    return {
+        "batch_size": int(os.getenv("MONGODB_BATCH_SIZE", "500")),
+        # Server-side time limit of each helper query (0 for none)
+        "max_time_ms": int(os.getenv("MONGODB_MAX_TIME_MS", "0")),
+    }
+
+
+def get_client(
+    url: Optional[str] = None, loop: Optional[asyncio.AbstractEventLoop] = None
+) -> AsyncIOMotorClient:
+    """The Motor client for ``loop`` (the running one by default), created on first use."""
+    loop = loop or asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        settings = mongo.mongo_settings()
+        client = _clients[loop] = AsyncIOMotorClient(
+            url or os.getenv("MONGODB_URL"),
+            maxPoolSize=settings["max_pool_size"],
+            minPoolSize=settings["min_pool_size"],
+            maxIdleTimeMS=settings["max_idle_time_ms"],
+            appname="SylvrDemo",
+            event_listeners=[mongo.CommandTimer()],
+            io_loop=loop,
+        )
+    return client
+
+
+def get_database(loop: Optional[asyncio.AbstractEventLoop] = None):
+    return get_client(loop=loop)[mongo.DATABASE_NAME]
+
+
+def close_clients() -> None:
+    for client in _clients.values():
+        client.close()
+    _clients.clear()
+
+
+def _collection(collection):
+    return get_database()[collection] if isinstance(collection, str) else collection
+
+
+async def _read(cursor, batch_size: int) -> List[Dict[str, Any]]:
+    """Every document of a Motor cursor, one batch per await."""
+    documents: List[Dict[str, Any]] = []
+    try:
+        while True:
+            batch = await cursor.to_list(batch_size)
+            if not batch:
+                return documents
+            documents.extend(batch)
+    except asyncio.CancelledError:
+        try:
+            await asyncio.shield(cursor.close())
+        except Exception:
+            pass
+        raise
+
+
+async def find(
+    collection,
+    filter: Optional[Dict[str, Any]] = None,
+    projection: Optional[Dict[str, Any]] = None,
+    sort: Optional[List[tuple]] = None,
+    limit: int = 0,
+    batch_size: Optional[int] = None,
+    max_time_ms: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Documents matching ``filter`` in ``collection`` (a name or Motor collection)."""
+    settings = async_mongo_settings()
+    batch_size = batch_size or settings["batch_size"]
+    cursor = _collection(collection).find(
+        filter or {}, projection, limit=limit, batch_size=batch_size
+    )
+    if sort:
+        cursor = cursor.sort(sort)
+    max_time_ms = settings["max_time_ms"] if max_time_ms is None else max_time_ms
+    if max_time_ms:
+        cursor = cursor.max_time_ms(max_time_ms)
+    return await _read(cursor, batch_size)
+
+
+async def aggregate(
+    collection,
+    pipeline: List[Dict[str, Any]],
+    batch_size: Optional[int] = None,
+    max_time_ms: Optional[int] = None,
+    allow_disk_use: bool = False,
+) -> List[Dict[str, Any]]:
+    """Output of an aggregation ``pipeline`` on ``collection`` (a name or Motor collection)."""
+    settings = async_mongo_settings()
+    batch_size = batch_size or settings["batch_size"]
+    options: Dict[str, Any] = {"batchSize": batch_size}
+    max_time_ms = settings["max_time_ms"] if max_time_ms is None else max_time_ms
+    if max_time_ms:
+        options["maxTimeMS"] = max_time_ms
+    if allow_disk_use:
+        options["allowDiskUse"] = True
+    cursor = _collection(collection).aggregate(pipeline, **options)
+    return await _read(cursor, batch_size)
+
+
+def background_loop() -> asyncio.AbstractEventLoop:
+    """This process's event loop for generated code, running in a daemon thread."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever, name="generated-code-loop", daemon=True
+            ).start()
+        return _loop
+
+
+def run_sync(coroutine: Coroutine) -> Any:
+    """Run ``coroutine`` on the background loop and wait for its result.
+
+    The caller's context variables (collected Mongo commands, captured
+    output) are carried over to the coroutine. If the wait is interrupted (an
+    execution limit fired), the coroutine is cancelled, which closes its open
+    cursors.
+    """
+    context = contextvars.copy_context()
+
+    async def in_context():
+        for var, value in context.items():
+            var.set(value)
+        return await coroutine
+
+    future = asyncio.run_coroutine_threadsafe(in_context(), background_loop())
+    try:
+        return future.result()
+    except BaseException:
+        future.cancel()
+        raise
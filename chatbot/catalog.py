@@ -0,0 +1,236 @@
+"""Sampled schema and statistics for sample_analytics, for the planning prompts.
+
+``SchemaCatalog.refresh`` samples each collection and records field paths with
+their BSON types and presence, the dynamic keys under ``tier_and_details``
+(collapsed to ``<id>``), array lengths, the values of low-cardinality strings,
+existing indexes and approximate document counts. ``prompt_section`` renders
+it compactly for agent instructions; the rendered text is cached until the
+next refresh.
+"""
+
+import asyncio
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from . import mongo
+from .answer_cache import COLLECTIONS
+
+# Object keys that are data rather than field names (tier_and_details ids).
+DYNAMIC_KEY = re.compile(r"^([0-9a-f]{16,}|\d+)$")
+_DYNAMIC_PLACEHOLDER = "<id>"
+# Strings with at most this many distinct sampled values have them listed.
+_MAX_LISTED_VALUES = 6
+_MAX_TRACKED_VALUES = 50
+_MAX_DEPTH = 6
+
+_TYPE_NAMES = {
+    "str": "string",
+    "int": "int",
+    "Int64": "long",
+    "float": "double",
+    "bool": "bool",
+    "datetime": "date",
+    "ObjectId": "objectId",
+    "Decimal128": "decimal",
+    "list": "array",
+    "dict": "object",
+    "NoneType": "null",
+    "bytes": "binData",
+    "Binary": "binData",
+}
+
+
+def catalog_settings() -> Dict[str, Any]:
+    return {
+        "enabled": os.getenv("CATALOG_ENABLED", "1").lower() in ("1", "true", "yes"),
+        "sample_size": int(os.getenv("CATALOG_SAMPLE_SIZE", "200")),
+        "refresh_interval": float(os.getenv("CATALOG_REFRESH_INTERVAL", "1800")),
+    }
+
+
+def _field_name(key: Any) -> str:
+    return _DYNAMIC_PLACEHOLDER if DYNAMIC_KEY.match(str(key)) else str(key)
+
+
+def _type_name(value: Any) -> str:
+    name = type(value).__name__
+    return _TYPE_NAMES.get(name, name)
+
+
+class _FieldStats:
+    def __init__(self):
+        self.seen = 0
+        self.types: Dict[str, int] = {}
+        self.values: set = set()
+        self.too_many_values = False
+        self.min_len: Optional[int] = None
+        self.max_len = 0
+        self.total_len = 0
+        self.arrays = 0
+
+    def add(self, value: Any) -> None:
+        kind = _type_name(value)
+        self.types[kind] = self.types.get(kind, 0) + 1
+        if isinstance(value, str) and not self.too_many_values:
+            self.values.add(value)
+            if len(self.values) > _MAX_TRACKED_VALUES:
+                self.values = set()
+                self.too_many_values = True
+        elif isinstance(value, list):
+            self.arrays += 1
+            length = len(value)
+            self.min_len = length if self.min_len is None else min(self.min_len, length)
+            self.max_len = max(self.max_len, length)
+            self.total_len += length
+
+
+def _walk(
+    value: Any, path: str, fields: Dict[str, _FieldStats], seen: set, depth: int
+) -> None:
+    """Record ``value`` at ``path``, then descend into objects and arrays."""
+    fields.setdefault(path, _FieldStats()).add(value)
+    seen.add(path)
+    if depth >= _MAX_DEPTH:
+        return
+    if isinstance(value, dict):
+        for key, child in value.items():
+            _walk(child, f"{path}.{_field_name(key)}", fields, seen, depth + 1)
+    elif isinstance(value, list):
+        for item in value:
+            _walk(item, f"{path}[]", fields, seen, depth + 1)
+
+
+def sample_collection(collection, size: int) -> Dict[str, Any]:
+    """Field statistics, indexes and approximate count for one collection."""
+    try:
+        documents = list(collection.aggregate([{"$sample": {"size": size}}]))
+    except Exception:
+        documents = list(collection.find().limit(size))
+    fields: Dict[str, _FieldStats] = {}
+    for document in documents:
+        # Presence is counted once per document, however often a path repeats
+        seen = set()
+        for key, value in document.items():
+            _walk(value, _field_name(key), fields, seen, 1)
+        for path in seen:
+            fields[path].seen += 1
+    try:
+        indexes = [
+            ", ".join(
+                f"{field}{'' if order == 1 else ' ' + str(order)}"
+                for field, order in info["key"]
+            )
+            + (" (unique)" if info.get("unique") else "")
+            for info in collection.index_information().values()
+        ]
+    except Exception:
+        indexes = []
+    return {
+        "count": collection.estimated_document_count(),
+        "sampled": len(documents),
+        "indexes": indexes,
+        "fields": fields,
+    }
+
+
+def _describe(path: str, stats: _FieldStats, sampled: int) -> str:
+    kinds = sorted(stats.types, key=stats.types.get, reverse=True)
+    text = f"{path}: {'|'.join(kinds)}"
+    if stats.arrays:
+        text += f" (len {stats.min_len}-{stats.max_len}, avg {stats.total_len / stats.arrays:.0f})"
+    if (
+        stats.values
+        and not stats.too_many_values
+        and len(stats.values) <= _MAX_LISTED_VALUES
+    ):
+        text += " values " + ", ".join(sorted(stats.values))
+    # Array elements and dynamic keys repeat within one document; presence is
+    # only meaningful for plain fields.
+    if "[]" not in path and _DYNAMIC_PLACEHOLDER not in path and stats.seen < sampled:
+        text += f" (in {stats.seen * 100 // max(sampled, 1)}% of documents)"
+    return text
+
+
+class SchemaCatalog:
+    """Cached sample of the sample_analytics collections."""
+
+    def __init__(self, sample_size: int = 200, collections: List[str] = COLLECTIONS):
+        self.sample_size = sample_size
+        self.collections = list(collections)
+        self.collections_info: Dict[str, Dict[str, Any]] = {}
+        self.refreshed_at: Optional[float] = None
+        self._rendered = ""
+        self._lock = threading.Lock()
+
+    def refresh(self, db=None) -> None:
+        db = db if db is not None else mongo.get_database()
+        start = time.perf_counter()
+        info = {
+            name: sample_collection(db[name], self.sample_size)
+            for name in self.collections
+        }
+        rendered = self.render(info)
+        with self._lock:
+            self.collections_info = info
+            self._rendered = rendered
+            self.refreshed_at = time.time()
+        print(f"✅ Schema catalog refreshed in {time.perf_counter() - start:.1f}s")
+
+    @staticmethod
+    def render(info: Dict[str, Dict[str, Any]]) -> str:
+        lines = []
+        for name, collection in info.items():
+            header = f"{name} (~{collection['count']:,} documents"
+            if collection["indexes"]:
+                header += "; indexes: " + "; ".join(collection["indexes"])
+            lines.append(header + ")")
+            for path in sorted(collection["fields"]):
+                lines.append(
+                    "  "
+                    + _describe(path, collection["fields"][path], collection["sampled"])
+                )
+        return "\n".join(lines)
+
+    def prompt_section(self) -> str:
+        """Sampled schema for agent instructions ("" until the first refresh)."""
+        with self._lock:
+            rendered = self._rendered
+        if not rendered:
+            return ""
+        return (
+            "\n        Sampled schema (authoritative for field names, types and array shapes; "
+            f"{_DYNAMIC_PLACEHOLDER} stands for a dynamic key, e.g. use $objectToArray):\n"
+            + rendered
+            + "\n"
+        )
+
+
+catalog = SchemaCatalog(sample_size=catalog_settings()["sample_size"])
+
+
+def with_catalog(instruction: str) -> Callable:
+    """InstructionProvider that appends the current catalog to ``instruction``.
+
+    Note ADK does not substitute ``{state}`` variables in provider output, so
+    only use this for instructions without placeholders.
+    """
+
+    def provider(context) -> str:
+        return instruction + catalog.prompt_section()
+
+    return provider
+
+
+async def refresh_loop(interval: float) -> None:
+    """Sample the collections now and then every ``interval`` seconds."""
+    while True:
+        try:
+            await mongo.run_blocking(catalog.refresh)
+        except Exception as e:
+            print(f"⚠️ Schema catalog refresh failed: {e}")
+        if interval <= 0:
+            return
+        await asyncio.sleep(interval)
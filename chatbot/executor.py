@@ -0,0 +1,298 @@
+"""Runs generated PyMongo code in a pool of warm worker processes.
+
+Workers import pymongo/pandas, connect to Mongo and load the dataset schema
+once (see ``executor_worker.init_worker``), enforce per-run time, CPU and
+memory limits, and are replaced after ``max_runs`` executions. With
+``EXECUTOR_WORKERS=0`` code runs inline in the server process instead.
+"""
+
+import asyncio
+import copy
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import (
+    Future,
+    ProcessPoolExecutor,
+    TimeoutError as FutureTimeoutError,
+)
+from concurrent.futures.process import BrokenProcessPool
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Tuple
+
+from google.adk.code_executors import UnsafeLocalCodeExecutor
+from google.adk.code_executors.code_execution_utils import (
+    CodeExecutionInput,
+    CodeExecutionResult,
+    CodeExecutionUtils,
+)
+
+from . import executor_worker
+from . import tracing
+from .indexes import index_advisor
+from .results import DIGEST_PREFIX, cap_text, is_digest, result_store
+from .scheduler import scheduler
+
+# Extra time the server waits beyond the in-worker limit before killing workers.
+_GRACE_SECONDS = 5
+# (code, result) of the latest model response, run by MongoCodeExecutor.prefetch
+_prefetched: ContextVar[Optional[Tuple[str, Dict[str, Any]]]] = ContextVar(
+    "prefetched_execution", default=None
+)
+
+
+class ExecutorPool:
+    """Process pool of warm workers for generated code."""
+
+    def __init__(
+        self,
+        workers: int = 2,
+        max_runs: int = 50,
+        timeout: float = 30,
+        cpu_seconds: float = 20,
+        memory_mb: int = 2048,
+        mongo_url: Optional[str] = None,
+    ):
+        self.workers = workers
+        self.max_runs = max_runs
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.mongo_url = mongo_url
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._warmups = []
+        # Bumped on every restart, so failures of runs on a replaced pool
+        # don't restart its successor
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ExecutorPool":
+        return cls(
+            workers=int(os.getenv("EXECUTOR_WORKERS", "2")),
+            max_runs=int(os.getenv("EXECUTOR_MAX_RUNS", "50")),
+            timeout=float(os.getenv("EXECUTOR_TIMEOUT", "30")),
+            cpu_seconds=float(os.getenv("EXECUTOR_CPU_SECONDS", "20")),
+            memory_mb=int(os.getenv("EXECUTOR_MEMORY_MB", "2048")),
+        )
+
+    def start(self, mongo_url: Optional[str] = None, wait: bool = True) -> None:
+        """Spawn the workers and, with ``wait``, block until each has finished its warm-up.
+
+        Runs submitted before then queue until a worker is ready.
+        """
+        if mongo_url:
+            self.mongo_url = mongo_url
+        if self.workers <= 0 or self._pool is not None:
+            return
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=executor_worker.init_worker,
+            initargs=(self.mongo_url or os.getenv("MONGODB_URL"), self.memory_mb),
+            max_tasks_per_child=self.max_runs,
+        )
+        self._warmups = [
+            self._pool.submit(executor_worker.ping) for _ in range(self.workers)
+        ]
+        if wait:
+            self.wait_ready()
+
+    def wait_ready(self) -> None:
+        """Block until every worker spawned by ``start`` has warmed up.
+
+        If a worker failed to start, the pool is replaced before the error is
+        raised, so the next call waits for fresh workers.
+        """
+        with self._lock:
+            if self._pool is None:
+                return
+            generation, warmups = self._generation, list(self._warmups)
+        try:
+            for future in warmups:
+                future.result()
+        except Exception:
+            self._restart(generation)
+            raise
+        print(f"✅ Executor pool ready with {self.workers} workers")
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _restart(self, generation: int) -> None:
+        """Replace the pool of ``generation``, one of whose workers is stuck or dead.
+
+        Killing one worker breaks the whole pool, so every worker is replaced.
+        Does nothing when that pool was already replaced. The new workers warm
+        up in the background; runs queue for them meanwhile.
+        """
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._generation += 1
+            pool = self._pool
+            self._pool = None
+            if pool is not None:
+                for process in list(getattr(pool, "_processes", {}).values()):
+                    process.kill()
+                pool.shutdown(wait=False, cancel_futures=True)
+            self.start(wait=False)
+
+    def _submit(self, code: str):
+        """Submit a run; returns (pool generation, the pool's warm-ups, future)."""
+        with self._lock:
+            generation = self._generation
+            warmups = list(self._warmups)
+            try:
+                future = self._pool.submit(
+                    executor_worker.run_code, code, self.timeout, self.cpu_seconds
+                )
+            except BrokenProcessPool as e:
+                future = Future()
+                future.set_exception(e)
+            return generation, warmups, future
+
+    def _failure(self, message: str) -> Dict[str, Any]:
+        return {
+            "stdout": "",
+            "stderr": message,
+            "has_results": False,
+            "database_results": None,
+            "result_rows": None,
+            "duration_ms": None,
+            "mongo_commands": None,
+        }
+
+    @staticmethod
+    def _keep_rows(result: Dict[str, Any]) -> Dict[str, Any]:
+        """Move a digest's rows into the result store and put its handle in the digest."""
+        rows = result.pop("result_rows", None)
+        digest = result["database_results"]
+        if rows is not None and is_digest(digest):
+            digest["handle"] = result_store.put(rows, digest.get("row_count"))
+        return result
+
+    def run(self, code: str) -> Dict[str, Any]:
+        """Run code and wait for it; blocks the calling thread."""
+        with tracing.tracer.start_as_current_span("executor.run") as span:
+            result = self._run(code)
+            commands = result.pop("mongo_commands", None) or []
+            tracing.record_execution(span, result, commands)
+            index_advisor.observe(commands)
+            return result
+
+    async def arun(self, code: str) -> Dict[str, Any]:
+        """Run code without blocking the event loop."""
+        with tracing.tracer.start_as_current_span("executor.run") as span:
+            result = await self._arun(code)
+            commands = result.pop("mongo_commands", None) or []
+            tracing.record_execution(span, result, commands)
+            index_advisor.observe(commands)
+            return result
+
+    def _run(self, code: str, retry: bool = True) -> Dict[str, Any]:
+        if self._pool is None:
+            return self._keep_rows(executor_worker.run_code(code))
+        generation, warmups, future = self._submit(code)
+        try:
+            # A restarted pool's warm-up doesn't count against the run's time
+            for warmup in warmups:
+                warmup.result()
+            return self._keep_rows(future.result(timeout=self.timeout + _GRACE_SECONDS))
+        except FutureTimeoutError:
+            self._restart(generation)
+            return self._failure("Execution exceeded its time limit")
+        except BrokenProcessPool:
+            if retry and generation != self._generation:
+                # Killed along with another run's stuck worker: try the new pool
+                return self._run(code, retry=False)
+            self._restart(generation)
+            return self._failure("Executor worker crashed (likely out of memory)")
+
+    async def _arun(self, code: str, retry: bool = True) -> Dict[str, Any]:
+        if self._pool is None:
+            result = await asyncio.to_thread(executor_worker.run_code, code)
+            return self._keep_rows(result)
+        generation, warmups, future = self._submit(code)
+        try:
+            await asyncio.gather(*(asyncio.wrap_future(w) for w in warmups))
+            result = await asyncio.wait_for(
+                asyncio.wrap_future(future), self.timeout + _GRACE_SECONDS
+            )
+            return self._keep_rows(result)
+        except asyncio.TimeoutError:
+            await asyncio.to_thread(self._restart, generation)
+            return self._failure("Execution exceeded its time limit")
+        except BrokenProcessPool:
+            if retry and generation != self._generation:
+                return await self._arun(code, retry=False)
+            await asyncio.to_thread(self._restart, generation)
+            return self._failure("Executor worker crashed (likely out of memory)")
+
+
+executor_pool = ExecutorPool.from_env()
+
+
+async def run_generated_code(code: str) -> Any:
+    """Execute a generated PyMongo program and return its database_results."""
+    async with scheduler.stage("executor"):
+        result = await executor_pool.arun(code)
+    if result["stderr"]:
+        raise RuntimeError(result["stderr"])
+    if not result["has_results"]:
+        raise ValueError("generated code did not set database_results")
+    return result["database_results"]
+
+
+class MongoCodeExecutor(UnsafeLocalCodeExecutor):
+    """Code executor for query_builder_agent backed by the warm executor pool.
+
+    Output given back to the model is capped at RESULTS_MAX_BYTES and large
+    results are shown as their digest. ADK calls ``execute_code``
+    synchronously from the agent flow, which would hold the event loop for
+    the whole run, so agents also register ``prefetch`` as an
+    after_model_callback: it runs the response's code block with ``arun``
+    before the flow gets to it, and ``execute_code`` just picks up the result.
+    Without it, the calling coroutine waits for the worker, capped by the
+    pool's time limit.
+    """
+
+    async def prefetch(self, callback_context, llm_response) -> None:
+        """after_model_callback: run the response's first code block off the event loop."""
+        if llm_response.partial or not llm_response.content:
+            return None
+        code = CodeExecutionUtils.extract_code_and_truncate_content(
+            copy.deepcopy(llm_response.content), self.code_block_delimiters
+        )
+        if not code:
+            return None
+        async with scheduler.stage("executor"):
+            result = await executor_pool.arun(code)
+        _prefetched.set((code, result))
+        return None
+
+    def execute_code(
+        self,
+        invocation_context,
+        code_execution_input: CodeExecutionInput,
+    ) -> CodeExecutionResult:
+        prefetched = _prefetched.get()
+        if prefetched is not None and prefetched[0] == code_execution_input.code:
+            _prefetched.set(None)
+            result = prefetched[1]
+        else:
+            result = executor_pool.run(code_execution_input.code)
+        stdout = cap_text(result["stdout"])
+        if is_digest(result["database_results"]):
+            # Printed rows were capped; the digest is what the model should pass on
+            stdout += (
+                "\n"
+                + DIGEST_PREFIX
+                + json.dumps(result["database_results"], default=str)
+            )
+        return CodeExecutionResult(
+            stdout=stdout, stderr=result["stderr"], output_files=[]
+        )
@@ -0,0 +1,254 @@
+"""Code that runs generated programs, inside executor worker processes or inline.
+
+Kept free of ADK/FastAPI imports so spawned workers only pay for pymongo,
+motor, pandas and the standard library. Programs may use top-level ``await``
+with the Motor helpers; they then run on the process's background loop.
+"""
+
+import ast
+import inspect
+import io
+import json
+import math
+import os
+import signal
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+try:
+    import resource
+except ImportError:  # Windows: no rlimits, only the wall-clock timeout applies
+    resource = None
+
+from . import analytics
+from . import async_mongo
+from . import mongo
+from .mongo import SharedClientProxy, DATABASE_NAME
+from .results import bound_results, summarize_results
+
+_preloaded: Dict[str, Any] = {}
+# Output buffer of the run in the current context (see _capture_stdout)
+_run_stdout: ContextVar[Optional[io.StringIO]] = ContextVar("run_stdout", default=None)
+_stdout_lock = threading.Lock()
+# Limits are only armed in pool workers, where init_worker installed handlers.
+_limits_installed = False
+
+
+class ExecutionLimitExceeded(BaseException):
+    """Raised by the limit signal handlers; a BaseException so generated
+    ``except Exception`` blocks can't swallow it."""
+
+
+def _preload() -> Dict[str, Any]:
+    """Import the modules generated code usually needs, once per process."""
+    if _preloaded:
+        return _preloaded
+    import asyncio
+    import collections
+    import datetime
+    import re
+    import statistics
+
+    import bson
+    import pymongo
+
+    _preloaded.update(
+        asyncio=asyncio,
+        collections=collections,
+        datetime=datetime,
+        json=json,
+        math=math,
+        re=re,
+        statistics=statistics,
+        bson=bson,
+        pymongo=pymongo,
+    )
+    try:
+        import pandas
+
+        _preloaded["pd"] = _preloaded["pandas"] = pandas
+    except ImportError:
+        pass
+    return _preloaded
+
+
+def load_schema(db) -> Dict[str, list]:
+    """Top-level field names of one document per collection."""
+    schema = {}
+    for name in ("accounts", "customers", "transactions"):
+        sample = db[name].find_one() or {}
+        schema[name] = sorted(sample.keys())
+    return schema
+
+
+def init_worker(mongo_url: Optional[str], memory_mb: int) -> None:
+    """Process-pool initializer: heavy imports, Mongo connection and schema."""
+    global _limits_installed
+    _preload()
+    client = mongo.init_client(mongo_url)
+    try:
+        _preloaded["schema"] = load_schema(client[DATABASE_NAME])
+    except Exception as e:
+        print(f"⚠️ Executor worker could not load schema: {e}")
+    if resource is not None and memory_mb > 0:
+        limit = memory_mb * 1024 * 1024
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    if hasattr(signal, "SIGALRM"):
+        signal.signal(signal.SIGALRM, _on_limit)
+    if resource is not None:
+        signal.signal(signal.SIGXCPU, _on_limit)
+    _limits_installed = True
+
+
+def ping() -> int:
+    """No-op task used to spawn and warm workers."""
+    return os.getpid()
+
+
+def _on_limit(signum, frame):
+    kind = "time" if signum == getattr(signal, "SIGALRM", None) else "CPU"
+    raise ExecutionLimitExceeded(f"Execution exceeded its {kind} limit")
+
+
+def _can_use_signals() -> bool:
+    return _limits_installed and threading.current_thread() is threading.main_thread()
+
+
+def _arm_limits(timeout: float, cpu_seconds: float) -> None:
+    if not _can_use_signals():
+        return
+    if timeout > 0 and hasattr(signal, "setitimer"):
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    if resource is not None and cpu_seconds > 0:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        used = usage.ru_utime + usage.ru_stime
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        soft = math.ceil(used + cpu_seconds)
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _disarm_limits() -> None:
+    if not _can_use_signals():
+        return
+    if hasattr(signal, "setitimer"):
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    if resource is not None:
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+
+
+class _StdoutRouter(io.TextIOBase):
+    """sys.stdout stand-in that sends each run's prints to that run's buffer.
+
+    Unlike redirect_stdout, which swaps the process-wide sys.stdout, this
+    keeps output apart when inline runs overlap in threads.
+    """
+
+    def __init__(self, default):
+        self.default = default
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        buffer = _run_stdout.get()
+        return (buffer if buffer is not None else self.default).write(text)
+
+    def flush(self) -> None:
+        if _run_stdout.get() is None:
+            self.default.flush()
+
+
+@contextmanager
+def _capture_stdout(buffer: io.StringIO):
+    with _stdout_lock:
+        if not isinstance(sys.stdout, _StdoutRouter):
+            sys.stdout = _StdoutRouter(sys.stdout)
+    token = _run_stdout.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _run_stdout.reset(token)
+
+
+def to_plain(value: Any) -> Any:
+    """JSON-safe copy of a result (ObjectIds, datetimes and Decimals become strings)."""
+    return json.loads(json.dumps(value, default=str))
+
+
+def executor_namespace() -> Dict[str, Any]:
+    """Fresh globals for one run: preloaded modules plus ``client``/``db`` on the shared pool.
+
+    ``afind``/``aaggregate`` are the awaitable helpers; programs that use
+    ``await`` also get ``adb``, the Motor database. ``analytics_query`` runs
+    SQL over the columnar snapshot.
+    """
+    client = SharedClientProxy(mongo.get_client())
+    return {
+        "__name__": "__generated__",
+        **_preload(),
+        "client": client,
+        "db": client[DATABASE_NAME],
+        "summarize_results": summarize_results,
+        "afind": async_mongo.find,
+        "aaggregate": async_mongo.aggregate,
+        "analytics_query": analytics.query,
+    }
+
+
+def run_code(code: str, timeout: float = 0, cpu_seconds: float = 0) -> Dict[str, Any]:
+    """Execute one generated program and report its stdout, error and database_results.
+
+    Large results come back as a digest (see ``results.bound_results``), with
+    the rows kept for paging in ``result_rows``. The Mongo commands the
+    program ran are timed and returned in ``mongo_commands``.
+    """
+    stdout = io.StringIO()
+    error = ""
+    has_results = False
+    results = None
+    result_rows = None
+    commands = []
+    collecting = mongo.collected_commands.set(commands)
+    start = time.perf_counter()
+    namespace = executor_namespace()
+    _arm_limits(timeout, cpu_seconds)
+    try:
+        with _capture_stdout(stdout):
+            compiled = compile(
+                code, "<generated>", "exec", flags=ast.PyCF_ALLOW_TOP_LEVEL_AWAIT
+            )
+            if compiled.co_flags & inspect.CO_COROUTINE:
+                namespace["adb"] = async_mongo.get_database(
+                    async_mongo.background_loop()
+                )
+                async_mongo.run_sync(eval(compiled, namespace))
+            else:
+                exec(compiled, namespace)
+            if "database_results" in namespace:
+                # Still under the limits: digesting may iterate a live cursor
+                value, rows = bound_results(namespace["database_results"])
+                results = to_plain(value)
+                result_rows = to_plain(rows) if rows is not None else None
+                has_results = True
+        _disarm_limits()
+    except (Exception, ExecutionLimitExceeded) as e:
+        _disarm_limits()
+        error = str(e) or type(e).__name__
+    mongo.collected_commands.reset(collecting)
+    return {
+        "stdout": stdout.getvalue(),
+        "stderr": error,
+        "has_results": has_results,
+        "database_results": results,
+        "result_rows": result_rows,
+        "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+        "mongo_commands": commands,
+    }
@@ -0,0 +1,174 @@
+"""Keeps the conversation history sent to the model flat as sessions grow.
+
+After every turn ``add_turn`` appends a one-line summary (question and the
+start of the answer) to the ``history`` state key. ``compact_history`` is a
+``before_model_callback``: it keeps the last ``keep_turns`` turns of the
+request verbatim, replaces everything older with the running summary, cuts
+large blobs (database_results, executed code and its output) in earlier turns
+down to short digests, and enforces a token budget on the whole history.
+"""
+
+import os
+import re
+from typing import Callable, Dict, List, Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai import types
+
+HISTORY_KEY = "history"
+# Text ADK puts first in other agents' replies when it replays them as user content
+_FOREIGN_PREFIX = "For context:"
+# ...and around executed code's output for agents with a code executor
+_EXECUTION_PREFIX = "```tool_output"
+# Rough tokens-per-character ratio for budgeting without a tokenizer round trip
+_CHARS_PER_TOKEN = 4
+
+
+def history_settings() -> Dict[str, int]:
+    return {
+        "keep_turns": int(os.getenv("HISTORY_KEEP_TURNS", "3")),
+        "token_budget": int(os.getenv("HISTORY_TOKEN_BUDGET", "6000")),
+        "part_chars": int(os.getenv("HISTORY_PART_CHARS", "600")),
+        "summary_turns": int(os.getenv("HISTORY_SUMMARY_TURNS", "50")),
+    }
+
+
+def _clip(text: str, limit: int) -> str:
+    text = re.sub(r"\s+", " ", text or "").strip()
+    return text if len(text) <= limit else text[: limit - 1].rstrip() + "…"
+
+
+def add_turn(history: Optional[List[Dict]], question: str, answer: str) -> List[Dict]:
+    """The ``history`` state value with one more summarized turn."""
+    entries = list(history or [])
+    entries.append({"q": _clip(question, 200), "a": _clip(answer, 300)})
+    return entries[-history_settings()["summary_turns"] :]
+
+
+def _is_user_message(content: types.Content) -> bool:
+    """A message the user typed, not a replayed agent reply or tool output."""
+    if content.role != "user" or not content.parts:
+        return False
+    first = content.parts[0]
+    return bool(first.text) and not first.text.startswith(
+        (_FOREIGN_PREFIX, _EXECUTION_PREFIX)
+    )
+
+
+def _tokens(contents: List[types.Content]) -> int:
+    chars = 0
+    for content in contents:
+        for part in content.parts or []:
+            chars += len(part.text or "")
+            if part.executable_code:
+                chars += len(part.executable_code.code or "")
+            if part.code_execution_result:
+                chars += len(part.code_execution_result.output or "")
+    return chars // _CHARS_PER_TOKEN
+
+
+def _digest_part(part: types.Part, limit: int) -> types.Part:
+    """Shorten one part of an earlier turn; small parts are returned unchanged."""
+    if part.executable_code:
+        return types.Part(text="[ran generated query code]")
+    if part.code_execution_result:
+        output = part.code_execution_result.output or ""
+        return types.Part(text=f"[query output: {_clip(output, limit)}]")
+    if part.text and len(part.text) > limit:
+        return types.Part(
+            text=f"{part.text[:limit].rstrip()}… [{len(part.text) - limit:,} characters omitted]"
+        )
+    return part
+
+
+def _summary_content(entries: List[Dict], omitted: int) -> Optional[types.Content]:
+    if not entries and not omitted:
+        return None
+    lines = ["Summary of the earlier conversation:"]
+    if omitted:
+        lines.append(f"({omitted} earlier turns not shown)")
+    for entry in entries:
+        lines.append(f"- User asked: {entry['q']} | Answer: {entry['a']}")
+    return types.Content(role="user", parts=[types.Part(text="\n".join(lines))])
+
+
+def compact_contents(
+    contents: List[types.Content],
+    history: List[Dict],
+    keep_turns: int = 3,
+    token_budget: int = 6000,
+    part_chars: int = 600,
+) -> List[types.Content]:
+    """History compaction on request contents; the current turn is never changed."""
+    starts = [i for i, content in enumerate(contents) if _is_user_message(content)]
+    if not starts:
+        return contents
+    current = contents[starts[-1] :]
+    # Earlier turns, oldest first, each a list of contents
+    bounds = starts + [starts[-1]]
+    turns = [contents[bounds[i] : bounds[i + 1]] for i in range(len(starts) - 1)]
+    preamble = contents[: starts[0]]
+
+    kept = [
+        [
+            types.Content(
+                role=content.role,
+                parts=[_digest_part(part, part_chars) for part in content.parts or []],
+            )
+            for content in turn
+        ]
+        for turn in (turns[-keep_turns:] if keep_turns > 0 else [])
+    ]
+    # Everything the verbatim turns don't cover comes from the running summary;
+    # the last history entries are the kept turns themselves.
+    summarized = history[: max(len(history) - len(kept), 0)]
+    omitted = 0
+
+    def build():
+        summary = _summary_content(summarized, omitted)
+        return (
+            preamble
+            + ([summary] if summary else [])
+            + [content for turn in kept for content in turn]
+            + current
+        )
+
+    result = build()
+    budget = token_budget + _tokens(current)
+    # Over budget: drop the oldest summary lines, then the oldest verbatim turns
+    while _tokens(result) > budget and (summarized or kept):
+        if summarized:
+            summarized = summarized[1:]
+        else:
+            kept = kept[1:]
+        omitted += 1
+        result = build()
+    return result
+
+
+def compact_history(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> Optional[LlmResponse]:
+    """before_model_callback that compacts the request's conversation history."""
+    settings = history_settings()
+    llm_request.contents = compact_contents(
+        llm_request.contents,
+        callback_context.state.get(HISTORY_KEY) or [],
+        settings["keep_turns"],
+        settings["token_budget"],
+        settings["part_chars"],
+    )
+    return None
+
+
+def with_compaction(callback: Callable) -> Callable:
+    """Compact history, then run another before_model_callback."""
+
+    def compact_then(
+        callback_context: CallbackContext, llm_request: LlmRequest
+    ) -> Optional[LlmResponse]:
+        compact_history(callback_context, llm_request)
+        return callback(callback_context, llm_request)
+
+    return compact_then
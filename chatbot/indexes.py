@@ -0,0 +1,471 @@
+"""Index advisor for the queries generated code runs against sample_analytics.
+
+Executor runs report their find/aggregate/count/distinct commands (see
+``mongo.CommandTimer``). ``IndexAdvisor.observe`` reduces each one to a shape:
+the collection plus the fields it matches by equality, sorts on and matches by
+range (for pipelines, the leading ``$match``/``$sort`` stages, which are the
+only ones an index can serve). A background loop runs ``explain`` on new
+shapes, flags COLLSCANs and in-memory sorts, and ranks index suggestions by
+the Mongo time spent in those shapes.
+
+Suggested keys follow the equality, sort, range rule and keep at most one
+array per compound index, as Mongo can't index parallel arrays (array fields
+come from the schema catalog). Fields under the dynamic keys of
+``tier_and_details`` get a wildcard index instead. With ``INDEX_AUTO_CREATE``
+on, the top suggestions seen at least ``INDEX_MIN_OBSERVATIONS`` times are
+created, up to ``INDEX_AUTO_CREATE_MAX``.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from . import catalog
+from . import mongo
+from .catalog import DYNAMIC_KEY
+
+_READ_COMMANDS = ("find", "aggregate", "count", "distinct")
+_EQUALITY_OPERATORS = {"$eq", "$in", "$all"}
+_RANGE_OPERATORS = {
+    "$gt",
+    "$gte",
+    "$lt",
+    "$lte",
+    "$ne",
+    "$nin",
+    "$regex",
+    "$exists",
+    "$type",
+    "$not",
+}
+_INDEX_STAGES = {"IXSCAN", "IDHACK", "COUNT_SCAN", "DISTINCT_SCAN"}
+
+
+def index_settings() -> Dict[str, Any]:
+    return {
+        "enabled": os.getenv("INDEX_ADVISOR_ENABLED", "1").lower()
+        in ("1", "true", "yes"),
+        "interval": float(os.getenv("INDEX_ADVISOR_INTERVAL", "60")),
+        "auto_create": os.getenv("INDEX_AUTO_CREATE", "0").lower()
+        in ("1", "true", "yes"),
+        "min_observations": int(os.getenv("INDEX_MIN_OBSERVATIONS", "3")),
+        "max_auto_indexes": int(os.getenv("INDEX_AUTO_CREATE_MAX", "5")),
+        "max_shapes": int(os.getenv("INDEX_MAX_SHAPES", "500")),
+        # Seconds before an explained shape is explained again
+        "reexplain_after": float(os.getenv("INDEX_REEXPLAIN_AFTER", "3600")),
+    }
+
+
+def _is_operators(value: Any) -> bool:
+    return (
+        isinstance(value, dict)
+        and bool(value)
+        and all(str(key).startswith("$") for key in value)
+    )
+
+
+def _filter_fields(
+    query: Dict[str, Any], prefix: str, equality: List[str], ranges: List[str]
+) -> None:
+    """Add the paths ``query`` matches by equality and by range to the two lists."""
+    for key, value in query.items():
+        if key == "$and":
+            for clause in value if isinstance(value, list) else []:
+                if isinstance(clause, dict):
+                    _filter_fields(clause, prefix, equality, ranges)
+            continue
+        if key.startswith("$"):
+            # $or/$nor need an index per branch; $expr and $text can't use these
+            continue
+        path = prefix + key
+        if not _is_operators(value):
+            equality.append(path)
+            continue
+        match = value.get("$elemMatch")
+        if isinstance(match, dict):
+            if _is_operators(match):
+                _filter_fields({key: match}, prefix, equality, ranges)
+            else:
+                _filter_fields(match, path + ".", equality, ranges)
+        if _EQUALITY_OPERATORS & set(value):
+            equality.append(path)
+        elif _RANGE_OPERATORS & set(value):
+            ranges.append(path)
+
+
+def _wildcard(path: str) -> Optional[str]:
+    """``a.$**`` for a path through a dynamic key (``a.<id>.b``), else None."""
+    parts = path.split(".")
+    for i, part in enumerate(parts):
+        if DYNAMIC_KEY.match(part):
+            return ".".join(parts[:i] + ["$**"])
+    return None
+
+
+def _read_query(query: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """(filter, sort) an index could serve for a recorded find/aggregate/count query."""
+    if "pipeline" not in query:
+        return query.get("filter") or {}, query.get("sort") or {}
+    clauses, sort = [], {}
+    for stage in query["pipeline"]:
+        if not isinstance(stage, dict) or len(stage) != 1:
+            break
+        name, spec = next(iter(stage.items()))
+        # Mongo moves a $match ahead of a $sort, so both can lead
+        if name == "$match" and isinstance(spec, dict):
+            clauses.append(spec)
+        elif name == "$sort" and not sort and isinstance(spec, dict):
+            sort = spec
+        else:
+            break
+    if len(clauses) > 1:
+        return {"$and": clauses}, sort
+    return (clauses[0] if clauses else {}), sort
+
+
+def query_shape(record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The indexable shape of a recorded read command, or None if it has none."""
+    query = record.get("query")
+    collection = record.get("collection")
+    if not query or not collection or record["command"] not in _READ_COMMANDS:
+        return None
+    filter_, sort = _read_query(query)
+    equality: List[str] = []
+    ranges: List[str] = []
+    _filter_fields(filter_, "", equality, ranges)
+    wildcards = {_wildcard(path) for path in equality + ranges} - {None}
+    equality = sorted({path for path in equality if _wildcard(path) is None})
+    ranges = sorted(
+        {path for path in ranges if _wildcard(path) is None} - set(equality)
+    )
+    sort_fields = [
+        (field, direction)
+        for field, direction in sort.items()
+        if direction in (1, -1) and _wildcard(field) is None
+    ]
+    if not (equality or ranges or sort_fields or wildcards):
+        return None
+    return {
+        "collection": collection,
+        "equality": equality,
+        "sort": sort_fields,
+        "range": ranges,
+        "wildcards": sorted(wildcards),
+        "example": {"filter": filter_, "sort": sort},
+    }
+
+
+def _array_paths(collection: str) -> set:
+    """Dotted paths the schema catalog has seen holding arrays."""
+    info = catalog.catalog.collections_info.get(collection)
+    if not info:
+        return set()
+    return {
+        path.replace("[]", "") for path, stats in info["fields"].items() if stats.arrays
+    }
+
+
+def _array_root(path: str, arrays: set) -> Optional[str]:
+    parts = path.split(".")
+    for i in range(1, len(parts) + 1):
+        if ".".join(parts[:i]) in arrays:
+            return ".".join(parts[:i])
+    return None
+
+
+def suggest_key(shape: Dict[str, Any], arrays: set) -> Tuple[list, bool]:
+    """(ESR-ordered index key, whether it is multikey) for a shape.
+
+    Fields under a second, parallel array are left out so the index can be built.
+    """
+    fields = [(path, 1) for path in shape["equality"]] + list(shape["sort"])
+    fields += [(path, 1) for path in shape["range"]]
+    key, seen, root = [], set(), None
+    for path, direction in fields:
+        if path in seen:
+            continue
+        array = _array_root(path, arrays)
+        if array is not None:
+            if root not in (None, array):
+                continue
+            root = array
+        seen.add(path)
+        key.append((path, direction))
+    return key, root is not None
+
+
+def _stages(plan: Any) -> Iterable[Dict[str, Any]]:
+    """Every stage in an explain plan tree (classic or slot-based format)."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _stages(value)
+
+
+def _winning_plan(explain: Any) -> Optional[Dict[str, Any]]:
+    if isinstance(explain, dict):
+        if "winningPlan" in explain:
+            return explain["winningPlan"]
+        values = explain.values()
+    elif isinstance(explain, list):
+        values = explain
+    else:
+        return None
+    for value in values:
+        plan = _winning_plan(value)
+        if plan is not None:
+            return plan
+    return None
+
+
+class IndexAdvisor:
+    """Query shapes seen in generated code, their plans and index suggestions."""
+
+    def __init__(self, enabled: bool = True, max_shapes: int = 500):
+        self.enabled = enabled
+        self.max_shapes = max_shapes
+        self.created: List[Dict[str, Any]] = []
+        self._shapes: Dict[tuple, Dict[str, Any]] = {}
+        self._pending: set = set()
+        self._existing: Dict[str, List[list]] = {}
+        self._failed: set = set()
+        self._lock = threading.Lock()
+
+    def observe(self, records: List[Dict[str, Any]]) -> None:
+        """Count the read commands of one executor run against their shapes."""
+        if not self.enabled:
+            return
+        for record in records:
+            if record.get("database") != mongo.DATABASE_NAME or record["failed"]:
+                continue
+            shape = query_shape(record)
+            if shape is None:
+                continue
+            key = (
+                shape["collection"],
+                tuple(shape["equality"]),
+                tuple(shape["sort"]),
+                tuple(shape["range"]),
+                tuple(shape["wildcards"]),
+            )
+            with self._lock:
+                stats = self._shapes.get(key)
+                if stats is None:
+                    if len(self._shapes) >= self.max_shapes:
+                        oldest = min(
+                            self._shapes, key=lambda k: self._shapes[k]["last_seen"]
+                        )
+                        del self._shapes[oldest]
+                        self._pending.discard(oldest)
+                    stats = self._shapes[key] = dict(
+                        shape,
+                        count=0,
+                        total_ms=0.0,
+                        documents=0,
+                        plan=None,
+                        indexes=[],
+                        in_memory_sort=False,
+                        explained_at=None,
+                        error=None,
+                    )
+                    self._pending.add(key)
+                stats["count"] += 1
+                stats["total_ms"] += (record["end_ns"] - record["start_ns"]) / 1e6
+                stats["documents"] += record["documents"] or 0
+                stats["last_seen"] = time.time()
+
+    def explain_pending(self, reexplain_after: float = 3600, db=None) -> int:
+        """Explain new and stale shapes; blocking, returns how many were explained."""
+        db = db if db is not None else mongo.get_database()
+        now = time.time()
+        with self._lock:
+            keys = set(self._pending)
+            keys.update(
+                key
+                for key, stats in self._shapes.items()
+                if stats["explained_at"] is not None
+                and now - stats["explained_at"] > reexplain_after
+            )
+            self._pending.clear()
+            work = [(key, self._shapes[key]) for key in keys if key in self._shapes]
+        for collection in {stats["collection"] for _, stats in work}:
+            try:
+                self._existing[collection] = [
+                    list(info["key"])
+                    for info in db[collection].index_information().values()
+                ]
+            except Exception:
+                pass
+        for key, stats in work:
+            command = {
+                "find": stats["collection"],
+                "filter": stats["example"]["filter"],
+            }
+            if stats["example"]["sort"]:
+                command["sort"] = stats["example"]["sort"]
+            try:
+                explain = db.command("explain", command, verbosity="queryPlanner")
+            except Exception as e:
+                with self._lock:
+                    stats.update(error=str(e), explained_at=now)
+                continue
+            stages = list(_stages(_winning_plan(explain)))
+            names = {stage["stage"] for stage in stages}
+            if "COLLSCAN" in names:
+                plan = "COLLSCAN"
+            elif names & _INDEX_STAGES:
+                plan = "IXSCAN"
+            else:
+                plan = "+".join(sorted(names)) or None
+            if plan == "COLLSCAN" and stats["plan"] != "COLLSCAN":
+                fields = stats["equality"] + [f for f, _ in stats["sort"]]
+                fields += stats["range"] + stats["wildcards"]
+                print(f"📝 COLLSCAN on {stats['collection']} for {', '.join(fields)}")
+            with self._lock:
+                stats.update(
+                    plan=plan,
+                    indexes=sorted(
+                        {s["indexName"] for s in stages if "indexName" in s}
+                    ),
+                    in_memory_sort="SORT" in names,
+                    explained_at=now,
+                    error=None,
+                )
+        return len(work)
+
+    def _served(self, collection: str, key: list) -> bool:
+        """Whether an existing index already starts with ``key``."""
+        return any(
+            [tuple(field) for field in index[: len(key)]] == key
+            for index in self._existing.get(collection, [])
+        )
+
+    def suggestions(self) -> List[Dict[str, Any]]:
+        """Indexes for the shapes planned as COLLSCANs or in-memory sorts, costliest first."""
+        with self._lock:
+            shapes = [dict(stats) for stats in self._shapes.values()]
+        merged: Dict[tuple, Dict[str, Any]] = {}
+        for shape in shapes:
+            if shape["plan"] != "COLLSCAN" and not shape["in_memory_sort"]:
+                continue
+            key, multikey = suggest_key(shape, _array_paths(shape["collection"]))
+            candidates = [(key, multikey)] if key else []
+            candidates += [([(path, 1)], False) for path in shape["wildcards"]]
+            for key, multikey in candidates:
+                entry = merged.setdefault(
+                    (shape["collection"], tuple(key)),
+                    {
+                        "collection": shape["collection"],
+                        "key": key,
+                        "multikey": multikey,
+                        "shapes": 0,
+                        "count": 0,
+                        "total_ms": 0.0,
+                        "documents": 0,
+                    },
+                )
+                entry["shapes"] += 1
+                entry["count"] += shape["count"]
+                entry["total_ms"] += shape["total_ms"]
+                entry["documents"] += shape["documents"]
+        # A compound index also serves queries on any prefix of its key
+        entries = sorted(merged.values(), key=lambda e: len(e["key"]), reverse=True)
+        kept: List[Dict[str, Any]] = []
+        for entry in entries:
+            wider = next(
+                (
+                    other
+                    for other in kept
+                    if other["collection"] == entry["collection"]
+                    and other["key"][: len(entry["key"])] == entry["key"]
+                ),
+                None,
+            )
+            if wider is not None:
+                for field in ("shapes", "count", "total_ms", "documents"):
+                    wider[field] += entry[field]
+            elif not self._served(entry["collection"], entry["key"]):
+                kept.append(entry)
+        for entry in kept:
+            entry["kind"] = (
+                "wildcard"
+                if entry["key"][0][0].endswith("$**")
+                else "compound" if len(entry["key"]) > 1 else "single"
+            )
+            entry["total_ms"] = round(entry["total_ms"], 1)
+        return sorted(kept, key=lambda e: (e["total_ms"], e["count"]), reverse=True)
+
+    def create_suggested(self, min_observations: int = 3, limit: int = 5, db=None):
+        """Create the top suggestions seen often enough, up to ``limit`` in total."""
+        db = db if db is not None else mongo.get_database()
+        for suggestion in self.suggestions():
+            if len(self.created) >= limit:
+                return
+            marker = (suggestion["collection"], tuple(suggestion["key"]))
+            if suggestion["count"] < min_observations or marker in self._failed:
+                continue
+            try:
+                name = db[suggestion["collection"]].create_index(suggestion["key"])
+            except Exception as e:
+                self._failed.add(marker)
+                print(f"⚠️ Could not create index {suggestion['key']}: {e}")
+                continue
+            print(f"⚡ Created index {name} on {suggestion['collection']}")
+            self.created.append(
+                {
+                    "collection": suggestion["collection"],
+                    "name": name,
+                    "key": suggestion["key"],
+                    "created_at": time.time(),
+                }
+            )
+            self._existing.setdefault(suggestion["collection"], []).append(
+                list(suggestion["key"])
+            )
+            with self._lock:
+                self._pending.update(
+                    key for key in self._shapes if key[0] == suggestion["collection"]
+                )
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            shapes = list(self._shapes.values())
+        return {
+            "enabled": self.enabled,
+            "shapes": len(shapes),
+            "explained": sum(1 for s in shapes if s["explained_at"] is not None),
+            "collscans": sum(1 for s in shapes if s["plan"] == "COLLSCAN"),
+            "in_memory_sorts": sum(1 for s in shapes if s["in_memory_sort"]),
+            "suggestions": self.suggestions(),
+            "created": list(self.created),
+        }
+
+
+index_advisor = IndexAdvisor(
+    enabled=index_settings()["enabled"], max_shapes=index_settings()["max_shapes"]
+)
+
+
+async def advisor_loop(interval: float) -> None:
+    """Explain new query shapes every ``interval`` seconds and create indexes if enabled."""
+    settings = index_settings()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await mongo.run_blocking(
+                index_advisor.explain_pending, settings["reexplain_after"]
+            )
+            if settings["auto_create"]:
+                await mongo.run_blocking(
+                    index_advisor.create_suggested,
+                    settings["min_observations"],
+                    settings["max_auto_indexes"],
+                )
+        except Exception as e:
+            print(f"⚠️ Index advisor failed: {e}")
@@ -0,0 +1,62 @@
+"""Model objects used by the agents."""
+
+import os
+from typing import AsyncGenerator, Callable, Dict
+
+from google.adk.models import BaseLlm, Gemini, LlmRequest, LlmResponse
+
+from .scheduler import scheduler
+
+# LLM_BACKEND name -> factory(model name) for backends other than Gemini
+BACKENDS: Dict[str, Callable[[str], BaseLlm]] = {}
+
+
+def register_backend(name):
+    """Decorator registering ``factory(model_name) -> BaseLlm`` as an LLM backend."""
+
+    def decorator(factory):
+        BACKENDS[name] = factory
+        return factory
+
+    return decorator
+
+
+class ThrottledGemini(Gemini):
+    """Gemini model whose calls share the scheduler's global "llm" slots."""
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        # ADK runs the after_model callbacks (which may execute the response's
+        # code) while this generator is suspended at a yield, so the last
+        # complete response is only yielded once the slot is released.
+        held = None
+        async with scheduler.stage("llm"):
+            async for response in super().generate_content_async(llm_request, stream):
+                if held is not None:
+                    yield held
+                    held = None
+                if response.partial:
+                    yield response
+                else:
+                    held = response
+        if held is not None:
+            yield held
+
+
+def build_model(name: str):
+    """The model instance an agent should use for ``name``.
+
+    Any other ``LLM_BACKEND`` must have been registered with
+    ``register_backend`` first; the benchmarks register their offline
+    ``stub`` model (bench/stub_llm.py) before importing the app.
+    """
+    backend = os.getenv("LLM_BACKEND", "gemini").lower()
+    if backend == "gemini":
+        return ThrottledGemini(model=name)
+    if backend not in BACKENDS:
+        raise ValueError(
+            f"Unknown LLM_BACKEND {backend!r}; registered: gemini, "
+            + ", ".join(sorted(BACKENDS))
+        )
+    return BACKENDS[backend](name)
@@ -7,21 +7,13 @@ from google.genai import types
 from google.adk.artifacts import InMemoryArtifactService
 from google.adk.agents import LiveRequestQueue
 from google.adk.agents.run_config import RunConfig, StreamingMode
-import google.generativeai as genai
+from google.adk.events import Event, EventActions
 import asyncio
 import uuid
 import os
-import psycopg2
-import mysql.connector
 from dotenv import load_dotenv
-import duckdb
-import pprint
-import pandas as pd
 import re
-from google.adk.agents import LiveRequestQueue
-from google.genai import types
-import google.generativeai as genai
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Callable, Awaitable
 import json  # For handling JSON data if your agent produces chart data
 from fastapi import (
     FastAPI,
@@ -31,34 +23,55 @@ from fastapi import (
     Depends,
     APIRouter,
 )
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 from google.genai.types import Part, Content
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy import text
 from datetime import date, datetime
-import os
-from pymongo import MongoClient
+from contextlib import asynccontextmanager
+from opentelemetry import context as trace_context
+
+from .answer_cache import (
+    answer_cache_from_env,
+    collections_in_code,
+    conversation_key,
+    COLLECTIONS,
+)
+from .plan_cache import PlanCache
+from .executor import MongoCodeExecutor, executor_pool, run_generated_code
+from .llm import build_model
+from .scheduler import scheduler, QueueFull
+from . import router
+from . import views
+from . import analytics
+from . import catalog
+from . import indexes
+from . import history
+from . import tracing
+from . import mongo
+from . import async_mongo
+from . import startup
+from .results import is_digest, result_store
+from .session_store import (
+    StoredSessionService,
+    eviction_loop,
+    session_service_from_env,
+    session_settings,
+)
 
 load_dotenv()  # This loads variables from .env into the environment
 MONGODB_URL = os.getenv("MONGODB_URL")
+tracing.setup()
 
 
 if not MONGODB_URL:
     raise EnvironmentError("Environment variable MONGODB_URL not set in .env")
 
 
-def get_few_users_from_sample_analytics(limit=5):
+async def get_few_users_from_sample_analytics(limit=5):
     """Fetch a few documents from the customers collection in sample_analytics as plain dictionaries."""
-    client = MongoClient(MONGODB_URL)
-    db = client.sample_analytics
-    customers = db.customers
-
-    documents = []
-    for doc in customers.find().limit(limit):
+    documents = await async_mongo.find("customers", limit=limit, batch_size=limit)
+    for doc in documents:
         doc["_id"] = str(doc["_id"])  # convert ObjectId to str
-        documents.append(doc)
     return documents
 
 
@@ -163,12 +176,14 @@ def get_few_users_from_sample_analytics(limit=5):
 #     output_key="summary",
 # )
 
+# Shared by the agents that run code; its prefetch callback keeps runs off the event loop
+mongo_code_executor = MongoCodeExecutor()
 
 query_planner_agent = LlmAgent(
     name="query_planner_agent",
-    model="gemini-2.0-flash",
+    model=build_model("gemini-2.0-flash"),
     description="plans the mongodb query as per user questions",
-    instruction="""
+    instruction=catalog.with_catalog("""
         You are a query planning specialist for MongoDB analytics. Your job is to analyze user questions about the sample_analytics database and create a detailed execution plan.
         The database contains three collections with nested structures:
 
@@ -194,38 +209,45 @@ query_planner_agent = LlmAgent(
         Expected output format
 
         Your plan should be detailed enough for the next agent to build the actual MongoDB query.
-    """,
+    """ + views.prompt_section() + analytics.prompt_section()),
+    before_model_callback=[history.compact_history, tracing.start_model_timer],
+    after_model_callback=tracing.record_model_call,
     output_key="plan",
 )
 
 query_builder_agent = LlmAgent(
     name="query_builder_agent",
-    model="gemini-2.0-flash",
+    model=build_model("gemini-2.0-flash"),
     description="Connects to MongoDB and retrieves data based on user queries",
     instruction="""
         You are a Python MongoDB query construction specialist. You receive a detailed {plan} from the query planner and build actual Python code using PyMongo to execute against the MongoDB cluster.
         Use the {plan} plan variable that contains the execution strategy from the previous agent. You have access to UnsafeLocalCodeExecutor to run Python code that connects to the MongoDB cluster.
-        The MongoDB connection URL is stored in the environment variable MONGODB_URL. Use PyMongo library to connect to the sample_analytics database and execute queries on the accounts, customers, and transactions collections.
+        Your code runs with an already-connected, pooled PyMongo client. The variable db is the sample_analytics database (client is the MongoClient itself). Use them to execute queries on the accounts, customers, and transactions collections.
         Based on the plan, write Python code using PyMongo syntax that:
 
-        Imports necessary libraries (pymongo, os, datetime, etc.)
-        Connects to MongoDB using: client = pymongo.MongoClient(os.getenv('MONGODB_URL'))
-        Accesses the database: db = client.sample_analytics
+        Imports necessary libraries (datetime, etc.)
+        Uses the existing db variable directly. Do NOT create a new MongoClient and do NOT close the client.
         Uses PyMongo methods like db.collection.find(), db.collection.aggregate(), etc.
+        For several independent queries, may instead use top-level await with the async helpers: await afind("collection", filter, projection, sort=[...], limit=n) and await aaggregate("collection", pipeline) return lists, and asyncio.gather runs them concurrently (adb is the Motor database)
         Handles nested fields like tier_and_details objects, transactions arrays, and date objects
         Uses appropriate PyMongo operators and syntax (not JavaScript MongoDB syntax)
-        Converts results to Python lists/dicts using list(cursor) when needed
+        Converts results to Python lists/dicts using list(cursor) when needed, but for queries that can return many documents assigns database_results = summarize_results(cursor) instead, which reads the cursor in batches and keeps only a sample of rows plus counts, min/max/mean and top values per field
         Stores results in a variable called database_results
+        Prints at most a few rows; large results are summarized automatically and the output will end with a "database_results digest:" line
+
+        If the output contains a database_results digest, reply with that digest JSON unchanged.
 
         You MUST use UnsafeLocalCodeExecutor tool to run your Python code. Execute the code immediately after writing it to get the actual query results from the MongoDB database. Do NOT generate JavaScript MongoDB queries - only Python PyMongo code. The database_results variable from your code execution will be passed to the next agent.
-    """,
-    code_executor=UnsafeLocalCodeExecutor(),
+    """ + views.prompt_section() + analytics.prompt_section(),
+    code_executor=mongo_code_executor,
+    before_model_callback=[history.compact_history, tracing.start_model_timer],
+    after_model_callback=[tracing.record_model_call, mongo_code_executor.prefetch],
     output_key="database_results",
 )
 
 query_answerer_agent = LlmAgent(
     name="query_answerer_agent",
-    model="gemini-2.0-flash",
+    model=build_model("gemini-2.0-flash"),
     description="Provides natural language responses based on database query results",
     instruction="""
         You are a data analyst who interprets MongoDB query results and provides clear, user-friendly answers.
@@ -240,10 +262,44 @@ query_answerer_agent = LlmAgent(
 
         Make your response accessible to users who may not be familiar with database structures. Focus on answering their original question directly while highlighting any interesting insights found in the data.
         If the results are empty or indicate an error, explain what might have gone wrong and suggest alternative approaches.
+        If database_results is a digest ("digest": true), rows holds only the first rows of a larger result: use row_count and the per-field statistics in fields for totals and distributions, say the answer is based on a summary, and mention that the full result can be paged with its handle.
     """,
+    before_model_callback=[history.compact_history, tracing.start_model_timer],
+    after_model_callback=tracing.record_model_call,
     output_key="response",
 )
 
+query_fast_agent = LlmAgent(
+    name="query_fast_agent",
+    model=build_model("gemini-2.0-flash"),
+    description="Plans and runs simple single-collection MongoDB lookups in one step",
+    instruction=catalog.with_catalog("""
+        You answer simple lookup, filter and count questions about the sample_analytics MongoDB database by writing and running one short Python PyMongo program.
+        The database contains three collections with nested structures:
+
+        accounts: Contains account_id, limit, and products (array)
+        customers: Contains username, name, address, birthdate (date object), email, accounts (array), and tier_and_details (nested object with dynamic keys containing tier, benefits array, active status, and id)
+        transactions: Contains account_id, transaction_count, bucket dates (date objects), and transactions (array of objects with date, amount, transaction_code, symbol, price, total)
+
+        Your code runs with an already-connected, pooled PyMongo client. The variable db is the sample_analytics database. Do NOT create a new MongoClient and do NOT close the client.
+        Write the program directly, without a separate plan:
+
+        Query a single collection with db.collection.find(), count_documents() or a short aggregate() pipeline
+        Use $unwind or $elemMatch for the transactions array and $objectToArray for the dynamic keys of tier_and_details
+        Store a small result in a variable called database_results: a number for counts, a dict for a single document, or a list of at most 20 documents with only the fields the question needs (exclude _id)
+        End the program with: print(json.dumps(database_results, default=str))
+
+        You MUST run the code with UnsafeLocalCodeExecutor. Only Python PyMongo code, never JavaScript MongoDB syntax.
+    """ + views.prompt_section()),
+    code_executor=mongo_code_executor,
+    before_model_callback=[
+        history.with_compaction(router.skip_model_after_execution),
+        tracing.start_model_timer,
+    ],
+    after_model_callback=[tracing.record_model_call, mongo_code_executor.prefetch],
+    output_key="database_results",
+)
+
 ROOT_AGENT = SequentialAgent(
     name="orchestratorAgent",
     # Run parallel research first, then merge
@@ -253,7 +309,8 @@ ROOT_AGENT = SequentialAgent(
 
 agent = ROOT_AGENT
 
-session_service = InMemorySessionService()
+# SQLite by default, MongoDB with SESSION_BACKEND=mongo (see session_store.py)
+session_service = session_service_from_env()
 artifact_service = InMemoryArtifactService()
 
 APP_NAME = "SylvrDemo"
@@ -265,15 +322,361 @@ global_runner = Runner(
     artifact_service=artifact_service,  # If your agents use it, pass it here too
 )
 
+# Single-call path for simple lookups chosen by router.classify
+fast_runner = Runner(
+    app_name=APP_NAME,
+    agent=query_fast_agent,
+    session_service=session_service,
+    artifact_service=artifact_service,
+)
+
+# Runs only the answerer, for turns whose database_results came from the plan
+# cache or a fast-path result that has no answer template
+answer_runner = Runner(
+    app_name=APP_NAME,
+    agent=query_answerer_agent,
+    session_service=session_service,
+    artifact_service=artifact_service,
+)
+
+answer_cache = answer_cache_from_env()
+plan_cache = PlanCache(max_entries=int(os.getenv("PLAN_CACHE_SIZE", "256")))
+
 
 # Your Pydantic model for the response (I've added this for completeness)
 class AgentResponse(BaseModel):
     session_id: str
     summary: str
+    # "ok", "busy" (the message was not queued) or "error"
+    status: str = "ok"
+
+
+# Frames sent in streaming mode: "stage" when a sub-agent starts, "token" for
+# each chunk of the answer, then one "final" frame with the full summary, or
+# an "error" frame when the turn failed.
+class StreamFrame(BaseModel):
+    type: str
+    session_id: str
+    stage: Optional[str] = None
+    text: Optional[str] = None
+    summary: Optional[str] = None
+
+
+STAGES = {
+    "query_planner_agent": "planning",
+    "query_builder_agent": "querying",
+    "query_fast_agent": "querying",
+    "query_answerer_agent": "answering",
+}
+
+SendFrame = Callable[[StreamFrame], Awaitable[None]]
+
+# Agents whose executed code is worth keeping as a plan-cache template
+CODE_AGENTS = {query_builder_agent.name, query_fast_agent.name}
+
+
+async def run_agent_turn(
+    runner, user_id, session_id, message, send_frame: Optional[SendFrame] = None
+):
+    """Run one user message through a runner.
+
+    With ``send_frame`` the model output is streamed (SSE) and stage markers
+    and answer tokens are forwarded as they arrive. Returns the full text, the
+    last generated code that executed without errors and that execution's
+    output (both None if there was none).
+    """
+    run_config = RunConfig(response_modalities=["TEXT"])
+    if send_frame is not None:
+        run_config = RunConfig(
+            response_modalities=["TEXT"], streaming_mode=StreamingMode.SSE
+        )
+    events = runner.run_async(
+        session_id=session_id,
+        user_id=user_id,
+        new_message=Content(role="user", parts=[Part.from_text(text=message)]),
+        run_config=run_config,
+    )
+
+    full_response = ""
+    pending_code = None
+    generated_code = None
+    code_output = None
+    stage = None
+    async for event in events:
+        if send_frame is not None and STAGES.get(event.author, stage) != stage:
+            stage = STAGES[event.author]
+            await send_frame(
+                StreamFrame(type="stage", session_id=session_id, stage=stage)
+            )
+        if event.content and event.content.parts:
+            for part in event.content.parts:
+                if hasattr(part, "text") and part.text:
+                    if not event.partial:
+                        # SSE repeats the streamed chunks in one final event
+                        full_response += part.text
+                    elif stage == "answering":
+                        await send_frame(
+                            StreamFrame(
+                                type="token", session_id=session_id, text=part.text
+                            )
+                        )
+                if part.executable_code and event.author in CODE_AGENTS:
+                    pending_code = part.executable_code.code
+                if part.code_execution_result and pending_code:
+                    if part.code_execution_result.outcome == types.Outcome.OUTCOME_OK:
+                        generated_code = pending_code
+                        code_output = part.code_execution_result.output
+                    pending_code = None
+    return full_response, generated_code, code_output
+
+
+async def record_answer(
+    user_id,
+    session_id,
+    answer,
+    send_frame: Optional[SendFrame] = None,
+    question=None,
+    state_delta=None,
+):
+    """Store an answer produced without the answerer agent as its turn.
+
+    Keeps the "response" state key and the conversation history the same as
+    if query_answerer_agent had replied.
+    """
+    current_session = await asyncio.to_thread(
+        session_service.get_session,
+        app_name=APP_NAME,
+        user_id=user_id,
+        session_id=session_id,
+    )
+    if question is not None:
+        await asyncio.to_thread(
+            session_service.append_event,
+            current_session,
+            Event(
+                invocation_id=Event.new_id(),
+                author="user",
+                content=Content(role="user", parts=[Part.from_text(text=question)]),
+            ),
+        )
+    await asyncio.to_thread(
+        session_service.append_event,
+        current_session,
+        Event(
+            invocation_id=Event.new_id(),
+            author=query_answerer_agent.name,
+            content=Content(role="model", parts=[Part.from_text(text=answer)]),
+            actions=EventActions(
+                state_delta={**(state_delta or {}), "response": answer}
+            ),
+        ),
+    )
+    if send_frame is not None:
+        await send_frame(
+            StreamFrame(type="stage", session_id=session_id, stage="answering")
+        )
+        await send_frame(StreamFrame(type="token", session_id=session_id, text=answer))
+
+
+async def run_fast_path(
+    user_id, session_id, message, send_frame: Optional[SendFrame] = None
+):
+    """Answer a simple question with query_fast_agent and an answer template.
+
+    Returns (response text, generated code, its output), or (None, None,
+    None) when the fast agent didn't manage to run any code and the full
+    chain should take over.
+    """
+    full_response, generated_code, code_output = await run_agent_turn(
+        fast_runner, user_id, session_id, message, send_frame
+    )
+    if generated_code is None:
+        print(f"⚠️ Fast path produced no result, using the full chain: {message}")
+        return None, None, None
+    answer = router.format_answer(message, router.parse_execution_output(code_output))
+    if answer is None:
+        # Unfamiliar result shape: let the answerer phrase the fast agent's output
+        full_response, _, _ = await run_agent_turn(
+            answer_runner, user_id, session_id, message, send_frame
+        )
+        return full_response, generated_code, code_output
+    await record_answer(user_id, session_id, answer, send_frame)
+    return answer, generated_code, code_output
+
+
+def _no_rows(results) -> bool:
+    if is_digest(results):
+        return not results.get("row_count")
+    return results is None or results == [] or results == {}
+
+
+def _answer_cacheable(generated_code: Optional[str], code_output: Optional[str]):
+    """Only answers backed by a query that ran and returned something are cached."""
+    if generated_code is None or not (code_output or "").strip():
+        return False
+    results = router.parse_execution_output(code_output)
+    # Output that isn't JSON (e.g. printed rows) can't be checked for emptiness
+    return results is None or not _no_rows(results)
+
+
+async def run_cached_plan(
+    user_id, session_id, message, send_frame: Optional[SendFrame] = None
+):
+    """Answer from a cached query template, skipping the planner and builder.
+
+    Returns (response text, the code that ran), or (None, None) when no
+    template matches or the filled-in code fails, so the
+    caller falls back to the full ROOT_AGENT chain.
+    """
+    code = plan_cache.lookup(message)
+    if code is None:
+        return None, None
+    if send_frame is not None:
+        await send_frame(
+            StreamFrame(type="stage", session_id=session_id, stage="querying")
+        )
+    try:
+        results = await run_generated_code(code)
+    except Exception as e:
+        print(f"⚠️ Cached query template failed, falling back to agents: {e}")
+        plan_cache.discard(message)
+        return None, None
+    if _no_rows(results):
+        # Running is no proof the template fits this question: let the agents
+        # confirm an empty result (the template is kept for other literals)
+        print(f"⚠️ Cached query template found nothing, asking the agents: {message}")
+        return None, None
+
+    print(f"⚡ Plan cache hit for session {session_id}")
+    if router.classify(message) == router.SIMPLE:
+        answer = router.format_answer(message, results)
+        if answer is not None:
+            await record_answer(
+                user_id,
+                session_id,
+                answer,
+                send_frame,
+                question=message,
+                state_delta={"database_results": json.dumps(results, default=str)},
+            )
+            return answer, code
+    current_session = await asyncio.to_thread(
+        session_service.get_session,
+        app_name=APP_NAME,
+        user_id=user_id,
+        session_id=session_id,
+    )
+    await asyncio.to_thread(
+        session_service.append_event,
+        current_session,
+        Event(
+            invocation_id=Event.new_id(),
+            author=query_builder_agent.name,
+            actions=EventActions(
+                state_delta={"database_results": json.dumps(results, default=str)}
+            ),
+        ),
+    )
+    full_response, _, _ = await run_agent_turn(
+        answer_runner, user_id, session_id, message, send_frame
+    )
+    return full_response, code
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the shared Mongo pool and executor workers on startup, close them on shutdown.
+
+    Creating both is quick; the Mongo ping and worker warm-up run in the
+    background unless STARTUP_MODE=blocking (see startup.py and GET /ready).
+    """
+    await asyncio.to_thread(mongo.init_client, MONGODB_URL, False)
+    await asyncio.to_thread(executor_pool.start, MONGODB_URL, False)
+    warmups = [("executor", executor_pool.wait_ready)]
+    if mongo.mongo_settings()["warmup"]:
+        warmups.append(("mongo", mongo.ping))
+    if startup.startup_settings()["mode"] == "blocking":
+        await asyncio.gather(
+            *(startup.readiness.warm(name, fn) for name, fn in warmups)
+        )
+    # Components that failed (or haven't started) keep trying in the background
+    background = [
+        asyncio.create_task(startup.readiness.keep_warm(name, fn))
+        for name, fn in warmups
+    ]
+    interval = mongo.mongo_settings()["healthcheck_interval"]
+    if interval > 0:
+        # Readiness then follows the periodic pings
+        startup.readiness.check("mongo", lambda: mongo.health()["ok"] is True)
+        background.append(asyncio.create_task(mongo.health_check_loop(interval)))
+
+    view_settings = views.views_settings()
+    refresher = None
+    if view_settings["enabled"] and view_settings["refresh_interval"] > 0:
+        background.append(
+            asyncio.create_task(views.refresh_loop(view_settings["refresh_interval"]))
+        )
+    store_settings = session_settings()
+    if (
+        isinstance(session_service, StoredSessionService)
+        and store_settings["ttl_seconds"] > 0
+    ):
+        background.append(
+            asyncio.create_task(
+                eviction_loop(
+                    session_service,
+                    store_settings["ttl_seconds"],
+                    store_settings["evict_interval"],
+                )
+            )
+        )
+    catalog_settings = catalog.catalog_settings()
+    if catalog_settings["enabled"]:
+        startup.readiness.check(
+            "catalog", lambda: catalog.catalog.refreshed_at is not None
+        )
+        background.append(
+            asyncio.create_task(
+                catalog.refresh_loop(catalog_settings["refresh_interval"])
+            )
+        )
+    snapshot_settings = analytics.analytics_settings()
+    if snapshot_settings["enabled"] and snapshot_settings["refresh_interval"] > 0:
+        if analytics.available():
+            startup.readiness.check(
+                "analytics", lambda: analytics.snapshot.built_at is not None
+            )
+        background.append(
+            asyncio.create_task(
+                analytics.refresh_loop(snapshot_settings["refresh_interval"])
+            )
+        )
+    index_settings = indexes.index_settings()
+    if index_settings["enabled"] and index_settings["interval"] > 0:
+        background.append(
+            asyncio.create_task(indexes.advisor_loop(index_settings["interval"]))
+        )
+    if view_settings["enabled"] and view_settings["change_streams"]:
+        refresher = views.ChangeStreamRefresher(
+            view_settings["debounce"], on_change=answer_cache.invalidate
+        )
+        refresher.start()
+    yield
+    for task in background:
+        task.cancel()
+    if refresher:
+        refresher.stop()
+    await scheduler.stop()
+    executor_pool.shutdown()
+    if isinstance(session_service, StoredSessionService):
+        await asyncio.to_thread(session_service.close)
+    mongo.close_client()
+    async_mongo.close_clients()
+    tracing.shutdown()
 
 
 # 1. Create the main FastAPI application instance
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 chat = APIRouter()
 
@@ -285,28 +688,39 @@ async def websocket_chat(
     try:
         await websocket.accept()
 
-        # sample_users = get_few_users_from_sample_analytics(limit=5)
+        # sample_users = await get_few_users_from_sample_analytics(limit=5)
 
         initial_state = {
             # "user_data_example": sample_users
         }
 
-        session_id = str(uuid.uuid4())
-
-        session = session_service.create_session(
-            app_name=APP_NAME,
-            user_id=session_id,
-            session_id=session_id,
-            state=initial_state,
-        )
-        summary = {}
-        updated_session = session_service.get_session(
-            app_name=APP_NAME, user_id=session.user_id, session_id=session_id
-        )
-        summary = updated_session.state
-        print(summary)
-        summary = ""
-        final_output = ""
+        # Reconnecting clients resume their conversation with ?session_id=<id>
+        session = None
+        resume_id = websocket.query_params.get("session_id")
+        if resume_id:
+            session = await mongo.run_blocking(
+                session_service.get_session,
+                app_name=APP_NAME,
+                user_id=resume_id,
+                session_id=resume_id,
+            )
+        if session is not None:
+            session_id = session.id
+            print(f"✅ Resumed session {session_id}")
+        else:
+            session_id = str(uuid.uuid4())
+            session = await mongo.run_blocking(
+                session_service.create_session,
+                app_name=APP_NAME,
+                user_id=session_id,
+                session_id=session_id,
+                state=initial_state,
+            )
+        # Not evicted while connected; the Mongo store serves it from memory
+        held = isinstance(session_service, StoredSessionService)
+        if held:
+            session_service.hold(session)
+        scheduler.attach(session_id)
 
         # alpha = f"the name of table is {table_name}"
         # # Execute an initial agent query before the main loop
@@ -326,71 +740,219 @@ async def websocket_chat(
         #         print("✅ Message processed successfully.")
         #         break  # Exit after confirming processing
 
-        while True:
-            try:
-                # print(f"User input for session {session_id}: {user_input.message}")
-                raw_data = await websocket.receive_text()
-                if not raw_data.strip():
-                    print("⚠️ Empty message received, skipping...")
-                    continue  # Skip if the message is empty.
-                data = json.loads(raw_data)
-                message = data.get("message")
-                print(f"User input for session {session_id}: {message}")
-                events = global_runner.run_async(
-                    session_id=session_id,  # Use the actual session ID from the created/retrieved session
-                    user_id=session.user_id,  # Use the actual user ID
-                    new_message=Content(
-                        role="user", parts=[Part.from_text(text=message)]
-                    ),
-                    run_config=RunConfig(response_modalities=["TEXT"]),
-                )
-
-                full_response = ""
-                final_text = ""
-                async for event in events:
-                    if event.content and event.content.parts:
-                        for part in event.content.parts:
-                            if hasattr(part, "text") and part.text:
-                                print(part.text, end="", flush=True)
-                                full_response += part.text
-                    if not event.partial:
-                        print("\n\n📨 Final Response:\n")
-                        pprint.pprint(full_response.strip())
-                        final_text = ""
+        # Clients opt into streaming frames with ?stream=true on connect or
+        # "stream": true on a message; otherwise one AgentResponse per turn.
+        stream_by_default = websocket.query_params.get("stream", "").lower() in (
+            "1",
+            "true",
+        )
 
-                    # print(final_text)
-                updated_session = session_service.get_session(
-                    app_name=APP_NAME, user_id=session.user_id, session_id=session_id
+        async def send_frame(frame: StreamFrame):
+            with tracing.tracer.start_as_current_span(
+                "ws.send", attributes={"frame.type": frame.type}
+            ):
+                await websocket.send_json(
+                    frame.model_dump(mode="json", exclude_none=True)
                 )
 
-                session_state_dict = updated_session.state
-                print(
-                    f"DEBUG: Full session state for session {session_id} after run: {session_state_dict}"
-                )  # For debugging
-
-                if updated_session is None:
-                    raise HTTPException(status_code=404, detail="Session not found")
-
-                # output = session_state_dict["response"]
-                output = session_state_dict["response"]
-
-                print("-------------------\n")
-                print("\n\nFinal output : ", final_output)
+        async def send_result(stream: bool, output: str):
+            if stream:
+                await send_frame(
+                    StreamFrame(type="final", session_id=session_id, summary=output)
+                )
+            else:
+                response = AgentResponse(session_id=session_id, summary=output)
+                with tracing.tracer.start_as_current_span(
+                    "ws.send", attributes={"frame.type": "response"}
+                ):
+                    await websocket.send_json(response.model_dump(mode="json"))
+
+        async def send_busy(stream: bool, detail: str):
+            """Backpressure: tell the client this message was not queued."""
+            if stream:
+                await send_frame(
+                    StreamFrame(type="busy", session_id=session_id, text=detail)
+                )
+            else:
                 response = AgentResponse(
                     session_id=session_id,
-                    # response=full_response_text,  # Clean up any extra whitespace
-                    # session_dict=session_state_dict,
-                    # summary=full_response,
-                    summary=output,
+                    summary=f"{detail}. Please wait for the current answer and try again.",
+                    status="busy",
                 )
-                print("\n\n\n#########FULL CONVERSATION###########\n\n")
-                print(full_response)
-
-                # print("Sending response to user", response)
+                await websocket.send_json(response.model_dump(mode="json"))
 
-                # Send the response back to the client
+        async def send_error(stream: bool, detail: str):
+            """End a failed turn so the client isn't left waiting for an answer."""
+            if stream:
+                await send_frame(
+                    StreamFrame(type="error", session_id=session_id, text=detail)
+                )
+            else:
+                response = AgentResponse(
+                    session_id=session_id, summary=detail, status="error"
+                )
                 await websocket.send_json(response.model_dump(mode="json"))
 
+        async def handle_message(message: str, stream: bool):
+            frame_sender = send_frame if stream else None
+
+            current_session = await asyncio.to_thread(
+                session_service.get_session,
+                app_name=APP_NAME,
+                user_id=session.user_id,
+                session_id=session_id,
+            )
+            if current_session is None:
+                # Deleted elsewhere (e.g. by another worker); continue in a fresh one
+                print(f"⚠️ Session {session_id} was gone, recreating it")
+                current_session = await asyncio.to_thread(
+                    session_service.create_session,
+                    app_name=APP_NAME,
+                    user_id=session.user_id,
+                    session_id=session_id,
+                    state=initial_state,
+                )
+            turns = (current_session.state.get(history.HISTORY_KEY) or [])[
+                -history.history_settings()["keep_turns"] :
+            ]
+            context = conversation_key(turns)
+            cacheable = False
+            generated_code = None
+            cached_answer = await asyncio.to_thread(answer_cache.get, message, context)
+            if cached_answer is not None:
+                print(f"⚡ Answer cache hit for session {session_id}")
+                # Recorded like any other turn so follow-ups keep their context
+                await record_answer(
+                    session.user_id, session_id, cached_answer, question=message
+                )
+                full_response = cached_answer
+            else:
+                full_response, generated_code = await run_cached_plan(
+                    session.user_id, session_id, message, frame_sender
+                )
+                # Cached plans only answer when their query found rows
+                cacheable = full_response is not None
+            if full_response is None and router.classify(message) == router.SIMPLE:
+                full_response, generated_code, code_output = await run_fast_path(
+                    session.user_id, session_id, message, frame_sender
+                )
+                cacheable = _answer_cacheable(generated_code, code_output)
+                if generated_code and plan_cache.store(message, generated_code):
+                    print(f"📝 Stored query template for: {message}")
+            if full_response is None:
+                full_response, generated_code, code_output = await run_agent_turn(
+                    global_runner,
+                    session.user_id,
+                    session_id,
+                    message,
+                    frame_sender,
+                )
+                cacheable = _answer_cacheable(generated_code, code_output)
+                if generated_code and plan_cache.store(message, generated_code):
+                    print(f"📝 Stored query template for: {message}")
+
+            updated_session = await asyncio.to_thread(
+                session_service.get_session,
+                app_name=APP_NAME,
+                user_id=session.user_id,
+                session_id=session_id,
+            )
+
+            if updated_session is None:
+                raise HTTPException(status_code=404, detail="Session not found")
+            session_state_dict = updated_session.state
+
+            # output = session_state_dict["response"]
+            output = session_state_dict.get("response")
+            if not output:
+                await send_error(
+                    stream,
+                    "No answer was produced for this question. Please try rephrasing it.",
+                )
+                return
+            # Running summary that replaces older turns in model requests
+            await asyncio.to_thread(
+                session_service.append_event,
+                updated_session,
+                Event(
+                    invocation_id=Event.new_id(),
+                    author=query_answerer_agent.name,
+                    actions=EventActions(
+                        state_delta={
+                            history.HISTORY_KEY: history.add_turn(
+                                session_state_dict.get(history.HISTORY_KEY),
+                                message,
+                                output,
+                            )
+                        }
+                    ),
+                ),
+            )
+            if cacheable:
+                await asyncio.to_thread(
+                    answer_cache.put,
+                    message,
+                    output,
+                    # Tagged from the code that ran: this turn may not have a plan
+                    collections_in_code(generated_code),
+                    context,
+                )
+            # print("Sending response to user", response)
+
+            # Send the response back to the client
+            await send_result(stream, output)
+
+        async def run_turn(message: str, stream: bool, received):
+            # Scheduler workers don't inherit the receiving context, so the
+            # turn joins the message's trace explicitly
+            with tracing.tracer.start_as_current_span(
+                "chat.turn",
+                context=received,
+                attributes={"session.id": session_id, "stream": stream},
+            ) as span:
+                try:
+                    await handle_message(message, stream)
+                except Exception as e:
+                    span.record_exception(e)
+                    print(f"Error handling message for session {session_id}: {e}")
+                    try:
+                        await send_error(
+                            stream,
+                            "Sorry, something went wrong while answering. Please try again.",
+                        )
+                    except Exception:
+                        pass  # the client is gone
+
+        while True:
+            try:
+                # print(f"User input for session {session_id}: {user_input.message}")
+                raw_data = await websocket.receive_text()
+                if not raw_data.strip():
+                    print("⚠️ Empty message received, skipping...")
+                    continue  # Skip if the message is empty.
+                with tracing.tracer.start_as_current_span(
+                    "ws.receive",
+                    attributes={
+                        "session.id": session_id,
+                        "message.bytes": len(raw_data),
+                    },
+                ):
+                    data = json.loads(raw_data)
+                    message = data.get("message")
+                    print(f"User input for session {session_id}: {message}")
+                    stream = data.get("stream", stream_by_default)
+                    received = trace_context.get_current()
+
+                    # Turns run on the scheduler so this loop keeps reading; the
+                    # session's queue keeps its messages in order.
+                    try:
+                        await scheduler.submit(
+                            session_id,
+                            lambda m=message, st=stream, r=received: run_turn(m, st, r),
+                        )
+                    except QueueFull as e:
+                        await send_busy(stream, str(e))
+
             except json.JSONDecodeError:
                 await websocket.send_text(
                     "Error: Invalid JSON format. Please send a valid JSON message."
@@ -398,8 +960,74 @@ async def websocket_chat(
             except Exception as e:
                 print(f"Error receiving message: {e}")
                 break
+        scheduler.drop_session(session_id)
+        if held:
+            session_service.release(session)
     except Exception as e:
         print("Error in creating chat session :", e)
 
 
+@chat.post("/cache/invalidate")
+async def invalidate_answer_cache(collection: str = None):
+    """Drop cached answers that depend on a collection, or all of them."""
+    if collection is not None and collection not in COLLECTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown collection {collection}")
+    dropped = answer_cache.invalidate(collection)
+    return {"invalidated": dropped, **answer_cache.stats()}
+
+
+@chat.get("/results/{handle}")
+async def get_result_page(handle: str, offset: int = 0, limit: int = 50):
+    """Page through the full rows behind a digested database_results."""
+    page = result_store.page(handle, max(offset, 0), min(max(limit, 1), 500))
+    if page is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired result handle")
+    return page
+
+
+@chat.get("/scheduler/stats")
+async def scheduler_stats():
+    """Queued and running turns across all sessions."""
+    return {**scheduler.stats(), "stage_limits": scheduler.stage_limits}
+
+
+@chat.get("/health/mongo")
+async def mongo_health():
+    """Result of the most recent MongoDB ping."""
+    return mongo.health()
+
+
+@chat.get("/ready")
+async def ready():
+    """Readiness probe: 503 until the components in READY_REQUIRES have warmed up."""
+    report = startup.readiness.report(startup.startup_settings()["required"])
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+
+@chat.get("/indexes/advice")
+async def index_advice():
+    """Query shapes planned as collection scans and the indexes that would serve them."""
+    return indexes.index_advisor.report()
+
+
+@chat.get("/analytics/snapshot")
+async def analytics_snapshot():
+    """Age and size of the columnar snapshot and what its last refresh did."""
+    return analytics.snapshot.stats()
+
+
+@chat.get("/metrics")
+async def prometheus_metrics():
+    """Span latency histograms and token/document counters for Prometheus."""
+    return PlainTextResponse(
+        tracing.metrics.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
+@chat.get("/metrics/latency")
+async def latency_percentiles():
+    """Recent p50/p95/p99 latency in milliseconds of every traced stage."""
+    return tracing.metrics.latency()
+
+
 app.include_router(chat)
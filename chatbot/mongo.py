@@ -0,0 +1,200 @@
+"""Process-wide pooled MongoClient shared by helpers and generated code."""
+
+import asyncio
+import os
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo import MongoClient, monitoring
+
+from .scheduler import scheduler
+
+DATABASE_NAME = "sample_analytics"
+
+_client: Optional[MongoClient] = None
+_health: Dict[str, Any] = {"ok": None, "checked_at": None, "latency_ms": None}
+_command_handlers: List[Callable[[Dict[str, Any]], None]] = []
+# Set by executor runs to collect their own commands instead of reporting them
+collected_commands: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar(
+    "collected_commands", default=None
+)
+_MAX_COLLECTED = 200
+# Command fields that describe a read's shape, for the index advisor
+_QUERY_FIELDS = {
+    "find": {"filter": "filter", "sort": "sort"},
+    "aggregate": {"pipeline": "pipeline"},
+    "count": {"query": "filter"},
+    "distinct": {"query": "filter"},
+}
+
+
+def mongo_settings() -> Dict[str, Any]:
+    """Pool, warm-up and health-check settings from MONGODB_* environment variables."""
+    return {
+        "max_pool_size": int(os.getenv("MONGODB_MAX_POOL_SIZE", "100")),
+        "min_pool_size": int(os.getenv("MONGODB_MIN_POOL_SIZE", "5")),
+        "max_idle_time_ms": int(os.getenv("MONGODB_MAX_IDLE_MS", "300000")),
+        "warmup": os.getenv("MONGODB_WARMUP", "1").lower() in ("1", "true", "yes"),
+        "healthcheck_interval": float(os.getenv("MONGODB_HEALTHCHECK_INTERVAL", "30")),
+    }
+
+
+def on_command(handler: Callable[[Dict[str, Any]], None]) -> None:
+    """Call ``handler`` with a record of every command run on the shared client."""
+    _command_handlers.append(handler)
+
+
+def _reply_documents(reply: Dict[str, Any]) -> Optional[int]:
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    n = reply.get("n")
+    return n if isinstance(n, int) else None
+
+
+def _query(command_name: str, command: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    fields = _QUERY_FIELDS.get(command_name)
+    if fields is None:
+        return None
+    return {name: command[key] for key, name in fields.items() if command.get(key)}
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Reports each command's name, collection, query, timing and document count."""
+
+    def __init__(self):
+        self._started: Dict[tuple, tuple] = {}
+
+    def started(self, event):
+        key = "collection" if event.command_name == "getMore" else event.command_name
+        collection = event.command.get(key)
+        self._started[(event.connection_id, event.request_id)] = (
+            collection if isinstance(collection, str) else None,
+            _query(event.command_name, event.command),
+        )
+
+    def succeeded(self, event):
+        self._report(event, _reply_documents(event.reply), False)
+
+    def failed(self, event):
+        self._report(event, None, True)
+
+    def _report(self, event, documents: Optional[int], failed: bool) -> None:
+        end = time.time_ns()
+        collection, query = self._started.pop(
+            (event.connection_id, event.request_id), (None, None)
+        )
+        record = {
+            "command": event.command_name,
+            "database": event.database_name,
+            "collection": collection,
+            "query": query,
+            "start_ns": end - event.duration_micros * 1000,
+            "end_ns": end,
+            "documents": documents,
+            "failed": failed,
+        }
+        collected = collected_commands.get()
+        if collected is not None:
+            if len(collected) < _MAX_COLLECTED:
+                collected.append(record)
+            return
+        for handler in _command_handlers:
+            handler(record)
+
+
+def init_client(
+    url: Optional[str] = None, warmup: Optional[bool] = None
+) -> MongoClient:
+    """Create the shared client; pings once to open the pool when warm-up is on.
+
+    ``warmup`` overrides MONGODB_WARMUP, e.g. to ping later in the background.
+    """
+    global _client
+    if _client is not None:
+        return _client
+    settings = mongo_settings()
+    _client = MongoClient(
+        url or os.getenv("MONGODB_URL"),
+        maxPoolSize=settings["max_pool_size"],
+        minPoolSize=settings["min_pool_size"],
+        maxIdleTimeMS=settings["max_idle_time_ms"],
+        appname="SylvrDemo",
+        event_listeners=[CommandTimer()],
+    )
+    if settings["warmup"] if warmup is None else warmup:
+        ping()
+    return _client
+
+
+def use_client(client) -> None:
+    """Share an already-created client, e.g. mongomock's in the offline benchmarks."""
+    global _client
+    _client = client
+
+
+def get_client() -> MongoClient:
+    """The shared client, created on first use if the app lifespan hasn't done it."""
+    return _client if _client is not None else init_client()
+
+
+def get_database():
+    return get_client()[DATABASE_NAME]
+
+
+class SharedClientProxy:
+    """Hands generated code the pooled client without letting it close the pool."""
+
+    def __init__(self, client: MongoClient):
+        self._client = client
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def __getitem__(self, name):
+        return self._client[name]
+
+
+def close_client() -> None:
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+def ping() -> bool:
+    """Round-trip a ping on the shared client and record the result for health()."""
+    start = time.perf_counter()
+    try:
+        get_client().admin.command("ping")
+        ok = True
+    except Exception as e:
+        print(f"⚠️ MongoDB health check failed: {e}")
+        ok = False
+    _health.update(
+        ok=ok,
+        checked_at=time.time(),
+        latency_ms=round((time.perf_counter() - start) * 1000, 2),
+    )
+    return ok
+
+
+def health() -> Dict[str, Any]:
+    return dict(_health)
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run a blocking PyMongo call off the event loop, within the "mongo" stage limit."""
+    async with scheduler.stage("mongo"):
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+async def health_check_loop(interval: float) -> None:
+    """Ping the cluster every ``interval`` seconds so dead pools are noticed early."""
+    while True:
+        await asyncio.sleep(interval)
+        await run_blocking(ping)
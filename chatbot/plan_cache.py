@@ -0,0 +1,346 @@
+"""Template cache for the PyMongo programs written by query_builder_agent.
+
+Questions that differ only in their literals ("sell transactions for account
+794875" vs "... for account 443178") share a structural shape. The first time
+a shape is answered, the generated code is stored with those literals turned
+into placeholders; later questions with the same shape get the code back with
+their own literals filled in, skipping query_planner_agent and
+query_builder_agent.
+"""
+
+import ast
+import io
+import re
+import threading
+import tokenize
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from .answer_cache import VOCABULARY, normalize_question
+
+_LITERAL_PATTERN = re.compile(
+    r"\"(?P<dq>[^\"]+)\""
+    r"|'(?P<sq>[^']+)'"
+    r"|(?P<num>(?<![\w.])\d+(?:\.\d+)?(?![\w.]))"
+    + "".join(
+        rf"|(?P<{kind}>\b(?:{'|'.join(words)})\b)" for kind, words in VOCABULARY.items()
+    )
+)
+
+# Numbers a generated program may use on its own ($sum: 1, .limit(10), sort -1).
+# Anything larger that is not one of the question's literals (e.g. the 2018 in
+# a "during 2017" date range) is derived from the question, so the program
+# cannot be safely reused with other literals.
+_MAX_STRUCTURAL_NUMBER = 100
+
+# Query operators whose operands are still values matched against documents.
+# Numbers anywhere else ($sum, $size, $limit, projections, sort directions,
+# call arguments) are part of the query's structure and are never templated.
+_FILTER_OPERATORS = {
+    "$eq",
+    "$ne",
+    "$gt",
+    "$gte",
+    "$lt",
+    "$lte",
+    "$in",
+    "$nin",
+    "$all",
+    "$and",
+    "$or",
+    "$nor",
+    "$not",
+    "$elemMatch",
+}
+# Calls taking a filter, and the position of that argument
+_FILTER_ARGUMENTS = {
+    "find": (0, "filter"),
+    "find_one": (0, "filter"),
+    "count_documents": (0, "filter"),
+    "distinct": (1, "filter"),
+    "afind": (1, "filter"),
+    "analytics_query": (1, "params"),
+}
+
+
+def extract_literals(question: str) -> Tuple[str, List[Tuple[str, str]]]:
+    """Split a question into its structural shape and its ordered literals."""
+    literals = []
+
+    def replace(match):
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind in ("dq", "sq"):
+            kind = "str"
+        literals.append((kind, value))
+        return f" __{kind}__ "
+
+    shape = _LITERAL_PATTERN.sub(replace, question.lower())
+    return normalize_question(shape), literals
+
+
+def _token_offsets(code: str) -> List[Tuple[int, int, tokenize.TokenInfo]]:
+    line_starts = [0]
+    for line in code.splitlines(keepends=True):
+        line_starts.append(line_starts[-1] + len(line))
+    tokens = []
+    for tok in tokenize.generate_tokens(io.StringIO(code).readline):
+        if tok.type in (tokenize.NUMBER, tokenize.STRING):
+            start = line_starts[tok.start[0] - 1] + tok.start[1]
+            end = line_starts[tok.end[0] - 1] + tok.end[1]
+            tokens.append((start, end, tok))
+    return tokens
+
+
+def _dict_key(parent: ast.Dict, child: ast.AST) -> Optional[str]:
+    for key, value in zip(parent.keys, parent.values):
+        if value is child:
+            if isinstance(key, ast.Constant) and isinstance(key.value, str):
+                return key.value
+            return None
+    return None
+
+
+def _call_name(call: ast.Call) -> Optional[str]:
+    if isinstance(call.func, ast.Attribute):
+        return call.func.attr
+    if isinstance(call.func, ast.Name):
+        return call.func.id
+    return None
+
+
+def _filter_argument(call: ast.Call) -> Optional[ast.AST]:
+    position = _FILTER_ARGUMENTS.get(_call_name(call))
+    if position is None:
+        return None
+    index, keyword = position
+    if len(call.args) > index:
+        return call.args[index]
+    for argument in call.keywords:
+        if argument.arg == keyword:
+            return argument.value
+    return None
+
+
+def _is_filter_value(node: ast.AST, parents: Dict[ast.AST, ast.AST]) -> bool:
+    """Whether a constant is a value documents are matched against.
+
+    That is a field's value (possibly under comparison operators) inside a
+    ``$match`` stage or the filter argument of find()/count_documents(), or
+    a parameter of analytics_query(). Anything undecided counts as structure.
+    """
+    child, parent = node, parents.get(node)
+    field = in_list = False
+    while parent is not None:
+        if isinstance(parent, ast.Dict):
+            key = _dict_key(parent, child)
+            if key is None:
+                return False
+            if key == "$match":
+                return field and not in_list
+            if key.startswith("$"):
+                if key not in _FILTER_OPERATORS:
+                    return False
+            elif in_list:
+                return False
+            else:
+                field = True
+            in_list = False
+        elif isinstance(parent, (ast.List, ast.Tuple)):
+            if in_list:
+                return False
+            in_list = True
+        elif isinstance(parent, ast.Call):
+            if _filter_argument(parent) is not child:
+                return False
+            if _call_name(parent) == "analytics_query":
+                return in_list and not field
+            return field and not in_list
+        else:
+            return False
+        child, parent = parent, parents.get(parent)
+    return False
+
+
+def _filter_numbers(code: str) -> Dict[Tuple[int, int], bool]:
+    """(row, column) of each numeric constant -> whether it is a filter value."""
+    tree = ast.parse(code)
+    parents = {
+        child: node for node in ast.walk(tree) for child in ast.iter_child_nodes(node)
+    }
+    lines = code.splitlines()
+    positions = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            # AST columns are UTF-8 byte offsets, tokenize's are characters
+            prefix = lines[node.lineno - 1].encode()[: node.col_offset]
+            column = len(prefix.decode(errors="ignore"))
+            positions[(node.lineno, column)] = _is_filter_value(node, parents)
+    return positions
+
+
+def _literal_index(
+    tok: tokenize.TokenInfo,
+    literals: List[Tuple[str, str]],
+    filter_value: bool = False,
+):
+    """Index of the question literal a NUMBER/STRING token stands for, if any.
+
+    Raises ValueError when a question's number also appears in a structural
+    position, where filling in another number would change the query.
+    """
+    if tok.type == tokenize.NUMBER:
+        try:
+            value = float(tok.string)
+        except ValueError:
+            return None
+        for index, (kind, literal) in enumerate(literals):
+            if kind == "num" and float(literal) == value:
+                if not filter_value:
+                    raise ValueError(
+                        f"question literal {tok.string} in query structure"
+                    )
+                return index
+        if abs(value) > _MAX_STRUCTURAL_NUMBER:
+            raise ValueError(f"derived numeric constant {tok.string}")
+        return None
+    try:
+        value = ast.literal_eval(tok.string)
+    except (ValueError, SyntaxError):
+        return None
+    if not isinstance(value, str):
+        return None
+    for index, (_, literal) in enumerate(literals):
+        if value.lower() == literal.lower():
+            return index
+    for words in VOCABULARY.values():
+        if value.lower() in words:
+            raise ValueError(f"categorical constant {value!r} not in question")
+    return None
+
+
+def _case_of(text: str, literal: str) -> str:
+    if text == literal:
+        return "same"
+    if text == text.upper():
+        return "upper"
+    if text == text.title():
+        return "title"
+    return "lower"
+
+
+def parameterize(code: str, literals: List[Tuple[str, str]]) -> Optional[List]:
+    """Turn generated code into segments of text and literal placeholders.
+
+    Returns None when the code cannot be reused safely: a literal is missing
+    from the code, two literals are indistinguishable, a number from the
+    question is also used outside a filter, or the code contains constants
+    derived from the question.
+    """
+    values = [literal.lower() for _, literal in literals]
+    if len(set(values)) != len(values):
+        return None
+    try:
+        tokens = _token_offsets(code)
+        filter_numbers = _filter_numbers(code)
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return None
+
+    segments: List = []
+    used = set()
+    cursor = 0
+    for start, end, tok in tokens:
+        try:
+            index = _literal_index(tok, literals, filter_numbers.get(tok.start, False))
+        except ValueError:
+            return None
+        if index is None:
+            continue
+        segments.append(code[cursor:start])
+        if tok.type == tokenize.NUMBER:
+            segments.append({"index": index, "kind": "number"})
+        else:
+            text = ast.literal_eval(tok.string)
+            segments.append(
+                {
+                    "index": index,
+                    "kind": "string",
+                    "case": _case_of(text, literals[index][1]),
+                    "quote": '"' if tok.string.endswith('"') else "'",
+                }
+            )
+        used.add(index)
+        cursor = end
+    segments.append(code[cursor:])
+    if used != set(range(len(literals))):
+        return None
+    return segments
+
+
+def fill(segments: List, literals: List[Tuple[str, str]]) -> str:
+    """Render parameterized code with a new set of literals."""
+    parts = []
+    for segment in segments:
+        if isinstance(segment, str):
+            parts.append(segment)
+            continue
+        literal = literals[segment["index"]][1]
+        if segment["kind"] == "number":
+            parts.append(literal)
+            continue
+        case = segment["case"]
+        if case == "upper":
+            literal = literal.upper()
+        elif case == "title":
+            literal = literal.title()
+        elif case == "lower":
+            literal = literal.lower()
+        quote = segment["quote"]
+        escaped = literal.replace("\\", "\\\\").replace(quote, "\\" + quote)
+        parts.append(quote + escaped + quote)
+    return "".join(parts)
+
+
+class PlanCache:
+    """LRU cache of parameterized query_builder_agent programs keyed on question shape."""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._templates: "OrderedDict[str, List]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, question: str) -> Optional[str]:
+        """Return ready-to-run code for the question if its shape has been seen."""
+        shape, literals = extract_literals(question)
+        with self._lock:
+            segments = self._templates.get(shape)
+            if segments is None:
+                return None
+            self._templates.move_to_end(shape)
+        code = fill(segments, literals)
+        try:
+            compile(code, "<plan_cache>", "exec", flags=ast.PyCF_ALLOW_TOP_LEVEL_AWAIT)
+        except SyntaxError:
+            self.discard(question)
+            return None
+        return code
+
+    def store(self, question: str, code: str) -> bool:
+        """Remember the code that answered a question; False if it can't be templated."""
+        shape, literals = extract_literals(question)
+        segments = parameterize(code, literals)
+        # The template must give back exactly the code that answered the question
+        if segments is None or fill(segments, literals) != code:
+            return False
+        with self._lock:
+            self._templates[shape] = segments
+            self._templates.move_to_end(shape)
+            while len(self._templates) > self.max_entries:
+                self._templates.popitem(last=False)
+        return True
+
+    def discard(self, question: str) -> None:
+        """Forget the template for a question's shape, e.g. after it failed to run."""
+        shape, _ = extract_literals(question)
+        with self._lock:
+            self._templates.pop(shape, None)
@@ -0,0 +1,258 @@
+"""Keeps generated-query results small enough for memory and for prompts.
+
+``summarize_results`` iterates a cursor (or any iterable) in batches and
+returns a digest: the first rows up to a row and byte cap, the total row
+count and per-field statistics (count, min/max/mean for numbers, top values
+for strings). ``bound_results`` applies the same to whatever a program stored
+in ``database_results``, so large results are digested even when the code
+used ``list(cursor)``. The rows behind a digest are kept, up to a row and
+byte limit applied in the executor worker, in ``result_store`` under a handle
+that ``GET /results/{handle}`` pages through. The store itself is bounded by
+entries and total bytes.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Line MongoCodeExecutor adds to program output when the result was digested.
+DIGEST_PREFIX = "database_results digest: "
+# Distinct string values tracked per field before it counts as high-cardinality.
+_MAX_TRACKED_VALUES = 100
+
+
+def result_settings() -> Dict[str, int]:
+    return {
+        "max_rows": int(os.getenv("RESULTS_MAX_ROWS", "50")),
+        "max_bytes": int(os.getenv("RESULTS_MAX_BYTES", "16384")),
+        "batch_size": int(os.getenv("RESULTS_BATCH_SIZE", "500")),
+        "top_k": int(os.getenv("RESULTS_TOP_K", "5")),
+        # Rows kept for paging a digested result; the rest only feed the stats
+        "keep_rows": int(os.getenv("RESULTS_KEEP_ROWS", "5000")),
+        "keep_bytes": int(os.getenv("RESULTS_KEEP_BYTES", str(1024 * 1024))),
+        "store_size": int(os.getenv("RESULTS_STORE_SIZE", "200")),
+        "store_bytes": int(os.getenv("RESULTS_STORE_BYTES", str(64 * 1024 * 1024))),
+        "store_ttl": int(os.getenv("RESULTS_STORE_TTL", "3600")),
+    }
+
+
+class ResultDigest(dict):
+    """A digest as a plain dict; ``full_rows`` holds the rows kept for paging."""
+
+    full_rows: List[Any] = []
+
+
+def is_digest(value: Any) -> bool:
+    return isinstance(value, dict) and value.get("digest") is True
+
+
+def _size(value: Any) -> int:
+    return len(json.dumps(value, default=str))
+
+
+class _FieldSummary:
+    def __init__(self):
+        self.count = 0
+        self.numbers = 0
+        self.minimum = None
+        self.maximum = None
+        self.total = 0.0
+        self.values: Optional[Dict[str, int]] = {}
+
+    def add(self, value: Any) -> None:
+        self.count += 1
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            self.numbers += 1
+            self.total += value
+            self.minimum = value if self.minimum is None else min(self.minimum, value)
+            self.maximum = value if self.maximum is None else max(self.maximum, value)
+        elif isinstance(value, (str, bool)) and self.values is not None:
+            key = str(value)
+            if key not in self.values and len(self.values) >= _MAX_TRACKED_VALUES:
+                self.values = None
+            else:
+                self.values[key] = self.values.get(key, 0) + 1
+
+    def to_dict(self, top_k: int) -> Dict[str, Any]:
+        summary: Dict[str, Any] = {"count": self.count}
+        if self.numbers:
+            summary.update(
+                min=self.minimum,
+                max=self.maximum,
+                sum=round(self.total, 4),
+                mean=round(self.total / self.numbers, 4),
+            )
+        if self.values:
+            ranked = sorted(self.values.items(), key=lambda item: -item[1])
+            summary["top"] = ranked[:top_k]
+            summary["distinct"] = len(self.values)
+        elif self.values is None:
+            summary["distinct"] = f">{_MAX_TRACKED_VALUES}"
+        return summary
+
+
+def summarize_results(
+    rows: Iterable,
+    max_rows: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+) -> ResultDigest:
+    """Digest of a cursor or iterable of documents, read in batches."""
+    settings = result_settings()
+    max_rows = settings["max_rows"] if max_rows is None else max_rows
+    max_bytes = settings["max_bytes"] if max_bytes is None else max_bytes
+    if hasattr(rows, "batch_size"):
+        try:
+            rows = rows.batch_size(settings["batch_size"])
+        except Exception:
+            pass  # already iterated: keep the cursor's own batch size
+
+    sample, kept, fields = [], [], {}
+    row_count = sample_bytes = kept_bytes = 0
+    keep_rows = settings["keep_rows"]
+    for row in rows:
+        row_count += 1
+        size = None
+        if len(kept) < keep_rows:
+            size = _size(row)
+            if kept_bytes + size <= settings["keep_bytes"]:
+                kept.append(row)
+                kept_bytes += size
+            else:
+                keep_rows = len(kept)  # byte cap reached: keep no more rows
+        if len(sample) < max_rows:
+            size = _size(row) if size is None else size
+            if sample_bytes + size <= max_bytes:
+                sample.append(row)
+                sample_bytes += size
+            else:
+                max_rows = len(sample)  # byte cap reached: stop sampling
+        for key, value in (row.items() if isinstance(row, dict) else [("value", row)]):
+            fields.setdefault(key, _FieldSummary()).add(value)
+
+    digest = ResultDigest(
+        digest=True,
+        row_count=row_count,
+        truncated=len(sample) < row_count,
+        rows=sample,
+        fields={
+            key: summary.to_dict(settings["top_k"]) for key, summary in fields.items()
+        },
+    )
+    digest.full_rows = kept
+    return digest
+
+
+def _is_row_source(value: Any) -> bool:
+    """Cursors, generators and other lazy iterables, but not str/bytes/dict."""
+    return hasattr(value, "__iter__") and not isinstance(
+        value, (str, bytes, dict, list, tuple, set)
+    )
+
+
+def bound_results(value: Any) -> Tuple[Any, Optional[List[Any]]]:
+    """Bound a ``database_results`` value: (value or digest, rows to keep or None)."""
+    settings = result_settings()
+    if hasattr(value, "to_dict") and hasattr(value, "columns"):
+        value = value.to_dict("records")  # pandas DataFrame
+    if isinstance(value, ResultDigest):
+        return value, value.full_rows
+    if _is_row_source(value):
+        digest = summarize_results(value)
+        return digest, digest.full_rows
+    if isinstance(value, (list, tuple)) and (
+        len(value) > settings["max_rows"] or _size(value) > settings["max_bytes"]
+    ):
+        digest = summarize_results(value)
+        return digest, digest.full_rows
+    if _size(value) > settings["max_bytes"]:
+        # One huge document: only a prefix of its JSON fits the prompt
+        text = json.dumps(value, default=str)
+        return {
+            "digest": True,
+            "row_count": 1,
+            "truncated": True,
+            "total_bytes": len(text),
+            "preview": text[: settings["max_bytes"]],
+        }, None
+    return value, None
+
+
+def cap_text(text: str, max_bytes: Optional[int] = None) -> str:
+    """Trim program output that would flood the model context."""
+    max_bytes = result_settings()["max_bytes"] if max_bytes is None else max_bytes
+    if len(text) <= max_bytes:
+        return text
+    return (
+        text[:max_bytes]
+        + f"\n... [output truncated, {len(text):,} characters in total]"
+    )
+
+
+class ResultStore:
+    """TTL/LRU store of full result rows behind digests, for paging.
+
+    Least recently used results are dropped beyond ``max_entries`` results
+    or ``max_bytes`` of rows (measured as JSON) in total.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 200,
+        ttl_seconds: float = 3600,
+        max_bytes: int = 64 * 1024 * 1024,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, rows: List[Any], row_count: Optional[int] = None) -> str:
+        handle = uuid.uuid4().hex
+        size = _size(rows)
+        with self._lock:
+            self._entries[handle] = {
+                "rows": rows,
+                "row_count": len(rows) if row_count is None else row_count,
+                "bytes": size,
+                "created": time.time(),
+            }
+            self.total_bytes += size
+            while len(self._entries) > self.max_entries or (
+                self.total_bytes > self.max_bytes and len(self._entries) > 1
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= evicted["bytes"]
+        return handle
+
+    def page(self, handle: str, offset: int = 0, limit: int = 50) -> Optional[Dict]:
+        """One page of a stored result, or None if the handle is unknown or expired."""
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is None:
+                return None
+            if time.time() - entry["created"] > self.ttl_seconds:
+                del self._entries[handle]
+                self.total_bytes -= entry["bytes"]
+                return None
+            self._entries.move_to_end(handle)
+        rows = entry["rows"]
+        return {
+            "handle": handle,
+            "offset": offset,
+            "limit": limit,
+            "row_count": entry["row_count"],
+            "available_rows": len(rows),
+            "rows": rows[offset : offset + limit],
+        }
+
+
+_settings = result_settings()
+result_store = ResultStore(
+    _settings["store_size"], _settings["store_ttl"], _settings["store_bytes"]
+)
@@ -0,0 +1,152 @@
+"""Routes simple questions to a single-call fast path.
+
+``classify`` is a keyword classifier: lookups, filters and counts against one
+collection are "simple" and go to ``query_fast_agent`` (plan and code in one
+model call), whose printed result is turned into an answer by
+``format_answer``. Multi-collection, trend and comparison questions keep the
+full planner -> builder -> answerer chain.
+"""
+
+import json
+import re
+from typing import Any, Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai import types
+
+from .results import DIGEST_PREFIX, is_digest
+
+SIMPLE = "simple"
+FULL = "full"
+
+# Words that point at each collection, including fields only it has.
+_COLLECTION_CUES = {
+    "accounts": r"\b(limits?|products?|investment ?stock|derivatives|commodity|currency ?service|brokerage)\b",
+    "customers": r"\b(customers?|users?|usernames?|tiers?|bronze|silver|gold|platinum|benefits?|email|birth ?dates?|born|address|names?|active)\b",
+    "transactions": r"\b(transactions?|trades?|buys?|sells?|bought|sold|symbols?|prices?|transaction_count|amounts?)\b",
+}
+_FULL_CUES = re.compile(
+    r"\b(trends?|over time|monthly|weekly|yearly|annual|per (month|year|week|day)|by (month|year|week|day)"
+    r"|growth|grow|compare|comparison|versus|vs\.?|correlat\w*|distribution|why|explain|insights?"
+    r"|most|least|top|highest|lowest|average|mean|median|rank\w*|each|percent\w*|ratio)\b",
+    re.IGNORECASE,
+)
+_SIMPLE_CUES = re.compile(
+    r"^\s*(how many|count|list|show|find|get|give me|which|what is|what's|what are|who|does|do|is|are)\b"
+    r"|\b(number of|how many)\b",
+    re.IGNORECASE,
+)
+_COUNT_QUESTION = re.compile(r"\b(how many|number of|count)\b", re.IGNORECASE)
+_MAX_SIMPLE_WORDS = 25
+_MAX_LISTED = 10
+
+# Prefix ADK puts on successful executor output in the model context.
+_RESULT_PREFIX = "Code execution result:\n"
+
+
+def classify(question: str) -> str:
+    """SIMPLE for single-collection lookups, filters and counts, else FULL."""
+    if len(question.split()) > _MAX_SIMPLE_WORDS or _FULL_CUES.search(question):
+        return FULL
+    touched = [
+        name
+        for name, cue in _COLLECTION_CUES.items()
+        if re.search(cue, question, re.IGNORECASE)
+    ]
+    # "account" alone isn't a cue: "sells for account 794875" filters transactions
+    if len(touched) > 1:
+        return FULL
+    return SIMPLE if _SIMPLE_CUES.search(question) else FULL
+
+
+def skip_model_after_execution(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> Optional[LlmResponse]:
+    """before_model_callback for query_fast_agent: end the turn once code ran.
+
+    After a successful execution ADK would call the model again just to
+    restate the output; returning it directly keeps the fast path at one call.
+    """
+    if not llm_request.contents:
+        return None
+    last = llm_request.contents[-1]
+    text = "".join(part.text or "" for part in last.parts or [])
+    start = text.find(_RESULT_PREFIX)
+    if last.role != "user" or start == -1:
+        return None
+    output = text[start + len(_RESULT_PREFIX) :].rstrip("`\n ")
+    return LlmResponse(
+        content=types.Content(role="model", parts=[types.Part(text=output)])
+    )
+
+
+def parse_execution_output(output: Optional[str]) -> Any:
+    """The JSON value the fast agent printed, or None if there isn't one."""
+    if not output:
+        return None
+    if output.startswith(_RESULT_PREFIX):
+        output = output[len(_RESULT_PREFIX) :]
+    lines = [line for line in output.strip().splitlines() if line.strip()]
+    if not lines:
+        return None
+    last = lines[-1]
+    if last.startswith(DIGEST_PREFIX):
+        last = last[len(DIGEST_PREFIX) :]
+    try:
+        return json.loads(last)
+    except ValueError:
+        return None
+
+
+def _humanize(key: str) -> str:
+    return key.replace("_", " ").strip().capitalize()
+
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, int):
+        return f"{value:,}"
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    if isinstance(value, list):
+        return ", ".join(_format_value(v) for v in value[:_MAX_LISTED]) + (
+            f" (+{len(value) - _MAX_LISTED} more)" if len(value) > _MAX_LISTED else ""
+        )
+    if isinstance(value, dict):
+        return "; ".join(
+            f"{_humanize(k)}: {_format_value(v)}" for k, v in value.items()
+        )
+    return str(value)
+
+
+def format_answer(question: str, results: Any) -> Optional[str]:
+    """Template answer for a simple question, or None if the shape is unfamiliar."""
+    if results is None or is_digest(results):
+        # Digests of large results need the answerer to read their statistics
+        return None
+    if isinstance(results, dict) and len(results) == 1:
+        key, value = next(iter(results.items()))
+        if not isinstance(value, (dict, list)):
+            return f"{_humanize(key)}: {_format_value(value)}"
+    if isinstance(results, (int, float)) and not isinstance(results, bool):
+        if _COUNT_QUESTION.search(question):
+            return f"There are {_format_value(results)} matching records."
+    if isinstance(results, (int, float, str, bool)):
+        return f"The answer is {_format_value(results)}."
+    if isinstance(results, list):
+        if not results:
+            return "No matching records were found."
+        if len(results) == 1 and isinstance(results[0], dict):
+            return _format_value(results[0])
+        # Queries cap their rows, so this is what came back, not a total count
+        lines = [f"Showing {len(results):,} records:"]
+        for item in results[:_MAX_LISTED]:
+            lines.append(f"- {_format_value(item)}")
+        if len(results) > _MAX_LISTED:
+            lines.append(f"- ...and {len(results) - _MAX_LISTED:,} more")
+        return "\n".join(lines)
+    if isinstance(results, dict):
+        return _format_value(results)
+    return None
@@ -0,0 +1,182 @@
+"""Admission control for chat turns across websocket sessions.
+
+Turns are queued per session (so one user's messages run in order) and
+dispatched round-robin across sessions by a fixed number of turn workers.
+Inside a turn, the expensive stages each have their own global concurrency
+limit (see ``stage``).
+"""
+
+import asyncio
+import os
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Deque, Dict, Optional
+
+
+class QueueFull(Exception):
+    """Raised by ``submit`` when the session's or the global queue is full."""
+
+
+def _stage_limits_from_env() -> Dict[str, int]:
+    executor = int(os.getenv("EXECUTOR_CONCURRENCY", "8"))
+    workers = int(os.getenv("EXECUTOR_WORKERS", "2"))
+    if workers > 0:
+        # Runs beyond the worker count would wait inside the pool, where the
+        # wait counts against their time limit and can get healthy workers killed
+        executor = min(executor, workers)
+    return {
+        "llm": int(os.getenv("LLM_CONCURRENCY", "16")),
+        "executor": executor,
+        "mongo": int(os.getenv("MONGO_CONCURRENCY", "32")),
+    }
+
+
+class TurnScheduler:
+    """Per-session FIFO queues served fairly by ``max_concurrent_turns`` workers."""
+
+    def __init__(
+        self,
+        max_concurrent_turns: int = 32,
+        max_queue_per_session: int = 4,
+        max_queued_total: int = 512,
+        stage_limits: Optional[Dict[str, int]] = None,
+    ):
+        self.max_concurrent_turns = max_concurrent_turns
+        self.max_queue_per_session = max_queue_per_session
+        self.max_queued_total = max_queued_total
+        self.stage_limits = stage_limits or _stage_limits_from_env()
+        self._stages = {
+            name: asyncio.Semaphore(limit) for name, limit in self.stage_limits.items()
+        }
+        self._queues: Dict[str, Deque] = {}
+        self._ready: Deque[str] = deque()
+        self._running = set()
+        self._turns: Dict[str, asyncio.Task] = {}
+        # Open connections per session (a client can resume on a new socket)
+        self._connections: Dict[str, int] = {}
+        self._queued = 0
+        self._wakeup: Optional[asyncio.Condition] = None
+        self._workers = []
+
+    @classmethod
+    def from_env(cls) -> "TurnScheduler":
+        return cls(
+            max_concurrent_turns=int(os.getenv("SCHEDULER_MAX_TURNS", "32")),
+            max_queue_per_session=int(os.getenv("SCHEDULER_SESSION_QUEUE", "4")),
+            max_queued_total=int(os.getenv("SCHEDULER_MAX_QUEUED", "512")),
+        )
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        self._wakeup = asyncio.Condition()
+        self._workers = [
+            asyncio.create_task(self._worker())
+            for _ in range(self.max_concurrent_turns)
+        ]
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(
+        self, session_id: str, job: Callable[[], Awaitable[None]]
+    ) -> asyncio.Future:
+        """Queue a turn for a session; the future resolves when the turn finishes."""
+        self.start()
+        queue = self._queues.setdefault(session_id, deque())
+        if len(queue) >= self.max_queue_per_session:
+            raise QueueFull("Too many messages waiting for this session")
+        if self._queued >= self.max_queued_total:
+            raise QueueFull("The server is busy")
+        future = asyncio.get_running_loop().create_future()
+        queue.append((job, future))
+        self._queued += 1
+        async with self._wakeup:
+            if session_id not in self._running and len(queue) == 1:
+                self._ready.append(session_id)
+                self._wakeup.notify()
+        return future
+
+    def attach(self, session_id: str) -> None:
+        """Count a connection to the session; ``drop_session`` releases it."""
+        self._connections[session_id] = self._connections.get(session_id, 0) + 1
+
+    def drop_session(self, session_id: str) -> None:
+        """Release a connection (e.g. on disconnect); the last one cancels the turns.
+
+        With no connections left, the running turn and everything queued are
+        cancelled. A client that resumed the session on a new socket keeps its turns when
+        the old socket closes.
+        """
+        remaining = self._connections.get(session_id, 1) - 1
+        if remaining > 0:
+            self._connections[session_id] = remaining
+            return
+        self._connections.pop(session_id, None)
+        turn = self._turns.get(session_id)
+        if turn is not None:
+            turn.cancel()
+        queue = self._queues.pop(session_id, deque())
+        for _, future in queue:
+            future.cancel()
+        self._queued -= len(queue)
+        if session_id in self._ready:
+            self._ready.remove(session_id)
+
+    def queue_depth(self, session_id: str) -> int:
+        return len(self._queues.get(session_id, ()))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self._queued,
+            "running": len(self._running),
+            "sessions_waiting": len(self._ready),
+        }
+
+    async def _worker(self) -> None:
+        while True:
+            async with self._wakeup:
+                await self._wakeup.wait_for(lambda: bool(self._ready))
+                session_id = self._ready.popleft()
+                job, future = self._queues[session_id].popleft()
+                self._queued -= 1
+                self._running.add(session_id)
+            try:
+                if not future.cancelled():
+                    # Its own task, so dropping the session cancels the turn, not the worker
+                    turn = self._turns[session_id] = asyncio.ensure_future(job())
+                    try:
+                        await asyncio.wait([turn])
+                    except asyncio.CancelledError:
+                        turn.cancel()
+                        raise
+                    if turn.cancelled():
+                        future.cancel()
+                    else:
+                        turn.result()
+                        future.set_result(None)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self._turns.pop(session_id, None)
+                async with self._wakeup:
+                    self._running.discard(session_id)
+                    if self._queues.get(session_id):
+                        # Back of the line: other sessions go before this one's next turn
+                        self._ready.append(session_id)
+                        self._wakeup.notify()
+                    elif session_id in self._queues:
+                        del self._queues[session_id]
+
+    @asynccontextmanager
+    async def stage(self, name: str):
+        """Hold one of the global slots for a pipeline stage (llm, executor, mongo)."""
+        async with self._stages[name]:
+            yield
+
+
+scheduler = TurnScheduler.from_env()
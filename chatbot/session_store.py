@@ -0,0 +1,570 @@
+"""Persistent ADK session services: SQLite for local runs, MongoDB for deployments.
+
+Sessions live outside the server process, so they survive restarts and can
+be shared by several uvicorn workers. Events are stored one row/document
+each as zlib-compressed JSON, indexed by (app, user, session). ``get_session``
+only loads the most recent ``load_events`` events unless a
+``GetSessionConfig`` asks otherwise, and ``evict_idle`` deletes sessions
+that have not been updated within a TTL, except those ``hold`` marks as in
+use by a live connection. Writing an event recreates a session that was
+deleted elsewhere, e.g. by another worker's eviction.
+
+ADK calls the session service synchronously from the event loop, so held
+sessions are served from memory and their events are stored on a writer
+thread, in order, instead of doing disk or network I/O there.
+"""
+
+import asyncio
+import functools
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, InMemorySessionService, Session
+from google.adk.sessions.base_session_service import (
+    GetSessionConfig,
+    ListEventsResponse,
+    ListSessionsResponse,
+)
+from google.adk.sessions.state import State
+
+from . import mongo
+
+
+def session_settings() -> Dict[str, Any]:
+    return {
+        "backend": os.getenv("SESSION_BACKEND", "sqlite").lower(),
+        "sqlite_path": os.getenv("SESSION_SQLITE_PATH", "sessions.db"),
+        "mongo_database": os.getenv("SESSION_MONGO_DB", "sylvr_sessions"),
+        # Events loaded per get_session when the caller doesn't pass a config
+        "load_events": int(os.getenv("SESSION_LOAD_EVENTS", "100")),
+        "ttl_seconds": float(os.getenv("SESSION_TTL", "86400")),
+        "evict_interval": float(os.getenv("SESSION_EVICT_INTERVAL", "600")),
+    }
+
+
+def encode_event(event: Event) -> bytes:
+    return zlib.compress(event.model_dump_json(exclude_none=True).encode())
+
+
+def decode_event(data: bytes) -> Event:
+    return Event.model_validate_json(zlib.decompress(data))
+
+
+def _split_state(state: Dict[str, Any]) -> Tuple[Dict, Dict, Dict]:
+    """Session, app-scoped and user-scoped parts of a state (delta); temp: keys dropped."""
+    session_state, app_state, user_state = {}, {}, {}
+    for key, value in state.items():
+        if key.startswith(State.TEMP_PREFIX):
+            continue
+        if key.startswith(State.APP_PREFIX):
+            app_state[key[len(State.APP_PREFIX) :]] = value
+        elif key.startswith(State.USER_PREFIX):
+            user_state[key[len(State.USER_PREFIX) :]] = value
+        else:
+            session_state[key] = value
+    return session_state, app_state, user_state
+
+
+class StoredSessionService(BaseSessionService):
+    """ADK session service logic on top of a small set of storage primitives."""
+
+    def __init__(self, load_events: int = 100):
+        self.load_events = load_events
+        # (app, user, session id) -> open connections using it in this process
+        self._held: Dict[Tuple[str, str, str], int] = {}
+        # Held sessions, kept up to date in memory while their writes queue
+        self._cache: Dict[Tuple[str, str, str], Session] = {}
+        self._cache_lock = threading.Lock()
+        self._writes: queue.Queue = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+
+    # Storage primitives implemented by each backend
+    def _insert_session(self, app, user, session_id, state, update_time): ...
+
+    def _load_session(self, app, user, session_id) -> Optional[Tuple[Dict, float]]: ...
+
+    def _load_events(self, app, user, session_id, limit, after) -> List[bytes]: ...
+
+    def _store_event(self, app, user, session_id, data, timestamp, delta): ...
+
+    def _load_scoped(self, app, user) -> Tuple[Dict, Dict]: ...
+
+    def _update_scoped(self, app, user, app_delta, user_delta): ...
+
+    def _list_sessions(self, app, user) -> List[Tuple[str, float]]: ...
+
+    def _delete_session(self, app, user, session_id): ...
+
+    def _idle_sessions(self, cutoff) -> List[Tuple[str, str, str]]: ...
+
+    def hold(self, session: Session) -> None:
+        """Mark ``session`` as used by a live connection.
+
+        It isn't evicted, and is served from memory until ``release``.
+        """
+        key = (session.app_name, session.user_id, session.id)
+        self._held[key] = self._held.get(key, 0) + 1
+        with self._cache_lock:
+            self._cache.setdefault(key, session)
+
+    def release(self, session: Session) -> None:
+        key = (session.app_name, session.user_id, session.id)
+        if self._held.get(key, 0) > 1:
+            self._held[key] -= 1
+        else:
+            self._held.pop(key, None)
+        # Forget the cached copy only after the writes queued so far are stored
+        self._enqueue(functools.partial(self._uncache, key))
+
+    def _uncache(self, key):
+        with self._cache_lock:
+            if key not in self._held:
+                self._cache.pop(key, None)
+
+    def _enqueue(self, write) -> None:
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(
+                target=self._write_loop, name="session-writer", daemon=True
+            )
+            self._writer.start()
+        self._writes.put(write)
+
+    def _write_loop(self):
+        while True:
+            write = self._writes.get()
+            if write is None:
+                return
+            try:
+                write()
+            except Exception as e:
+                print(f"⚠️ Session write failed: {e}")
+
+    def close(self) -> None:
+        """Store anything still pending; called on shutdown."""
+        if self._writer is not None and self._writer.is_alive():
+            self._writes.put(None)
+            self._writer.join()
+        self._writer = None
+
+    def evict_idle(self, ttl_seconds: float) -> int:
+        """Delete sessions idle for longer than ``ttl_seconds``; returns how many.
+
+        Sessions held by a live connection are skipped, however long they've
+        been quiet.
+        """
+        held = set(self._held)
+        idle = [
+            tuple(key)
+            for key in self._idle_sessions(time.time() - ttl_seconds)
+            if tuple(key) not in held
+        ]
+        for app, user, session_id in idle:
+            self._delete_session(app, user, session_id)
+        return len(idle)
+
+    def _with_scoped_state(self, session: Session) -> Session:
+        app_state, user_state = self._load_scoped(session.app_name, session.user_id)
+        for key, value in app_state.items():
+            session.state[State.APP_PREFIX + key] = value
+        for key, value in user_state.items():
+            session.state[State.USER_PREFIX + key] = value
+        return session
+
+    def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        session_id = (session_id or "").strip() or str(uuid.uuid4())
+        session_state, app_delta, user_delta = _split_state(state or {})
+        now = time.time()
+        self._insert_session(app_name, user_id, session_id, session_state, now)
+        if app_delta or user_delta:
+            self._update_scoped(app_name, user_id, app_delta, user_delta)
+        session = Session(
+            app_name=app_name,
+            user_id=user_id,
+            id=session_id,
+            state=session_state,
+            last_update_time=now,
+        )
+        return self._with_scoped_state(session)
+
+    def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        with self._cache_lock:
+            cached = self._cache.get((app_name, user_id, session_id))
+        if cached is not None:
+            events = cached.events
+            limit = self.load_events
+            if config is not None:
+                limit = config.num_recent_events or limit
+                if config.after_timestamp is not None:
+                    events = [
+                        e for e in events if e.timestamp >= config.after_timestamp
+                    ]
+            return cached.model_copy(
+                update={"events": events[-limit:], "state": dict(cached.state)}
+            )
+        row = self._load_session(app_name, user_id, session_id)
+        if row is None:
+            return None
+        state, update_time = row
+        limit = self.load_events
+        after = None
+        if config is not None:
+            limit = config.num_recent_events or limit
+            after = config.after_timestamp
+        events = [
+            decode_event(data)
+            for data in self._load_events(app_name, user_id, session_id, limit, after)
+        ]
+        session = Session(
+            app_name=app_name,
+            user_id=user_id,
+            id=session_id,
+            state=state,
+            events=events,
+            last_update_time=update_time,
+        )
+        return self._with_scoped_state(session)
+
+    def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        with self._cache_lock:
+            cached = self._cache.get((session.app_name, session.user_id, session.id))
+            if cached is not None and cached is not session:
+                super().append_event(session=cached, event=event)
+                cached.last_update_time = event.timestamp
+                del cached.events[: -self.load_events]
+        super().append_event(session=session, event=event)
+        session.last_update_time = event.timestamp
+        session_delta, app_delta, user_delta = _split_state(
+            (event.actions.state_delta if event.actions else None) or {}
+        )
+        self._persist_event(
+            session.app_name,
+            session.user_id,
+            session.id,
+            encode_event(event),
+            event.timestamp,
+            session_delta,
+            app_delta,
+            user_delta,
+        )
+        return event
+
+    def _persist_event(self, app, user, session_id, *args):
+        if (app, user, session_id) in self._held:
+            self._enqueue(
+                functools.partial(self._write_event, app, user, session_id, *args)
+            )
+        else:
+            self._write_event(app, user, session_id, *args)
+
+    def _write_event(
+        self, app, user, session_id, data, timestamp, delta, app_delta, user_delta
+    ):
+        self._store_event(app, user, session_id, data, timestamp, delta)
+        if app_delta or user_delta:
+            self._update_scoped(app, user, app_delta, user_delta)
+
+    def list_sessions(self, *, app_name: str, user_id: str) -> ListSessionsResponse:
+        return ListSessionsResponse(
+            sessions=[
+                Session(
+                    app_name=app_name,
+                    user_id=user_id,
+                    id=session_id,
+                    last_update_time=update_time,
+                )
+                for session_id, update_time in self._list_sessions(app_name, user_id)
+            ]
+        )
+
+    def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        self._delete_session(app_name, user_id, session_id)
+
+    def list_events(
+        self, *, app_name: str, user_id: str, session_id: str
+    ) -> ListEventsResponse:
+        return ListEventsResponse(
+            events=[
+                decode_event(data)
+                for data in self._load_events(app_name, user_id, session_id, None, None)
+            ]
+        )
+
+
+class SqliteSessionService(StoredSessionService):
+    """Sessions in a local SQLite file (WAL mode, so several workers can share it)."""
+
+    def __init__(self, path: str = "sessions.db", load_events: int = 100):
+        super().__init__(load_events)
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    app TEXT, user TEXT, id TEXT, state TEXT, update_time REAL,
+                    PRIMARY KEY (app, user, id)
+                );
+                CREATE INDEX IF NOT EXISTS sessions_update_time ON sessions (update_time);
+                CREATE TABLE IF NOT EXISTS events (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    app TEXT, user TEXT, session_id TEXT, timestamp REAL, data BLOB
+                );
+                CREATE INDEX IF NOT EXISTS events_session ON events (app, user, session_id, seq);
+                CREATE TABLE IF NOT EXISTS scoped_state (scope TEXT PRIMARY KEY, state TEXT);
+                """)
+
+    def _insert_session(self, app, user, session_id, state, update_time):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)",
+                (app, user, session_id, json.dumps(state, default=str), update_time),
+            )
+
+    def _load_session(self, app, user, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, update_time FROM sessions WHERE app=? AND user=? AND id=?",
+                (app, user, session_id),
+            ).fetchone()
+        return None if row is None else (json.loads(row[0]), row[1])
+
+    def _load_events(self, app, user, session_id, limit, after):
+        query = "SELECT data FROM events WHERE app=? AND user=? AND session_id=?"
+        params: list = [app, user, session_id]
+        if after is not None:
+            query += " AND timestamp >= ?"
+            params.append(after)
+        query += " ORDER BY seq DESC"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [row[0] for row in reversed(rows)]
+
+    def _store_event(self, app, user, session_id, data, timestamp, delta):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO events (app, user, session_id, timestamp, data) VALUES (?, ?, ?, ?, ?)",
+                    (app, user, session_id, timestamp, data),
+                )
+                row = self._conn.execute(
+                    "SELECT state FROM sessions WHERE app=? AND user=? AND id=?",
+                    (app, user, session_id),
+                ).fetchone()
+                state = json.loads(row[0]) if row else {}
+                state.update(delta)
+                # Recreates the row if the session was deleted meanwhile
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)",
+                    (app, user, session_id, json.dumps(state, default=str), timestamp),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _scoped(self, scope):
+        row = self._conn.execute(
+            "SELECT state FROM scoped_state WHERE scope=?", (scope,)
+        ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def _load_scoped(self, app, user):
+        with self._lock:
+            return self._scoped(f"app:{app}"), self._scoped(f"user:{app}:{user}")
+
+    def _update_scoped(self, app, user, app_delta, user_delta):
+        with self._lock:
+            for scope, delta in (
+                (f"app:{app}", app_delta),
+                (f"user:{app}:{user}", user_delta),
+            ):
+                if delta:
+                    state = {**self._scoped(scope), **delta}
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO scoped_state VALUES (?, ?)",
+                        (scope, json.dumps(state, default=str)),
+                    )
+
+    def _list_sessions(self, app, user):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, update_time FROM sessions WHERE app=? AND user=?",
+                (app, user),
+            ).fetchall()
+
+    def _delete_session(self, app, user, session_id):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM events WHERE app=? AND user=? AND session_id=?",
+                (app, user, session_id),
+            )
+            self._conn.execute(
+                "DELETE FROM sessions WHERE app=? AND user=? AND id=?",
+                (app, user, session_id),
+            )
+
+    def _idle_sessions(self, cutoff):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT app, user, id FROM sessions WHERE update_time < ?", (cutoff,)
+            ).fetchall()
+
+
+class MongoSessionService(StoredSessionService):
+    """Sessions in MongoDB, on the shared client pool from ``mongo.get_client``."""
+
+    def __init__(self, database: str = "sylvr_sessions", load_events: int = 100):
+        super().__init__(load_events)
+        self.database_name = database
+        self._indexed = False
+
+    @property
+    def _db(self):
+        db = mongo.get_client()[self.database_name]
+        if not self._indexed:
+            db.sessions.create_index(
+                [("app", 1), ("user", 1), ("session_id", 1)], unique=True
+            )
+            db.sessions.create_index("update_time")
+            db.events.create_index(
+                [("app", 1), ("user", 1), ("session_id", 1), ("timestamp", 1)]
+            )
+            self._indexed = True
+        return db
+
+    @staticmethod
+    def _key(app, user, session_id):
+        return {"app": app, "user": user, "session_id": session_id}
+
+    def _insert_session(self, app, user, session_id, state, update_time):
+        self._db.sessions.replace_one(
+            self._key(app, user, session_id),
+            {
+                **self._key(app, user, session_id),
+                "state": state,
+                "update_time": update_time,
+            },
+            upsert=True,
+        )
+
+    def _load_session(self, app, user, session_id):
+        doc = self._db.sessions.find_one(self._key(app, user, session_id))
+        return None if doc is None else (doc.get("state", {}), doc["update_time"])
+
+    def _load_events(self, app, user, session_id, limit, after):
+        query = self._key(app, user, session_id)
+        if after is not None:
+            query["timestamp"] = {"$gte": after}
+        cursor = self._db.events.find(query, {"data": 1}).sort(
+            [("timestamp", -1), ("_id", -1)]
+        )
+        if limit:
+            cursor = cursor.limit(limit)
+        return [bytes(doc["data"]) for doc in cursor][::-1]
+
+    def _store_event(self, app, user, session_id, data, timestamp, delta):
+        db = self._db
+        db.events.insert_one(
+            {**self._key(app, user, session_id), "timestamp": timestamp, "data": data}
+        )
+        # Field-level $set, so concurrent workers don't overwrite each other's keys
+        update = {f"state.{key}": value for key, value in delta.items()}
+        # Upserted, so a session deleted meanwhile is recreated
+        db.sessions.update_one(
+            self._key(app, user, session_id),
+            {"$set": {**update, "update_time": timestamp}},
+            upsert=True,
+        )
+
+    def _load_scoped(self, app, user):
+        docs = {
+            doc["_id"]: doc.get("state", {})
+            for doc in self._db.scoped_state.find(
+                {"_id": {"$in": [f"app:{app}", f"user:{app}:{user}"]}}
+            )
+        }
+        return docs.get(f"app:{app}", {}), docs.get(f"user:{app}:{user}", {})
+
+    def _update_scoped(self, app, user, app_delta, user_delta):
+        for scope, delta in (
+            (f"app:{app}", app_delta),
+            (f"user:{app}:{user}", user_delta),
+        ):
+            if delta:
+                self._db.scoped_state.update_one(
+                    {"_id": scope},
+                    {"$set": {f"state.{key}": value for key, value in delta.items()}},
+                    upsert=True,
+                )
+
+    def _list_sessions(self, app, user):
+        return [
+            (doc["session_id"], doc["update_time"])
+            for doc in self._db.sessions.find(
+                {"app": app, "user": user}, {"session_id": 1, "update_time": 1}
+            )
+        ]
+
+    def _delete_session(self, app, user, session_id):
+        self._db.events.delete_many(self._key(app, user, session_id))
+        self._db.sessions.delete_one(self._key(app, user, session_id))
+
+    def _idle_sessions(self, cutoff):
+        return [
+            (doc["app"], doc["user"], doc["session_id"])
+            for doc in self._db.sessions.find(
+                {"update_time": {"$lt": cutoff}}, {"app": 1, "user": 1, "session_id": 1}
+            )
+        ]
+
+
+def session_service_from_env() -> BaseSessionService:
+    """The session service picked by SESSION_BACKEND (sqlite, mongo or memory)."""
+    settings = session_settings()
+    if settings["backend"] == "mongo":
+        return MongoSessionService(settings["mongo_database"], settings["load_events"])
+    if settings["backend"] == "memory":
+        return InMemorySessionService()
+    return SqliteSessionService(settings["sqlite_path"], settings["load_events"])
+
+
+async def eviction_loop(service: StoredSessionService, ttl: float, interval: float):
+    """Delete idle sessions every ``interval`` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            evicted = await asyncio.to_thread(service.evict_idle, ttl)
+            if evicted:
+                print(f"✅ Evicted {evicted} idle sessions")
+        except Exception as e:
+            print(f"⚠️ Session eviction failed: {e}")
@@ -0,0 +1,104 @@
+"""Warm-up and readiness of the chat server's components.
+
+With ``STARTUP_MODE=background`` (the default) the server takes connections
+as soon as its lifespan has created the Mongo client and executor pool; the
+Mongo ping and the executor workers' warm-up (imports, connection, schema)
+continue in the background, and ``GET /ready`` answers 503 until the
+components in ``READY_REQUIRES`` are warm. ``blocking`` waits for them before
+serving, as before. Turns that arrive early queue for the warming workers.
+
+A component whose warm-up fails is retried with backoff (``keep_warm``), and
+components with a ``check`` probe follow it after warming up, so ``/ready``
+recovers without a restart once e.g. the cluster answers pings again.
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Callable, Dict, List
+
+# Backoff between warm-up attempts of a component that failed
+_RETRY_SECONDS = 5
+_MAX_RETRY_SECONDS = 300
+
+
+def startup_settings() -> Dict[str, Any]:
+    return {
+        "mode": os.getenv("STARTUP_MODE", "background").lower(),
+        "required": [
+            name.strip()
+            for name in os.getenv("READY_REQUIRES", "mongo,executor").split(",")
+            if name.strip()
+        ],
+    }
+
+
+class Readiness:
+    """Warm-up state of each component: warming, ready or failed."""
+
+    def __init__(self):
+        self.components: Dict[str, Dict[str, Any]] = {}
+        self._checks: Dict[str, Callable[[], bool]] = {}
+
+    async def warm(self, name: str, fn: Callable, *args) -> bool:
+        """Run blocking ``fn`` off the event loop and record how ``name`` warmed up.
+
+        A ``False`` return counts as a failure, as with ``mongo.ping``.
+        """
+        component = self.components.setdefault(name, {"attempts": 0})
+        component.update(state="warming", seconds=None, error=None)
+        component["attempts"] += 1
+        start = time.perf_counter()
+        try:
+            ok = await asyncio.to_thread(fn, *args) is not False
+            error = None if ok else "warm-up check failed"
+        except Exception as e:
+            ok, error = False, str(e)
+        component.update(
+            state="ready" if ok else "failed",
+            seconds=round(time.perf_counter() - start, 2),
+            error=error,
+        )
+        if ok:
+            print(f"✅ {name} warm after {component['seconds']}s")
+        else:
+            print(f"⚠️ {name} warm-up failed: {error}")
+        return ok
+
+    async def keep_warm(self, name: str, fn: Callable, *args) -> None:
+        """``warm`` until it succeeds, backing off between failed attempts."""
+        delay = _RETRY_SECONDS
+        if self.components.get(name, {}).get("state") == "ready":
+            return
+        while not await self.warm(name, fn, *args):
+            print(f"⚠️ Retrying {name} warm-up in {delay:.0f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, _MAX_RETRY_SECONDS)
+
+    def check(self, name: str, probe: Callable[[], bool]) -> None:
+        """Report ``name`` as ready whenever ``probe()`` is true.
+
+        For a component that is also warmed up, the probe takes over: a failed
+        warm-up counts as ready once the probe passes, and a warm component as
+        failed while it doesn't.
+        """
+        self._checks[name] = probe
+
+    def report(self, required: List[str]) -> Dict[str, Any]:
+        components = {name: dict(status) for name, status in self.components.items()}
+        for name, probe in self._checks.items():
+            status = components.setdefault(name, {"state": "warming"})
+            if probe():
+                status["state"] = "ready"
+            elif status["state"] == "ready":
+                status["state"] = "failed"
+        # Components that were never started (e.g. MONGODB_WARMUP=0) don't block
+        ready = all(
+            components[name]["state"] == "ready"
+            for name in required
+            if name in components
+        )
+        return {"ready": ready, "required": required, "components": components}
+
+
+readiness = Readiness()
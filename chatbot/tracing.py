@@ -0,0 +1,351 @@
+"""Tracing spans and latency histograms for the chat pipeline.
+
+ADK already opens OpenTelemetry spans for every invocation, agent run
+("agent_run [query_planner_agent]") and model call. ``setup`` installs a
+tracer provider that receives those together with the app's own spans:
+websocket receive/send, chat turns, model latency per agent with token
+counts, executor runs and Mongo commands (including the ones generated code
+ran in executor workers). Finished spans feed per-span latency histograms,
+served in Prometheus text format on /metrics and as p50/p95/p99 on
+/metrics/latency; with TRACE_FILE set they are also appended to a file as
+OTLP-style JSON lines.
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Sequence
+
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    SpanExporter,
+    SpanExportResult,
+)
+
+from . import mongo
+
+tracer = trace.get_tracer("sylvr.chatbot")
+
+# Upper bounds in seconds of the histogram buckets
+_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+_QUANTILES = (0.5, 0.95, 0.99)
+# ADK puts whole model requests and responses in span attributes
+_MAX_ATTRIBUTE_CHARS = 512
+
+# (start time in ns, estimated prompt tokens) of the model call in flight
+_model_started: ContextVar[Optional[tuple]] = ContextVar("model_started", default=None)
+_provider: Optional[TracerProvider] = None
+
+
+def tracing_settings() -> Dict[str, Any]:
+    return {
+        "enabled": os.getenv("TRACING_ENABLED", "1").lower() in ("1", "true", "yes"),
+        # Empty disables the JSON lines export
+        "file": os.getenv("TRACE_FILE", ""),
+        "window": int(os.getenv("TRACE_WINDOW", "1024")),
+    }
+
+
+class LatencyHistogram:
+    """Cumulative bucket counts plus a window of recent samples for quantiles."""
+
+    def __init__(self, window: int = 1024):
+        self.buckets = [0] * (len(_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        self.buckets[bisect.bisect_left(_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+
+    def quantiles(self) -> Dict[float, float]:
+        ordered = sorted(self.recent)
+        if not ordered:
+            return {}
+        return {
+            q: ordered[min(int(q * len(ordered)), len(ordered) - 1)] for q in _QUANTILES
+        }
+
+
+def _label(value: Any) -> str:
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'"{text}"'
+
+
+def _labels(**labels) -> str:
+    return ",".join(f"{key}={_label(value)}" for key, value in labels.items())
+
+
+class Metrics:
+    """Span latency histograms and counters, rendered for Prometheus."""
+
+    COUNTERS = {
+        "sylvr_llm_tokens_total": "Model tokens by agent and kind (input/output).",
+        "sylvr_mongo_documents_total": "Documents returned by Mongo commands.",
+        "sylvr_mongo_commands_total": "Mongo commands run, by command and collection.",
+    }
+
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self._spans: Dict[str, LatencyHistogram] = {}
+        self._counters: Dict[str, Dict[tuple, float]] = {
+            name: {} for name in self.COUNTERS
+        }
+        self._lock = threading.Lock()
+
+    def observe(self, span: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self._spans.get(span)
+            if histogram is None:
+                histogram = self._spans[span] = LatencyHistogram(self.window)
+            histogram.observe(seconds)
+
+    def increment(self, counter: str, value: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            values = self._counters[counter]
+            values[key] = values.get(key, 0) + value
+
+    def latency(self) -> Dict[str, Dict[str, float]]:
+        """Count and recent p50/p95/p99 in milliseconds per span name."""
+        with self._lock:
+            return {
+                span: {
+                    "count": histogram.count,
+                    **{
+                        f"p{int(q * 100)}_ms": round(value * 1000, 2)
+                        for q, value in histogram.quantiles().items()
+                    },
+                }
+                for span, histogram in sorted(self._spans.items())
+            }
+
+    def render(self) -> str:
+        lines = [
+            "# HELP sylvr_span_duration_seconds Duration of traced pipeline stages.",
+            "# TYPE sylvr_span_duration_seconds histogram",
+        ]
+        with self._lock:
+            spans = sorted(self._spans.items())
+            for span, histogram in spans:
+                cumulative = 0
+                for bound, count in zip(_BUCKETS + ("+Inf",), histogram.buckets):
+                    cumulative += count
+                    lines.append(
+                        f"sylvr_span_duration_seconds_bucket{{{_labels(span=span, le=bound)}}} {cumulative}"
+                    )
+                lines.append(
+                    f"sylvr_span_duration_seconds_sum{{{_labels(span=span)}}} {histogram.total}"
+                )
+                lines.append(
+                    f"sylvr_span_duration_seconds_count{{{_labels(span=span)}}} {histogram.count}"
+                )
+            lines += [
+                "# HELP sylvr_span_recent_duration_seconds Quantiles over the most recent spans.",
+                "# TYPE sylvr_span_recent_duration_seconds summary",
+            ]
+            for span, histogram in spans:
+                for q, value in histogram.quantiles().items():
+                    lines.append(
+                        f"sylvr_span_recent_duration_seconds{{{_labels(span=span, quantile=q)}}} {value}"
+                    )
+                lines.append(
+                    f"sylvr_span_recent_duration_seconds_sum{{{_labels(span=span)}}} {sum(histogram.recent)}"
+                )
+                lines.append(
+                    f"sylvr_span_recent_duration_seconds_count{{{_labels(span=span)}}} {len(histogram.recent)}"
+                )
+            for counter, description in self.COUNTERS.items():
+                lines += [
+                    f"# HELP {counter} {description}",
+                    f"# TYPE {counter} counter",
+                ]
+                for key, value in sorted(self._counters[counter].items()):
+                    lines.append(f"{counter}{{{_labels(**dict(key))}}} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics(tracing_settings()["window"])
+
+
+class MetricsSpanProcessor(SpanProcessor):
+    """Feeds every finished span's duration into ``metrics``."""
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if span.start_time is not None and span.end_time is not None:
+            metrics.observe(span.name, (span.end_time - span.start_time) / 1e9)
+
+
+def _attribute(value: Any) -> Any:
+    if isinstance(value, str) and len(value) > _MAX_ATTRIBUTE_CHARS:
+        return value[:_MAX_ATTRIBUTE_CHARS] + "…"
+    return list(value) if isinstance(value, tuple) else value
+
+
+class JsonLinesSpanExporter(SpanExporter):
+    """Appends spans to a file, one OTLP-style JSON object per line."""
+
+    def __init__(self, path: str):
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        lines = []
+        for span in spans:
+            parent = span.parent
+            lines.append(
+                json.dumps(
+                    {
+                        "traceId": format(span.context.trace_id, "032x"),
+                        "spanId": format(span.context.span_id, "016x"),
+                        "parentSpanId": (
+                            format(parent.span_id, "016x") if parent else None
+                        ),
+                        "name": span.name,
+                        "startTimeUnixNano": span.start_time,
+                        "endTimeUnixNano": span.end_time,
+                        "durationMs": round((span.end_time - span.start_time) / 1e6, 3),
+                        "status": span.status.status_code.name,
+                        "attributes": {
+                            key: _attribute(value)
+                            for key, value in (span.attributes or {}).items()
+                        },
+                    },
+                    default=str,
+                )
+            )
+        with self._lock:
+            self._file.write("\n".join(lines) + "\n")
+            self._file.flush()
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def record_mongo_command(record: Dict[str, Any]) -> None:
+    """A finished Mongo command (see ``mongo.CommandTimer``) as a span and counters."""
+    command = record["command"]
+    collection = record["collection"] or ""
+    span = tracer.start_span(
+        f"mongo.{command}",
+        start_time=record["start_ns"],
+        attributes={
+            "db.operation": command,
+            "db.mongodb.collection": collection,
+            "db.documents": record["documents"] or 0,
+            "db.failed": record["failed"],
+        },
+    )
+    span.end(end_time=record["end_ns"])
+    metrics.increment(
+        "sylvr_mongo_commands_total", command=command, collection=collection
+    )
+    if record["documents"]:
+        metrics.increment(
+            "sylvr_mongo_documents_total",
+            record["documents"],
+            command=command,
+            collection=collection,
+        )
+
+
+def record_execution(
+    span, result: Dict[str, Any], commands: List[Dict[str, Any]]
+) -> None:
+    """Annotate an executor span with the run's outcome and replay its Mongo commands."""
+    for record in commands:
+        record_mongo_command(record)
+    span.set_attribute("executor.failed", bool(result["stderr"]))
+    if result["duration_ms"] is not None:
+        span.set_attribute("executor.run_ms", result["duration_ms"])
+    span.set_attribute("mongo.commands", len(commands))
+    span.set_attribute(
+        "mongo.documents", sum(record["documents"] or 0 for record in commands)
+    )
+    span.set_attribute(
+        "mongo.time_ms",
+        round(sum(r["end_ns"] - r["start_ns"] for r in commands) / 1e6, 2),
+    )
+
+
+def _estimate_tokens(contents) -> int:
+    return sum(len(part.text or "") for c in contents for part in c.parts or []) // 4
+
+
+def start_model_timer(callback_context, llm_request) -> None:
+    """before_model_callback: remember when the model request was sent."""
+    _model_started.set((time.time_ns(), _estimate_tokens(llm_request.contents)))
+    return None
+
+
+def record_model_call(callback_context, llm_response) -> None:
+    """after_model_callback: a "model [agent]" span with latency and token counts.
+
+    ADK versions whose LlmResponse carries no usage_metadata get estimated
+    counts (four characters per token), marked with gen_ai.usage.estimated.
+    """
+    started = _model_started.get()
+    if started is None or llm_response.partial:
+        return None
+    _model_started.set(None)
+    started_ns, input_tokens = started
+    agent = callback_context.agent_name
+    usage = getattr(llm_response, "usage_metadata", None)
+    if usage is not None:
+        input_tokens = usage.prompt_token_count or 0
+        output_tokens = usage.candidates_token_count or 0
+    elif llm_response.content is not None:
+        output_tokens = _estimate_tokens([llm_response.content])
+    else:
+        output_tokens = 0
+    metrics.increment("sylvr_llm_tokens_total", input_tokens, agent=agent, kind="input")
+    metrics.increment(
+        "sylvr_llm_tokens_total", output_tokens, agent=agent, kind="output"
+    )
+    tracer.start_span(
+        f"model [{agent}]",
+        start_time=started_ns,
+        attributes={
+            "agent": agent,
+            "gen_ai.usage.input_tokens": input_tokens,
+            "gen_ai.usage.output_tokens": output_tokens,
+            "gen_ai.usage.estimated": usage is None,
+        },
+    ).end()
+    return None
+
+
+def setup() -> None:
+    """Install the tracer provider and hook Mongo command timing into it (once)."""
+    global _provider
+    settings = tracing_settings()
+    if _provider is not None or not settings["enabled"]:
+        return
+    _provider = TracerProvider(
+        resource=Resource.create({"service.name": "sylvr-chatbot"})
+    )
+    _provider.add_span_processor(MetricsSpanProcessor())
+    if settings["file"]:
+        _provider.add_span_processor(
+            BatchSpanProcessor(JsonLinesSpanExporter(settings["file"]))
+        )
+    trace.set_tracer_provider(_provider)
+    mongo.on_command(record_mongo_command)
+
+
+def shutdown() -> None:
+    """Flush spans still waiting to be exported."""
+    if _provider is not None:
+        _provider.shutdown()
@@ -0,0 +1,264 @@
+"""Materialized views over sample_analytics for the questions asked most often.
+
+``mv_account_rollups``
+    One document per account_id / transaction_code / symbol / month with the
+    trade count, summed amount and summed total, so per-account questions
+    don't ``$unwind`` the whole ``transactions`` array.
+``mv_tier_distribution``
+    Customers and tier entries per tier from ``customers.tier_and_details``.
+``mv_account_products``
+    Accounts and summed limits per product from ``accounts.products``.
+
+Views are rebuilt on a schedule (every five minutes by default) and, when
+change streams are enabled, the rollups of the accounts that changed are
+recomputed as changes arrive. The agents are told how far the views can lag.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from . import mongo
+
+ROLLUPS = "mv_account_rollups"
+TIERS = "mv_tier_distribution"
+PRODUCTS = "mv_account_products"
+
+
+def views_settings() -> Dict:
+    return {
+        "enabled": os.getenv("VIEWS_ENABLED", "1").lower() in ("1", "true", "yes"),
+        "refresh_interval": float(os.getenv("VIEWS_REFRESH_INTERVAL", "300")),
+        "change_streams": os.getenv("VIEWS_CHANGE_STREAMS", "0").lower()
+        in ("1", "true", "yes"),
+        # Seconds to collect changed accounts before recomputing their rollups
+        "debounce": float(os.getenv("VIEWS_CHANGE_DEBOUNCE", "2")),
+    }
+
+
+def _rollup_pipeline(
+    match: Optional[Dict] = None, stamp: Optional[float] = None
+) -> List[Dict]:
+    return [
+        {"$match": match or {}},
+        {"$unwind": "$transactions"},
+        {
+            "$group": {
+                "_id": {
+                    "account_id": "$account_id",
+                    "transaction_code": "$transactions.transaction_code",
+                    "symbol": "$transactions.symbol",
+                    "month": {
+                        "$dateToString": {
+                            "format": "%Y-%m",
+                            "date": "$transactions.date",
+                        }
+                    },
+                },
+                "count": {"$sum": 1},
+                "amount": {"$sum": "$transactions.amount"},
+                "total": {"$sum": {"$toDouble": "$transactions.total"}},
+            }
+        },
+        {
+            "$addFields": {
+                "account_id": "$_id.account_id",
+                "transaction_code": "$_id.transaction_code",
+                "symbol": "$_id.symbol",
+                "month": "$_id.month",
+                "refreshed_at": {"$literal": stamp},
+            }
+        },
+    ]
+
+
+def _tier_pipeline() -> List[Dict]:
+    return [
+        {"$project": {"details": {"$objectToArray": "$tier_and_details"}}},
+        {"$unwind": "$details"},
+        {
+            "$group": {
+                "_id": "$details.v.tier",
+                "tier_entries": {"$sum": 1},
+                "active_entries": {"$sum": {"$cond": ["$details.v.active", 1, 0]}},
+                "customers": {"$addToSet": "$_id"},
+            }
+        },
+        {
+            "$project": {
+                "tier": "$_id",
+                "tier_entries": 1,
+                "active_entries": 1,
+                "customer_count": {"$size": "$customers"},
+            }
+        },
+        {"$out": TIERS},
+    ]
+
+
+def _products_pipeline() -> List[Dict]:
+    return [
+        {"$unwind": "$products"},
+        {
+            "$group": {
+                "_id": "$products",
+                "account_count": {"$sum": 1},
+                "total_limit": {"$sum": "$limit"},
+            }
+        },
+        {"$project": {"product": "$_id", "account_count": 1, "total_limit": 1}},
+        {"$out": PRODUCTS},
+    ]
+
+
+def refresh_rollups(db, account_ids: Optional[Iterable[int]] = None) -> None:
+    """Rebuild every rollup, or only those of the given accounts."""
+    if account_ids is None:
+        db.transactions.aggregate(_rollup_pipeline() + [{"$out": ROLLUPS}])
+    else:
+        # Merge first, then drop the accounts' rows this pass didn't write, so
+        # readers never see the accounts without rollups
+        ids = list(account_ids)
+        stamp = time.time()
+        db.transactions.aggregate(
+            _rollup_pipeline({"account_id": {"$in": ids}}, stamp)
+            + [{"$merge": {"into": ROLLUPS, "whenMatched": "replace"}}]
+        )
+        db[ROLLUPS].delete_many(
+            {"account_id": {"$in": ids}, "refreshed_at": {"$ne": stamp}}
+        )
+    db[ROLLUPS].create_index("account_id")
+    db[ROLLUPS].create_index([("transaction_code", 1), ("symbol", 1), ("month", 1)])
+
+
+def refresh_tiers(db) -> None:
+    db.customers.aggregate(_tier_pipeline())
+
+
+def refresh_products(db) -> None:
+    db.accounts.aggregate(_products_pipeline())
+
+
+def refresh_all(db=None) -> None:
+    db = db if db is not None else mongo.get_database()
+    start = time.perf_counter()
+    refresh_rollups(db)
+    refresh_tiers(db)
+    refresh_products(db)
+    print(f"✅ Materialized views refreshed in {time.perf_counter() - start:.1f}s")
+
+
+async def refresh_loop(interval: float) -> None:
+    """Rebuild all views now and then every ``interval`` seconds."""
+    while True:
+        try:
+            await mongo.run_blocking(refresh_all)
+        except Exception as e:
+            print(f"⚠️ Materialized view refresh failed: {e}")
+        await asyncio.sleep(interval)
+
+
+class ChangeStreamRefresher:
+    """Keeps views current from a database change stream, on a background thread.
+
+    Transaction changes mark their account dirty; dirty rollups are rebuilt
+    after ``debounce`` seconds. Customer and account changes rebuild the
+    (small) tier and product views. ``on_change`` is called with the name of
+    each collection that changed, e.g. to invalidate cached answers.
+    """
+
+    def __init__(self, debounce: float = 2, on_change: Optional[Callable] = None):
+        self.debounce = debounce
+        self.on_change = on_change
+        self._dirty_accounts = set()
+        self._dirty_views = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._stream = None
+
+    def start(self) -> None:
+        threading.Thread(target=self._watch, daemon=True).start()
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._stream is not None:
+            self._stream.close()
+
+    def _watch(self) -> None:
+        db = mongo.get_database()
+        pipeline = [
+            {"$match": {"ns.coll": {"$in": ["accounts", "customers", "transactions"]}}}
+        ]
+        try:
+            with db.watch(pipeline, full_document="updateLookup") as stream:
+                self._stream = stream
+                for change in stream:
+                    self._record(change)
+        except Exception as e:
+            if not self._stop.is_set():
+                print(f"⚠️ Change stream stopped, relying on scheduled refresh: {e}")
+
+    def _record(self, change: Dict) -> None:
+        collection = change["ns"]["coll"]
+        with self._lock:
+            if collection == "transactions":
+                account_id = (change.get("fullDocument") or {}).get("account_id")
+                if account_id is None:
+                    # Deletes only carry the _id: rebuild every rollup
+                    self._dirty_views.add(ROLLUPS)
+                else:
+                    self._dirty_accounts.add(account_id)
+            elif collection == "customers":
+                self._dirty_views.add(TIERS)
+            else:
+                self._dirty_views.add(PRODUCTS)
+        if self.on_change is not None:
+            self.on_change(collection)
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.debounce):
+            with self._lock:
+                accounts, self._dirty_accounts = self._dirty_accounts, set()
+                dirty_views, self._dirty_views = self._dirty_views, set()
+            if not accounts and not dirty_views:
+                continue
+            db = mongo.get_database()
+            try:
+                if ROLLUPS in dirty_views:
+                    refresh_rollups(db)
+                elif accounts:
+                    refresh_rollups(db, accounts)
+                if TIERS in dirty_views:
+                    refresh_tiers(db)
+                if PRODUCTS in dirty_views:
+                    refresh_products(db)
+            except Exception as e:
+                print(f"⚠️ Incremental view refresh failed: {e}")
+
+
+def _staleness(settings: Dict) -> str:
+    """How far the views can lag the raw collections, for the agents."""
+    if settings["change_streams"]:
+        return "within seconds of changes"
+    if settings["refresh_interval"] > 0:
+        return f"every {settings['refresh_interval'] / 60:g} minutes"
+    return "only at startup"
+
+
+def prompt_section() -> str:
+    """Description of the views for agent instructions ("" when views are off)."""
+    settings = views_settings()
+    if not settings["enabled"]:
+        return ""
+    return f"""
+        Precomputed views (prefer these over $unwind on transactions whenever they can answer the question):
+
+        {ROLLUPS}: one document per account_id, transaction_code ("buy"/"sell"), symbol and month ("YYYY-MM" string) with count (number of trades), amount (summed shares) and total (summed trade value). Sum these across months/symbols for per-account totals.
+        {TIERS}: one document per tier with tier, customer_count, tier_entries and active_entries.
+        {PRODUCTS}: one document per product with product, account_count and total_limit.
+        Only use the raw collections when a question needs individual trades, dates finer than a month, or fields not in the views.
+        The views are refreshed {_staleness(settings)}, so they can miss the newest changes: use the raw collections for questions about the latest or today's activity.
+    """
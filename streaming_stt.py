@@ -0,0 +1,297 @@
+"""Streaming speech-to-text for the /transcribe/stream websocket in TTS.py.
+
+Clients send raw 16-bit mono PCM in binary frames. ``SpeechSegmenter`` runs
+an energy-based voice activity detector over 30 ms frames: speech starts when
+a frame is well above the running noise floor and a segment closes after a
+stretch of silence (or at Whisper's 30 second window). While a segment is
+open its audio so far is transcribed every ``partial_interval_ms`` for
+"partial" frames; closed segments are transcribed in order for "final"
+frames. Final text can also be forwarded to the chatbot's /chat websocket.
+"""
+
+import asyncio
+import json
+import os
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+def streaming_settings():
+    return {
+        "frame_ms": int(os.getenv("STT_FRAME_MS", "30")),
+        # RMS (of samples in [-1, 1]) a frame needs to count as speech, at least
+        "min_threshold": float(os.getenv("STT_VAD_THRESHOLD", "0.01")),
+        # ...and how many times louder than the noise floor it must be
+        "noise_ratio": float(os.getenv("STT_VAD_NOISE_RATIO", "3")),
+        "end_silence_ms": int(os.getenv("STT_END_SILENCE_MS", "600")),
+        "min_speech_ms": int(os.getenv("STT_MIN_SPEECH_MS", "250")),
+        "partial_interval_ms": int(os.getenv("STT_PARTIAL_INTERVAL_MS", "1000")),
+        "chat_url": os.getenv("CHAT_WS_URL", "ws://localhost:8000/chat"),
+    }
+
+
+def pcm16_to_float(data):
+    """16-bit little-endian PCM bytes (an even number of them) to float32 samples."""
+    return np.frombuffer(data, np.int16).astype(np.float32) / 32768.0
+
+
+class Resampler:
+    """Linear resampling of a chunked sample stream to 16 kHz.
+
+    Linear interpolation is enough for speech recognition input. The position
+    of the next output sample and the last input sample carry over between
+    chunks, so chunk boundaries neither drop nor repeat audio.
+    """
+
+    def __init__(self, sample_rate):
+        if sample_rate <= 0:
+            raise ValueError("sample_rate must be positive")
+        # Input samples per output sample
+        self.step = sample_rate / SAMPLE_RATE
+        self._position = 0.0
+        self._tail = np.zeros(0, np.float32)
+
+    def __call__(self, samples):
+        if self.step == 1:
+            return samples
+        data = np.concatenate([self._tail, samples])
+        if len(data) < 2:
+            self._tail = data
+            return np.zeros(0, np.float32)
+        # Output samples that fall between two input samples of this chunk
+        positions = np.arange(self._position, len(data) - 1, self.step)
+        resampled = np.interp(positions, np.arange(len(data)), data)
+        # The next chunk starts interpolating from this chunk's last sample
+        self._position += len(positions) * self.step - (len(data) - 1)
+        self._tail = data[-1:]
+        return resampled.astype(np.float32)
+
+
+class SpeechSegmenter:
+    """Energy-based VAD that splits a sample stream into speech segments."""
+
+    def __init__(
+        self,
+        frame_ms=30,
+        min_threshold=0.01,
+        noise_ratio=3.0,
+        end_silence_ms=600,
+        min_speech_ms=250,
+        max_segment_seconds=30,
+        preroll_ms=200,
+    ):
+        self.frame = SAMPLE_RATE * frame_ms // 1000
+        self.min_threshold = min_threshold
+        self.noise_ratio = noise_ratio
+        self.end_silence_frames = max(end_silence_ms // frame_ms, 1)
+        self.min_speech_frames = max(min_speech_ms // frame_ms, 1)
+        self.max_frames = max_segment_seconds * 1000 // frame_ms
+        self.preroll_frames = preroll_ms // frame_ms
+        self.noise_floor = None
+        self._pending = np.zeros(0, np.float32)
+        self._preroll = []
+        self._segment = []
+        self._speech_frames = 0
+        self._silent_frames = 0
+
+    @property
+    def in_speech(self):
+        return bool(self._segment)
+
+    def current(self):
+        """Audio of the open segment so far."""
+        return np.concatenate(self._segment) if self._segment else None
+
+    def feed(self, samples):
+        """Add samples; returns the segments that closed, oldest first."""
+        self._pending = np.concatenate([self._pending, samples])
+        closed = []
+        while len(self._pending) >= self.frame:
+            frame, self._pending = (
+                self._pending[: self.frame],
+                self._pending[self.frame :],
+            )
+            segment = self._add_frame(frame)
+            if segment is not None:
+                closed.append(segment)
+        return closed
+
+    def flush(self):
+        """Close the open segment (end of stream), if it holds enough speech."""
+        return self._close()
+
+    def _threshold(self):
+        if self.noise_floor is None:
+            return self.min_threshold
+        return max(self.min_threshold, self.noise_floor * self.noise_ratio)
+
+    def _add_frame(self, frame):
+        rms = float(np.sqrt(np.mean(frame**2)))
+        speech = rms >= self._threshold()
+        if not speech:
+            # Track background level only outside speech so voices don't raise it
+            if not self._segment:
+                self.noise_floor = (
+                    rms
+                    if self.noise_floor is None
+                    else 0.95 * self.noise_floor + 0.05 * rms
+                )
+        if not self._segment:
+            if speech:
+                self._segment = self._preroll + [frame]
+                self._preroll = []
+                self._speech_frames = 1
+                self._silent_frames = 0
+            else:
+                self._preroll = (
+                    (self._preroll + [frame])[-self.preroll_frames :]
+                    if self.preroll_frames
+                    else []
+                )
+            return None
+        self._segment.append(frame)
+        if speech:
+            self._speech_frames += 1
+            self._silent_frames = 0
+        else:
+            self._silent_frames += 1
+        if (
+            self._silent_frames >= self.end_silence_frames
+            or len(self._segment) >= self.max_frames
+        ):
+            return self._close()
+        return None
+
+    def _close(self):
+        segment, speech_frames = self._segment, self._speech_frames
+        self._segment = []
+        self._speech_frames = self._silent_frames = 0
+        if not segment or speech_frames < self.min_speech_frames:
+            return None  # a click or a cough, not an utterance
+        return np.concatenate(segment)
+
+
+class StreamingTranscription:
+    """One websocket's stream: segmentation, partial/final frames and chat forwarding."""
+
+    def __init__(self, engine, send_json, sample_rate=SAMPLE_RATE, forward=False):
+        settings = streaming_settings()
+        self.engine = engine
+        self.send_json = send_json
+        self.sample_rate = sample_rate
+        self.resample = Resampler(sample_rate)
+        self._odd_byte = b""
+        self.segmenter = SpeechSegmenter(
+            frame_ms=settings["frame_ms"],
+            min_threshold=settings["min_threshold"],
+            noise_ratio=settings["noise_ratio"],
+            end_silence_ms=settings["end_silence_ms"],
+            min_speech_ms=settings["min_speech_ms"],
+        )
+        self.partial_interval = SAMPLE_RATE * settings["partial_interval_ms"] // 1000
+        self.chat_url = settings["chat_url"] if forward else None
+        self._segment_id = 0
+        self._since_partial = 0
+        self._partial_task = None
+        self._finals = asyncio.Queue()
+        self._finalizer = asyncio.create_task(self._finalize())
+        self._chat = None
+        self._chat_reader = None
+
+    async def feed(self, data):
+        # A sample split across two frames is completed by the next one
+        data = self._odd_byte + data
+        cut = len(data) - len(data) % 2
+        data, self._odd_byte = data[:cut], data[cut:]
+        samples = self.resample(pcm16_to_float(data))
+        for segment in self.segmenter.feed(samples):
+            await self._segment_closed(segment)
+        if self.segmenter.in_speech:
+            self._since_partial += len(samples)
+            self._maybe_partial()
+        else:
+            self._since_partial = 0
+
+    async def finish(self):
+        """End of an utterance stream: close the open segment and wait for all finals."""
+        segment = self.segmenter.flush()
+        if segment is not None:
+            await self._segment_closed(segment)
+        await self._finals.join()
+
+    async def close(self):
+        self._finalizer.cancel()
+        if self._partial_task is not None:
+            self._partial_task.cancel()
+        if self._chat_reader is not None:
+            self._chat_reader.cancel()
+        if self._chat is not None:
+            await self._chat.close()
+
+    async def _segment_closed(self, segment):
+        await self._finals.put((self._segment_id, segment))
+        self._segment_id += 1
+        self._since_partial = 0
+
+    def _maybe_partial(self):
+        if self._since_partial < self.partial_interval:
+            return
+        if self._partial_task is not None and not self._partial_task.done():
+            return  # one partial at a time per stream
+        if self.engine.stats()["queue_depth"] > 0:
+            return  # finals and other clients first
+        self._since_partial = 0
+        self._partial_task = asyncio.create_task(
+            self._partial(self._segment_id, self.segmenter.current())
+        )
+
+    async def _partial(self, segment_id, audio):
+        try:
+            text = await self.engine.transcribe(audio)
+        except Exception as e:
+            print(f"⚠️ Partial transcription failed: {e}")
+            return
+        if segment_id == self._segment_id:  # still the open segment
+            await self.send_json(
+                {"type": "partial", "segment": segment_id, "text": text.strip()}
+            )
+
+    async def _finalize(self):
+        while True:
+            segment_id, audio = await self._finals.get()
+            try:
+                text = (await self.engine.transcribe(audio)).strip()
+                await self.send_json(
+                    {"type": "final", "segment": segment_id, "text": text}
+                )
+                if text and self.chat_url:
+                    await self._forward(text)
+            except Exception as e:
+                await self.send_json(
+                    {"type": "error", "segment": segment_id, "text": str(e)}
+                )
+            finally:
+                self._finals.task_done()
+
+    async def _forward(self, text):
+        """Send final text to /chat as a user message and relay its frames back."""
+        if self._chat is None:
+            import websockets
+
+            self._chat = await websockets.connect(self.chat_url)
+            self._chat_reader = asyncio.create_task(self._relay_chat())
+        await self._chat.send(json.dumps({"message": text, "stream": True}))
+
+    async def _relay_chat(self):
+        async for message in self._chat:
+            try:
+                data = json.loads(message)
+            except ValueError:
+                # /chat reports some failures as plain text, not JSON
+                if isinstance(message, bytes):
+                    message = message.decode(errors="replace")
+                await self.send_json({"type": "chat", "text": message})
+                continue
+            await self.send_json({"type": "chat", "data": data})
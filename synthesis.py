@@ -0,0 +1,260 @@
+"""Text-to-speech for TTS.py: pluggable engines, sentence chunking and an audio cache.
+
+Engines are registered by name with ``register_engine`` and turn one piece
+of text into MP3 bytes. ``synthesize_stream`` splits text into sentences and
+yields each sentence's audio as soon as it is ready, synthesizing the next
+sentence in the background meanwhile. Every sentence is cached in
+``AudioCache`` under a hash of (engine, lang, text), in memory and on disk,
+so repeated greetings, error messages and answers are not synthesized again.
+"""
+
+import asyncio
+import hashlib
+import io
+import os
+import re
+import subprocess
+import threading
+from collections import OrderedDict
+
+ENGINES = {}
+
+
+def register_engine(name):
+    """Decorator registering ``fn(text, lang) -> mp3 bytes`` as a TTS engine."""
+
+    def decorator(fn):
+        ENGINES[name] = fn
+        return fn
+
+    return decorator
+
+
+@register_engine("gtts")
+def gtts_engine(text, lang):
+    from gtts import gTTS
+
+    buffer = io.BytesIO()
+    gTTS(text=text, lang=lang).write_to_fp(buffer)
+    return buffer.getvalue()
+
+
+@register_engine("espeak")
+def espeak_engine(text, lang):
+    """Offline engine: espeak-ng renders WAV, ffmpeg encodes it to MP3 (all through pipes)."""
+    # Text goes in on stdin: as an argument, "-w/path ..." would be read as an option
+    wav = subprocess.run(
+        ["espeak-ng", "-v", lang, "--stdout", "--stdin"],
+        input=text.encode(),
+        capture_output=True,
+        check=True,
+    ).stdout
+    return subprocess.run(
+        ["ffmpeg", "-nostdin", "-i", "pipe:0", "-f", "mp3", "pipe:1"],
+        input=wav,
+        capture_output=True,
+        check=True,
+    ).stdout
+
+
+def synthesis_settings():
+    return {
+        "engine": os.getenv("TTS_ENGINE", "gtts"),
+        "memory_bytes": int(os.getenv("TTS_CACHE_MEMORY_MB", "64")) * 1024 * 1024,
+        # Empty string disables the disk tier
+        "disk_dir": os.getenv("TTS_CACHE_DIR", ".tts_cache"),
+        "disk_bytes": int(os.getenv("TTS_CACHE_DISK_MB", "512")) * 1024 * 1024,
+        "max_sentence_chars": int(os.getenv("TTS_MAX_SENTENCE_CHARS", "300")),
+    }
+
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+|\n+")
+_CLAUSE_END = re.compile(r"(?<=[,;:])\s+")
+_MIN_SENTENCE_CHARS = 20
+
+
+def _split_long(sentence, max_chars):
+    parts = []
+    for clause in _CLAUSE_END.split(sentence):
+        while len(clause) > max_chars:
+            cut = clause.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            parts.append(clause[:cut].strip())
+            clause = clause[cut:].strip()
+        if parts and len(parts[-1]) + len(clause) < max_chars:
+            parts[-1] = f"{parts[-1]} {clause}"
+        elif clause:
+            parts.append(clause)
+    return parts
+
+
+def split_sentences(text, max_chars=300):
+    """Split text into sentence-sized chunks; very short sentences join the next one."""
+    chunks = []
+    pending = ""
+    for sentence in _SENTENCE_END.split(text.strip()):
+        sentence = f"{pending} {sentence}".strip() if pending else sentence.strip()
+        pending = ""
+        if not sentence:
+            continue
+        if len(sentence) < _MIN_SENTENCE_CHARS:
+            pending = sentence
+            continue
+        chunks.extend(_split_long(sentence, max_chars))
+    if pending:
+        chunks.append(pending)
+    return chunks
+
+
+def cache_key(text, lang, engine):
+    return hashlib.sha256(f"{engine}\0{lang}\0{text}".encode()).hexdigest()
+
+
+class AudioCache:
+    """Content-addressed MP3 cache: an in-memory LRU over a disk LRU, both size-bounded."""
+
+    def __init__(
+        self,
+        memory_bytes=64 * 1024 * 1024,
+        disk_dir=".tts_cache",
+        disk_bytes=512 * 1024 * 1024,
+    ):
+        self.memory_bytes = memory_bytes
+        self.disk_dir = disk_dir or None
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        self._disk_used = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.mp3")
+
+    def _remember(self, key, audio):
+        if len(audio) > self.memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_used -= len(self._memory.pop(key))
+        self._memory[key] = audio
+        self._memory_used += len(audio)
+        while self._memory_used > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= len(evicted)
+
+    def _disk_files(self):
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    yield path, os.stat(path)
+                except FileNotFoundError:
+                    pass
+
+    def get(self, key):
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return audio
+        if self.disk_dir:
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    audio = f.read()
+                os.utime(path)  # mtime doubles as the disk tier's LRU clock
+            except FileNotFoundError:
+                audio = None
+        with self._lock:
+            if audio is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, audio)
+            return audio
+
+    def put(self, key, audio):
+        with self._lock:
+            self._remember(key, audio)
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = f"{path}.{threading.get_ident()}.part"
+        with open(temp, "wb") as f:
+            f.write(audio)
+        with self._lock:
+            try:
+                # The same key can be written twice; count only the difference
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(temp, path)
+            if self._disk_used is None:
+                self._disk_used = sum(stat.st_size for _, stat in self._disk_files())
+            else:
+                self._disk_used += len(audio) - replaced
+            if self._disk_used <= self.disk_bytes:
+                return
+            # Over budget: drop least recently used files down to 90% of it
+            files = sorted(self._disk_files(), key=lambda item: item[1].st_mtime)
+            for old_path, stat in files:
+                if self._disk_used <= self.disk_bytes * 0.9:
+                    break
+                try:
+                    os.remove(old_path)
+                    self._disk_used -= stat.st_size
+                except FileNotFoundError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_used,
+                "disk_bytes": self._disk_used,
+            }
+
+
+_settings = synthesis_settings()
+audio_cache = AudioCache(
+    _settings["memory_bytes"], _settings["disk_dir"], _settings["disk_bytes"]
+)
+
+
+def synthesize(text, lang="en", engine=None):
+    """MP3 bytes for one chunk of text, from the cache when possible."""
+    engine = engine or synthesis_settings()["engine"]
+    key = cache_key(text, lang, engine)
+    audio = audio_cache.get(key)
+    if audio is None:
+        audio = ENGINES[engine](text, lang)
+        audio_cache.put(key, audio)
+    return audio
+
+
+async def synthesize_stream(text, lang="en", engine=None):
+    """Yield MP3 audio sentence by sentence; the next sentence is synthesized while one is sent."""
+    engine = engine or synthesis_settings()["engine"]
+    if engine not in ENGINES:
+        raise KeyError(f"Unknown TTS engine '{engine}'")
+    sentences = split_sentences(text, synthesis_settings()["max_sentence_chars"])
+    if not sentences:
+        return
+    upcoming = asyncio.create_task(
+        asyncio.to_thread(synthesize, sentences[0], lang, engine)
+    )
+    try:
+        for i in range(len(sentences)):
+            audio = await upcoming
+            if i + 1 < len(sentences):
+                upcoming = asyncio.create_task(
+                    asyncio.to_thread(synthesize, sentences[i + 1], lang, engine)
+                )
+            yield audio
+    finally:
+        upcoming.cancel()
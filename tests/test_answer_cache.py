@@ -0,0 +1,76 @@
+from chatbot.answer_cache import (
+    AnswerCache,
+    collections_in_code,
+    conversation_key,
+    question_literals,
+)
+
+
+def constant_embedding(text):
+    return [1.0, 0.0]
+
+
+def test_exact_hit_ignores_case_and_punctuation():
+    cache = AnswerCache()
+    cache.put("How many customers are there?", "500", {"customers"})
+    assert cache.get("how many customers are there") == "500"
+    assert cache.hits == 1
+
+
+def test_miss_without_embeddings():
+    cache = AnswerCache()
+    cache.put("How many customers are there?", "500", {"customers"})
+    assert cache.get("How many accounts are there?") is None
+    assert cache.misses == 1
+
+
+def test_similar_question_needs_the_same_literals():
+    cache = AnswerCache(embed_fn=constant_embedding)
+    cache.put("Top 5 gold customers", "A", {"customers"})
+    assert cache.get("Show the top 5 gold customers") == "A"
+    assert cache.get("Top 10 gold customers") is None
+    assert cache.get("Top 5 silver customers") is None
+
+
+def test_answers_are_scoped_to_the_conversation():
+    cache = AnswerCache()
+    context = conversation_key([{"role": "user", "text": "Tell me about gold tier"}])
+    cache.put("What about silver?", "A", {"customers"}, context)
+    assert cache.get("What about silver?") is None
+    assert cache.get("What about silver?", context) == "A"
+
+
+def test_expired_answers_are_dropped():
+    cache = AnswerCache(ttl_seconds=0)
+    cache.put("How many customers are there?", "500", {"customers"})
+    assert cache.get("How many customers are there?") is None
+
+
+def test_invalidate_drops_answers_that_read_the_collection():
+    cache = AnswerCache()
+    cache.put("How many customers?", "500", {"customers"})
+    cache.put("How many accounts?", "1746", {"accounts"})
+    assert cache.invalidate("customers") == 1
+    assert cache.get("How many customers?") is None
+    assert cache.get("How many accounts?") == "1746"
+    assert cache.invalidate() == 1
+
+
+def test_lru_eviction():
+    cache = AnswerCache(max_entries=1)
+    cache.put("first question", "1", {"customers"})
+    cache.put("second question", "2", {"customers"})
+    assert cache.get("first question") is None
+    assert cache.get("second question") == "2"
+
+
+def test_literals_include_categorical_terms():
+    literals = question_literals("top 5 gold customers trading investment stock")
+    assert sorted(literals) == ["5", "gold", "investmentstock"]
+
+
+def test_collections_come_from_the_code():
+    code = "database_results = list(db.transactions.find({'account_id': 1}))"
+    assert collections_in_code(code) == {"transactions"}
+    assert collections_in_code("db.mv_tier_distribution.find()") == {"customers"}
+    assert collections_in_code(None) == {"accounts", "customers", "transactions"}
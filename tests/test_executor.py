@@ -0,0 +1,60 @@
+import asyncio
+
+import mongomock
+import pytest
+
+from chatbot import executor, mongo
+from chatbot.executor import ExecutorPool
+
+# Nothing listens here: workers skip the schema quickly and run Mongo-free code
+UNREACHABLE_MONGO = "mongodb://127.0.0.1:1/?serverSelectionTimeoutMS=100"
+# Blocks the worker's own SIGALRM limit, so only the server-side timeout can stop it
+STUCK = """import signal, time
+signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})
+time.sleep(30)
+"""
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setenv("MONGODB_WARMUP", "0")
+    monkeypatch.setattr(executor, "_GRACE_SECONDS", 0.5)
+    pool = ExecutorPool(workers=1, timeout=1, cpu_seconds=5, memory_mb=0)
+    pool.start(UNREACHABLE_MONGO)
+    yield pool
+    pool.shutdown()
+
+
+def test_inline_run_when_there_are_no_workers(monkeypatch):
+    monkeypatch.setattr(mongo, "_client", mongomock.MongoClient())
+    result = ExecutorPool(workers=0).run("print('hi')\ndatabase_results = 6 * 7")
+    assert result["stderr"] == ""
+    assert result["stdout"] == "hi\n"
+    assert result["database_results"] == 42
+
+
+def test_pool_runs_code(pool):
+    result = pool.run("database_results = sum(range(10))")
+    assert result["has_results"]
+    assert result["database_results"] == 45
+
+
+def test_worker_limit_stops_slow_code_without_a_restart(pool):
+    generation = pool._generation
+    result = pool.run("import time\ntime.sleep(30)")
+    assert result["stderr"] == "Execution exceeded its time limit"
+    assert pool._generation == generation
+
+
+def test_stuck_worker_is_replaced(pool):
+    generation = pool._generation
+    result = pool.run(STUCK)
+    assert result["stderr"] == "Execution exceeded its time limit"
+    assert pool._generation == generation + 1
+    assert pool.run("database_results = 1")["database_results"] == 1
+
+
+def test_crashed_worker_is_replaced(pool):
+    result = asyncio.run(pool.arun("import os\nos._exit(1)"))
+    assert result["stderr"].startswith("Executor worker crashed")
+    assert asyncio.run(pool.arun("database_results = 2"))["database_results"] == 2
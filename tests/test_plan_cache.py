@@ -0,0 +1,50 @@
+from chatbot.plan_cache import PlanCache, extract_literals
+
+GOLD = 'database_results = list(db.customers.find({"tier_and_details.tier": "Gold"}))'
+LARGE = "database_results = list(db.transactions.find({'amount': {'$gt': 5000}}))"
+
+
+def test_shape_replaces_literals():
+    shape, literals = extract_literals("Top 5 Gold customers")
+    assert shape == "top __num__ __tier__ customers"
+    assert literals == [("num", "5"), ("tier", "gold")]
+
+
+def test_same_shape_reuses_code_with_new_literals():
+    cache = PlanCache()
+    assert cache.store("List gold customers", GOLD)
+    assert cache.lookup("List platinum customers") == GOLD.replace("Gold", "Platinum")
+
+
+def test_numbers_in_filters_are_templated():
+    cache = PlanCache()
+    assert cache.store("Transactions above 5000", LARGE)
+    assert cache.lookup("Transactions above 750") == LARGE.replace("5000", "750")
+
+
+def test_unknown_shape_misses():
+    cache = PlanCache()
+    cache.store("List gold customers", GOLD)
+    assert cache.lookup("How many gold customers are there?") is None
+
+
+def test_code_with_constants_not_in_question_is_not_stored():
+    cache = PlanCache()
+    # "Gold" is not in the question, so the program can't be reused for others
+    assert not cache.store("List customers", GOLD)
+    assert cache.lookup("List customers") is None
+
+
+def test_discard_forgets_the_shape():
+    cache = PlanCache()
+    cache.store("List gold customers", GOLD)
+    cache.discard("List silver customers")
+    assert cache.lookup("List gold customers") is None
+
+
+def test_lru_eviction():
+    cache = PlanCache(max_entries=1)
+    cache.store("List gold customers", GOLD)
+    cache.store("Transactions above 5000", LARGE)
+    assert cache.lookup("List gold customers") is None
+    assert cache.lookup("Transactions above 100") is not None
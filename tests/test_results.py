@@ -0,0 +1,107 @@
+import json
+
+import mongomock
+
+from chatbot import mongo
+from chatbot.executor import ExecutorPool
+from chatbot.results import (
+    ResultStore,
+    bound_results,
+    cap_text,
+    is_digest,
+    result_store,
+    summarize_results,
+)
+
+ROWS = [
+    {"name": f"user{i}", "tier": "Gold" if i % 2 else "Silver", "amount": i}
+    for i in range(120)
+]
+
+
+def test_small_results_pass_through():
+    value, rows = bound_results([{"a": 1}])
+    assert value == [{"a": 1}]
+    assert rows is None
+
+
+def test_long_list_becomes_a_digest():
+    digest, rows = bound_results(ROWS)
+    assert is_digest(digest)
+    assert digest["row_count"] == 120
+    assert digest["truncated"] is True
+    assert digest["rows"] == ROWS[:50]
+    assert rows == ROWS
+    assert digest["fields"]["amount"] == {
+        "count": 120,
+        "min": 0,
+        "max": 119,
+        "sum": 7140,
+        "mean": 59.5,
+    }
+    assert dict(digest["fields"]["tier"]["top"]) == {"Gold": 60, "Silver": 60}
+
+
+def test_cursors_are_always_digested():
+    digest, rows = bound_results(iter(ROWS[:3]))
+    assert digest["row_count"] == 3
+    assert digest["truncated"] is False
+    assert rows == ROWS[:3]
+
+
+def test_byte_cap_limits_the_sample(monkeypatch):
+    monkeypatch.setenv("RESULTS_MAX_BYTES", "200")
+    digest = summarize_results(ROWS)
+    assert len(json.dumps(digest["rows"])) <= 200
+    assert digest["row_count"] == 120
+
+
+def test_oversized_document_becomes_a_preview(monkeypatch):
+    monkeypatch.setenv("RESULTS_MAX_BYTES", "100")
+    digest, rows = bound_results({"text": "x" * 500})
+    assert rows is None
+    assert digest["digest"] is True
+    assert digest["row_count"] == 1
+    assert digest["truncated"] is True
+    assert len(digest["preview"]) == 100
+    assert digest["total_bytes"] > 500
+
+
+def test_scalar_values_pass_through():
+    assert bound_results(42) == (42, None)
+
+
+def test_cap_text():
+    assert cap_text("short", 10) == "short"
+    assert cap_text("x" * 20, 10).startswith("x" * 10 + "\n... [output truncated")
+
+
+def test_store_pages_and_evicts():
+    store = ResultStore(max_entries=1)
+    first = store.put(ROWS)
+    page = store.page(first, offset=100, limit=50)
+    assert page["row_count"] == 120
+    assert page["rows"] == ROWS[100:]
+    second = store.put(ROWS[:1])
+    assert store.page(first) is None
+    assert store.page(second)["rows"] == ROWS[:1]
+
+
+def test_store_expires_results():
+    store = ResultStore(ttl_seconds=-1)
+    handle = store.put(ROWS)
+    assert store.page(handle) is None
+    assert store.total_bytes == 0
+
+
+def test_generated_code_gets_a_digest_and_a_handle(monkeypatch):
+    client = mongomock.MongoClient()
+    client[mongo.DATABASE_NAME].customers.insert_many([dict(row) for row in ROWS])
+    monkeypatch.setattr(mongo, "_client", client)
+    result = ExecutorPool(workers=0).run(
+        "database_results = db.customers.find({}, {'_id': 0})"
+    )
+    digest = result["database_results"]
+    assert digest["row_count"] == 120
+    assert len(digest["rows"]) == 50
+    assert result_store.page(digest["handle"], offset=110)["rows"] == ROWS[110:]
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from chatbot.scheduler import QueueFull, TurnScheduler
+
+LIMITS = {"llm": 1, "executor": 1, "mongo": 1}
+
+
+def run(test):
+    """Run a test coroutine with a fresh scheduler, stopping it afterwards."""
+
+    async def main():
+        scheduler = TurnScheduler(
+            max_concurrent_turns=2, max_queue_per_session=2, stage_limits=LIMITS
+        )
+        try:
+            await test(scheduler)
+        finally:
+            await scheduler.stop()
+
+    asyncio.run(main())
+
+
+def blocking_turn(started, release):
+    async def job():
+        started.set()
+        await release.wait()
+
+    return job
+
+
+def test_turns_of_one_session_run_in_order():
+    async def test(scheduler):
+        order = []
+
+        def job(n):
+            async def turn():
+                await asyncio.sleep(0.01 * (3 - n))
+                order.append(n)
+
+            return turn
+
+        futures = [await scheduler.submit("a", job(n)) for n in range(2)]
+        await asyncio.gather(*futures)
+        assert order == [0, 1]
+
+    run(test)
+
+
+def test_full_session_queue_is_rejected():
+    async def test(scheduler):
+        started, release = asyncio.Event(), asyncio.Event()
+        await scheduler.submit("a", blocking_turn(started, release))
+        await started.wait()
+        await scheduler.submit("a", blocking_turn(asyncio.Event(), release))
+        await scheduler.submit("a", blocking_turn(asyncio.Event(), release))
+        with pytest.raises(QueueFull):
+            await scheduler.submit("a", blocking_turn(asyncio.Event(), release))
+        release.set()
+
+    run(test)
+
+
+def test_drop_session_cancels_running_and_queued_turns():
+    async def test(scheduler):
+        started, release = asyncio.Event(), asyncio.Event()
+        scheduler.attach("a")
+        running = await scheduler.submit("a", blocking_turn(started, release))
+        queued = await scheduler.submit("a", blocking_turn(asyncio.Event(), release))
+        await started.wait()
+        scheduler.drop_session("a")
+        await asyncio.sleep(0)
+        assert queued.cancelled()
+        with pytest.raises(asyncio.CancelledError):
+            await running
+        assert scheduler.stats()["queued"] == 0
+
+    run(test)
+
+
+def test_resumed_session_keeps_its_turns_when_the_old_socket_closes():
+    async def test(scheduler):
+        started, release = asyncio.Event(), asyncio.Event()
+        scheduler.attach("a")
+        running = await scheduler.submit("a", blocking_turn(started, release))
+        await started.wait()
+        scheduler.attach("a")  # the client reconnects on a new socket
+        scheduler.drop_session("a")  # then the old one closes
+        release.set()
+        await running
+        assert not running.cancelled()
+        scheduler.drop_session("a")
+        assert scheduler.queue_depth("a") == 0
+
+    run(test)
+
+
+def test_stage_limits_concurrency():
+    async def test(scheduler):
+        active = peak = 0
+
+        async def use_llm():
+            nonlocal active, peak
+            async with scheduler.stage("llm"):
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.01)
+                active -= 1
+
+        await asyncio.gather(*(use_llm() for _ in range(4)))
+        assert peak == 1
+
+    run(test)
+
+
+def test_executor_stage_is_capped_at_the_worker_count(monkeypatch):
+    monkeypatch.setenv("EXECUTOR_CONCURRENCY", "8")
+    monkeypatch.setenv("EXECUTOR_WORKERS", "2")
+    assert TurnScheduler().stage_limits["executor"] == 2
+    monkeypatch.setenv("EXECUTOR_WORKERS", "0")
+    assert TurnScheduler().stage_limits["executor"] == 8
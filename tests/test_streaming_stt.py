@@ -0,0 +1,147 @@
+import asyncio
+import json
+import os
+
+import numpy as np
+import pytest
+
+# Load Whisper only on first use: these tests never transcribe for real
+os.environ.setdefault("WHISPER_WARMUP", "lazy")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import TTS  # noqa: E402
+from streaming_stt import (  # noqa: E402
+    SAMPLE_RATE,
+    Resampler,
+    StreamingTranscription,
+    pcm16_to_float,
+)
+
+
+class FakeEngine:
+    def __init__(self):
+        self.calls = 0
+
+    async def transcribe(self, audio):
+        self.calls += 1
+        return " hello "
+
+    def stats(self):
+        return {"queue_depth": 0}
+
+
+class FakeChat:
+    """Stands in for the /chat websocket connection."""
+
+    def __init__(self, messages):
+        self.messages = messages
+
+    async def __aiter__(self):
+        for message in self.messages:
+            yield message
+
+    async def close(self):
+        pass
+
+
+def tone(seconds, rate, amplitude=0.5):
+    t = np.arange(int(seconds * rate)) / rate
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def pcm(samples):
+    return (samples * 32767).astype("<i2").tobytes()
+
+
+def test_pcm16_to_float():
+    samples = pcm16_to_float(np.array([0, 16384, -32768], "<i2").tobytes())
+    assert samples.tolist() == [0.0, 0.5, -1.0]
+
+
+def test_resampler_rejects_bad_rates():
+    with pytest.raises(ValueError):
+        Resampler(0)
+
+
+@pytest.mark.parametrize("rate", [8000, 22050, 44100, 48000])
+def test_chunked_resampling_matches_the_whole_signal(rate):
+    signal = tone(1, rate)
+    resampler = Resampler(rate)
+    chunks = [resampler(signal[i : i + 317]) for i in range(0, len(signal), 317)]
+    resampled = np.concatenate(chunks)
+    # No samples dropped at chunk boundaries: only output past the last input
+    # sample, which the next chunk would interpolate, is still pending
+    assert 0 <= SAMPLE_RATE - len(resampled) <= SAMPLE_RATE / rate
+    positions = np.arange(len(resampled)) * rate / SAMPLE_RATE
+    expected = np.interp(positions, np.arange(len(signal)), signal)
+    assert np.abs(resampled - expected).max() < 1e-5
+
+
+def test_16khz_passes_through():
+    samples = tone(0.1, SAMPLE_RATE)
+    assert Resampler(SAMPLE_RATE)(samples) is samples
+
+
+def test_speech_becomes_a_final_frame(monkeypatch):
+    monkeypatch.setenv("STT_END_SILENCE_MS", "300")
+    sent = []
+
+    async def send_json(frame):
+        sent.append(frame)
+
+    async def main():
+        stream = StreamingTranscription(FakeEngine(), send_json, sample_rate=8000)
+        audio = pcm(np.concatenate([np.zeros(4000, np.float32), tone(1, 8000)]))
+        audio += pcm(np.zeros(8000, np.float32))
+        # Odd-sized frames split samples between frames
+        for i in range(0, len(audio), 333):
+            await stream.feed(audio[i : i + 333])
+        await stream.finish()
+        await stream.close()
+
+    asyncio.run(main())
+    assert {"type": "final", "segment": 0, "text": "hello"} in sent
+
+
+def test_plain_text_chat_replies_are_relayed():
+    sent = []
+
+    async def send_json(frame):
+        sent.append(frame)
+
+    async def main():
+        stream = StreamingTranscription(FakeEngine(), send_json)
+        stream._chat = FakeChat(
+            [json.dumps({"type": "token", "text": "Hi"}), "Error: the server is busy"]
+        )
+        await stream._relay_chat()
+        await stream.close()
+
+    asyncio.run(main())
+    assert sent == [
+        {"type": "chat", "data": {"type": "token", "text": "Hi"}},
+        {"type": "chat", "text": "Error: the server is busy"},
+    ]
+
+
+@pytest.fixture
+def client():
+    with TestClient(TTS.app) as client:
+        yield client
+
+
+@pytest.mark.parametrize("rate", [0, -8000, 10**6])
+def test_bad_sample_rate_gets_an_error_frame(client, rate):
+    with client.websocket_connect(f"/transcribe/stream?sample_rate={rate}") as ws:
+        assert ws.receive_json()["type"] == "error"
+
+
+def test_text_frames_must_be_json_objects(client):
+    with client.websocket_connect("/transcribe/stream") as ws:
+        ws.send_text("not json")
+        assert ws.receive_json()["type"] == "error"
+        ws.send_text("[1]")
+        assert ws.receive_json()["type"] == "error"
+        ws.send_text(json.dumps({"type": "end"}))
+        assert ws.receive_json() == {"type": "end"}
@@ -0,0 +1,348 @@
+"""Whisper transcription engine used by TTS.py.
+
+Each worker process loads the Whisper model once. Audio is passed as bytes
+and decoded through an ffmpeg pipe, never written to disk. Requests are queued and a
+dispatcher hands them to idle workers in micro-batches: clips of up to 30
+seconds in a batch are decoded together in one ``whisper.decode`` call, and
+longer clips go through ``model.transcribe`` one by one. With
+``WHISPER_WORKERS=0`` the model is loaded in the server process and runs on
+a thread, so the event loop is still never blocked.
+
+``WHISPER_WARMUP`` decides when the model is loaded: ``background`` (the
+default) starts loading at startup without holding it up, ``blocking`` waits
+for it before the server takes requests and ``lazy`` loads it on the first
+transcription. Clips that arrive while the model loads wait in the queue.
+A background load that fails is retried with backoff, so the engine becomes
+ready once e.g. the model download works again. If a worker dies, the pool is
+replaced the same way and the engine reports not ready until it has reloaded.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Whisper's fixed window; shorter clips are padded to it and can share a batch.
+SAMPLE_RATE = 16000
+CHUNK_SECONDS = 30
+
+# Backoff between background attempts to load a model that failed to load
+RETRY_SECONDS = 5
+MAX_RETRY_SECONDS = 300
+
+_model = None
+
+
+class AudioDecodeError(ValueError):
+    """The uploaded bytes are not audio ffmpeg can read."""
+
+
+def transcriber_settings():
+    workers = int(os.getenv("WHISPER_WORKERS", "1"))
+    return {
+        "model": os.getenv("WHISPER_MODEL", "small"),
+        "workers": workers,
+        "warmup": os.getenv("WHISPER_WARMUP", "background").lower(),
+        "batch_size": int(os.getenv("WHISPER_BATCH_SIZE", "4")),
+        # How long the dispatcher waits for more clips to join a batch
+        "batch_window_ms": float(os.getenv("WHISPER_BATCH_WINDOW_MS", "50")),
+        "threads": int(
+            os.getenv(
+                "WHISPER_THREADS",
+                str(max(1, (os.cpu_count() or 1) // max(workers, 1))),
+            )
+        ),
+    }
+
+
+def _init_worker(model_name, threads):
+    """Pool initializer: load the model once per worker."""
+    global _model
+    import torch
+    import whisper
+
+    torch.set_num_threads(threads)
+    _model = whisper.load_model(model_name)
+
+
+def _ping():
+    return os.getpid()
+
+
+def decode_audio(data):
+    """Decode encoded audio bytes (wav, webm, mp3, ...) to 16 kHz mono float32.
+
+    ffmpeg reads from stdin and writes raw PCM to stdout, so nothing touches
+    the disk. A float32 NumPy array is returned unchanged.
+    """
+    import numpy as np
+
+    if isinstance(data, np.ndarray):
+        return data.astype(np.float32, copy=False)
+    process = subprocess.run(
+        [
+            "ffmpeg", "-nostdin", "-threads", "0", "-i", "pipe:0",
+            "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le",
+            "-ar", str(SAMPLE_RATE), "pipe:1",
+        ],
+        input=data,
+        capture_output=True,
+    )
+    if process.returncode != 0:
+        detail = process.stderr.decode(errors="ignore")[-300:]
+        raise AudioDecodeError(f"Failed to decode audio: {detail}")
+    return np.frombuffer(process.stdout, np.int16).astype(np.float32) / 32768.0
+
+
+def _transcribe_batch(clips):
+    """Transcribe several clips (audio bytes or float32 arrays); one text or exception each."""
+    import torch
+    import whisper
+
+    texts = [None] * len(clips)
+    short = []
+    for i, clip in enumerate(clips):
+        try:
+            audio = decode_audio(clip)
+        except Exception as e:
+            texts[i] = e
+            continue
+        if len(audio) <= CHUNK_SECONDS * SAMPLE_RATE:
+            short.append((i, audio))
+        else:
+            texts[i] = _model.transcribe(audio)["text"]
+
+    if short:
+        mel = torch.stack(
+            [
+                whisper.log_mel_spectrogram(
+                    whisper.pad_or_trim(audio), _model.dims.n_mels
+                )
+                for _, audio in short
+            ]
+        ).to(_model.device)
+        options = whisper.DecodingOptions(fp16=torch.cuda.is_available())
+        for (i, _), result in zip(short, whisper.decode(_model, mel, options)):
+            texts[i] = result.text
+    return texts
+
+
+class TranscriptionEngine:
+    """Queue of transcription requests served in micro-batches by a worker pool."""
+
+    def __init__(self, model="small", workers=1, batch_size=4, batch_window_ms=50, threads=1,
+                 warmup="background"):
+        self.model = model
+        self.workers = workers
+        self.batch_size = max(batch_size, 1)
+        self.batch_window = batch_window_ms / 1000
+        self.threads = threads
+        self.warmup = warmup
+        self.state = "cold"
+        self.load_seconds = None
+        self.error = None
+        self._loading = None
+        self._warming = None
+        self._pool = None
+        self._queue = None
+        self._slots = None
+        self._dispatcher = None
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._batches = 0
+        self._batched = 0
+        self._total_latency = 0.0
+
+    @classmethod
+    def from_env(cls):
+        return cls(**transcriber_settings())
+
+    async def start(self):
+        """Start the dispatcher and load the model as ``warmup`` says."""
+        if self._dispatcher is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(max(self.workers, 1))
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        if self.warmup == "blocking":
+            await self._ensure_loaded()
+        elif self.warmup != "lazy":
+            self.state = "loading"
+            self._warming = asyncio.create_task(self._keep_loading())
+
+    def _load_task(self):
+        if self._loading is None:
+            self.state = "loading"
+            self._loading = asyncio.create_task(self._load())
+        return self._loading
+
+    async def _ensure_loaded(self):
+        """Wait for the model, starting to load it if nobody has yet."""
+        loading = self._load_task()
+        try:
+            await asyncio.shield(loading)
+        except Exception:
+            if self._loading is loading:
+                # Let the next request try again
+                self._loading = None
+            raise
+
+    async def _keep_loading(self):
+        """Load the model in the background, retrying with backoff until it loads."""
+        delay = RETRY_SECONDS
+        while True:
+            try:
+                await self._ensure_loaded()
+                return
+            except Exception:
+                print(f"⚠️ Retrying Whisper '{self.model}' load in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_SECONDS)
+
+    async def _load(self):
+        """Start the workers and wait until each has loaded the model."""
+        started = time.perf_counter()
+        try:
+            if self.workers > 0:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.model, self.threads),
+                )
+                warmups = [self._pool.submit(_ping) for _ in range(self.workers)]
+                await asyncio.gather(*[asyncio.wrap_future(f) for f in warmups])
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=1)
+                await asyncio.wrap_future(
+                    self._pool.submit(_init_worker, self.model, self.threads)
+                )
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            print(f"⚠️ Whisper '{self.model}' failed to load: {e}")
+            raise
+        self.state = "ready"
+        self.error = None
+        self.load_seconds = round(time.perf_counter() - started, 2)
+        print(
+            f"✅ Whisper '{self.model}' ready on {max(self.workers, 1)} worker(s) "
+            f"in {self.load_seconds}s"
+        )
+
+    async def stop(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        if self._warming is not None:
+            self._warming.cancel()
+            self._warming = None
+        if self._loading is not None:
+            self._loading.cancel()
+            self._loading = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _restart(self, pool):
+        """Replace ``pool`` after one of its workers died; a no-op if it already was."""
+        if pool is None or pool is not self._pool:
+            return
+        print(f"⚠️ A Whisper worker died, restarting the '{self.model}' pool")
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.kill()
+        pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+        self._loading = None
+        self.state = "restarting"
+        if self._warming is None or self._warming.done():
+            self._warming = asyncio.create_task(self._keep_loading())
+
+    def readiness(self):
+        """Model state for readiness checks; a lazy engine doesn't hold up readiness."""
+        return {
+            "state": self.state,
+            "ready": self.state == "ready" or (self.warmup == "lazy" and self.state == "cold"),
+            "model": self.model,
+            "warmup": self.warmup,
+            "load_seconds": self.load_seconds,
+            "error": self.error,
+        }
+
+    async def transcribe(self, audio):
+        """Queue audio (encoded bytes or 16 kHz float32 samples) and wait for its text."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((audio, future, time.perf_counter()))
+        return await future
+
+    async def _dispatch(self):
+        while True:
+            # Wait for an idle worker first: while all are busy, clips pile up
+            # in the queue and the next batch is taken from them at once
+            await self._slots.acquire()
+            batch = [await self._queue.get()]
+            deadline = time.perf_counter() + self.batch_window
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0 and self._queue.empty():
+                    break
+                try:
+                    batch.append(
+                        await asyncio.wait_for(self._queue.get(), max(remaining, 0))
+                    )
+                except asyncio.TimeoutError:
+                    break
+            asyncio.create_task(self._run_batch(batch))
+
+    async def _run_batch(self, batch):
+        self._in_flight += len(batch)
+        self._batches += 1
+        self._batched += len(batch)
+        pool = None
+        try:
+            await self._ensure_loaded()
+            pool = self._pool
+            texts = await asyncio.wrap_future(
+                pool.submit(_transcribe_batch, [audio for audio, _, _ in batch])
+            )
+        except BrokenProcessPool as e:
+            # This batch fails; later clips wait for the replacement workers
+            self._restart(pool)
+            texts = [e] * len(batch)
+        except Exception as e:
+            texts = [e] * len(batch)
+        finally:
+            self._in_flight -= len(batch)
+            self._slots.release()
+        now = time.perf_counter()
+        for (_, future, queued_at), text in zip(batch, texts):
+            self._total_latency += now - queued_at
+            if isinstance(text, Exception):
+                self._failed += 1
+                if not future.done():
+                    future.set_exception(text)
+            else:
+                self._completed += 1
+                if not future.done():
+                    future.set_result(text)
+
+    def stats(self):
+        finished = self._completed + self._failed
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": self._in_flight,
+            "workers": max(self.workers, 1),
+            "state": self.state,
+            "completed": self._completed,
+            "failed": self._failed,
+            "batches": self._batches,
+            "avg_batch_size": round(self._batched / self._batches, 2) if self._batches else None,
+            "avg_latency_ms": round(self._total_latency * 1000 / finished, 1) if finished else None,
+        }